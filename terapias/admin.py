@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Evento, Profissional, Clinica, Rotina, RotinaItem
+from .models import Evento, Profissional, Clinica, Rotina, RotinaItem, TarefaRotina
 
 # Register your models here.
 admin.site.register(Evento)
@@ -7,3 +7,4 @@ admin.site.register(Profissional)
 admin.site.register(Clinica)
 admin.site.register(Rotina)
 admin.site.register(RotinaItem)
+admin.site.register(TarefaRotina)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TerapiasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'terapias'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (conecta os receivers do ResumoMensal)
@@ -0,0 +1,248 @@
+# terapias/benchmarks.py
+"""
+Suíte de benchmarks dos caminhos quentes, sobre o dataset sintético
+(terapias.sintetico / manage.py gerar_dados_sinteticos).
+
+Cada benchmark tem um `preparar` (fora da medição) e um `executar` (medido),
+rodados juntos numa transação desfeita no fim: nada do que é medido fica
+gravado, e toda repetição parte do mesmo estado. Para cada um se registra:
+
+- tempo_ms / mediana_ms: melhor e mediana das repetições (depois de uma de aquecimento);
+- consultas e sql_ms: número de queries e tempo gasto nelas (execute_wrapper);
+- pico_kib: pico de memória alocada numa execução à parte com tracemalloc.
+
+O alvo é um usuário sintético (o de índice 0, por padrão) e a primeira
+criança dele; as semanas "leve" e "pesada" são a de menos e a de mais
+eventos no histórico dessa criança.
+
+Os resultados vão para JSON; comparar() aponta regressões contra uma
+linha de base gravada.
+"""
+import gc
+import statistics
+import time as _time
+import tracemalloc
+from datetime import date, time, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncWeek
+from django.template.loader import render_to_string
+from django.test import Client, RequestFactory
+from django.test.utils import override_settings
+
+from usuario.models import Crianca
+
+from .models import Evento, Rotina, RotinaItem
+from .services import expandir_rotina_item, sincronizar_eventos_do_item
+from .sintetico import PREFIXO_USUARIO, nome_de_usuario
+from .variaveis_categoricas import TIPOS_PERIODICIDADE
+from .views import RotinaItemModalView, _grade_ctx
+
+TOLERANCIA_PADRAO = 0.20  # 20% a mais de tempo/memória conta como regressão
+
+
+class Benchmark(NamedTuple):
+    nome: str
+    preparar: Callable[[], object]
+    executar: Callable[[object], object]
+
+
+class _Contador:
+    """execute_wrapper que conta as queries e soma o tempo delas."""
+
+    def __init__(self):
+        self.consultas = 0
+        self.segundos = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = _time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.segundos += _time.perf_counter() - t0
+            self.consultas += 1
+
+
+class Alvo(NamedTuple):
+    usuario: User
+    crianca: Crianca
+    rotina: Rotina
+    semana_leve: date
+    semana_pesada: date
+
+
+def escolher_alvo(indice: int = 0, prefixo: str = PREFIXO_USUARIO) -> Alvo:
+    """Usuário sintético `indice`, a primeira criança dele e as semanas de menos/mais eventos."""
+    usuario = User.objects.filter(username=nome_de_usuario(indice, prefixo)).first()
+    crianca = usuario and Crianca.objects.filter(responsavel=usuario).order_by("pk").first()
+    rotina = crianca and Rotina.objects.filter(crianca=crianca).order_by("pk").first()
+    if rotina is None:
+        raise LookupError(f"Sem dados sintéticos para {nome_de_usuario(indice, prefixo)!r}: "
+                          f"rode manage.py gerar_dados_sinteticos antes.")
+    semanas = list(Evento.objects.filter(crianca=crianca)
+                   .annotate(semana=TruncWeek("data_evento")).values("semana")
+                   .annotate(n=Count("pk")).order_by("n", "semana").values_list("semana", flat=True))
+    return Alvo(usuario, crianca, rotina, semanas[0], semanas[-1])
+
+
+def montar_benchmarks(alvo: Alvo) -> List[Benchmark]:
+    bench = []
+
+    # ---- serviços de rotina ----
+    for periodicidade, _ in TIPOS_PERIODICIDADE:
+        def novo_item(per=periodicidade):
+            return RotinaItem.objects.create(
+                rotina=alvo.rotina, nome_evento=f"Bench {per}", periodicidade=per, dias_semana="quarta",
+                hora_inicio=time(19), hora_fim=time(19, 50), criado_por=alvo.usuario,
+            )
+        bench.append(Benchmark(f"expandir_rotina_item[{periodicidade}]", novo_item, expandir_rotina_item))
+
+    def item_editado():
+        item = (RotinaItem.objects.select_related("rotina").filter(rotina=alvo.rotina)
+                .annotate(n=Count("eventos_gerados")).order_by("-n", "pk").first())
+        item.hora_inicio = time((item.hora_inicio.hour + 1) % 24 if item.hora_inicio else 9)
+        item.save()
+        return item
+    bench.append(Benchmark("sincronizar_eventos_do_item", item_editado, sincronizar_eventos_do_item))
+
+    # ---- views ----
+    def cliente(limpar_cache: bool = True):
+        def preparar():
+            if limpar_cache:
+                cache.clear()
+            c = Client()
+            c.force_login(alvo.usuario)
+            return c
+        return preparar
+
+    def get(url):
+        def executar(c):
+            r = c.get(url)
+            assert r.status_code == 200, f"{url}: HTTP {r.status_code}"
+            return r
+        return executar
+
+    agenda = f"/?crianca={alvo.crianca.pk}&d="
+    bench += [
+        Benchmark("agenda_index[semana_leve]", cliente(), get(f"{agenda}{alvo.semana_leve:%Y-%m-%d}")),
+        Benchmark("agenda_index[semana_pesada]", cliente(), get(f"{agenda}{alvo.semana_pesada:%Y-%m-%d}")),
+        Benchmark("agenda_index[semana_pesada,cache]", cliente(limpar_cache=False),
+                  get(f"{agenda}{alvo.semana_pesada:%Y-%m-%d}")),
+    ]
+
+    def grade_da_rotina(_):
+        # o mesmo que RotinaItemModalView.post devolve depois de gravar os itens
+        request = RequestFactory().post(f"/rotinas/{alvo.rotina.pk}/novo-item/")
+        request.user = alvo.usuario
+        return render_to_string(RotinaItemModalView.grade_tpl,
+                                {"rotina": alvo.rotina, **_grade_ctx(alvo.rotina), "oob": True}, request=request)
+    bench.append(Benchmark("rotina_grade[modal]", lambda: None, grade_da_rotina))
+
+    bench += [
+        Benchmark("busca[clinicas]", cliente(), get("/clinicas/?q=a")),
+        Benchmark("busca[profissionais]", cliente(), get("/profissionais/?q=a")),
+        Benchmark("busca[criancas]", cliente(), get("/usuarios/criancas/?q=a")),
+    ]
+    return bench
+
+
+def _rodar_desfazendo(b: Benchmark, contador: Optional[_Contador] = None) -> float:
+    """Prepara e executa numa transação desfeita; devolve o tempo de `executar`."""
+    with transaction.atomic():
+        args = b.preparar()
+        if contador is None:
+            t0 = _time.perf_counter()
+            b.executar(args)
+            dt = _time.perf_counter() - t0
+        else:
+            with connection.execute_wrapper(contador):
+                t0 = _time.perf_counter()
+                b.executar(args)
+                dt = _time.perf_counter() - t0
+        transaction.set_rollback(True)
+    return dt
+
+
+def medir(b: Benchmark, repeticoes: int) -> dict:
+    _rodar_desfazendo(b)  # aquece (conexão, templates, caches de queries)
+    tempos, consultas, sql = [], [], []
+    for _ in range(repeticoes):
+        contador = _Contador()
+        tempos.append(_rodar_desfazendo(b, contador))
+        consultas.append(contador.consultas)
+        sql.append(contador.segundos)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        with transaction.atomic():
+            args = b.preparar()
+            tracemalloc.reset_peak()  # só o que `executar` aloca
+            b.executar(args)
+            pico = tracemalloc.get_traced_memory()[1]
+            transaction.set_rollback(True)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "tempo_ms": round(min(tempos) * 1000, 3),
+        "mediana_ms": round(statistics.median(tempos) * 1000, 3),
+        "consultas": max(consultas),
+        "sql_ms": round(statistics.median(sql) * 1000, 3),
+        "pico_kib": round(pico / 1024, 1),
+    }
+
+
+def rodar(alvo: Alvo, *, repeticoes: int = 5, filtro: Optional[List[str]] = None,
+          relatar: Callable[[str, dict], None] = lambda nome, r: None) -> dict:
+    """Roda a suíte (ou só os benchmarks cujo nome contém algum termo de `filtro`)."""
+    resultados = {}
+    hosts = [*settings.ALLOWED_HOSTS, "testserver"]  # o host do django.test.Client
+    # sem a instrumentação por request: mediria a si mesma e poluiria o log
+    with override_settings(ALLOWED_HOSTS=hosts, INSTRUMENTACAO_AMOSTRAGEM=0):
+        for b in montar_benchmarks(alvo):
+            if filtro and not any(f in b.nome for f in filtro):
+                continue
+            resultados[b.nome] = medir(b, repeticoes)
+            relatar(b.nome, resultados[b.nome])
+
+    return {
+        "meta": {
+            "banco": connection.vendor,
+            "data": date.today().isoformat(),
+            "repeticoes": repeticoes,
+            "usuario": alvo.usuario.username,
+            "eventos_da_crianca": Evento.objects.filter(crianca=alvo.crianca).count(),
+            "eventos_total": Evento.objects.count(),
+            "semanas": [alvo.semana_leve.isoformat(), alvo.semana_pesada.isoformat()],
+        },
+        "resultados": resultados,
+    }
+
+
+def comparar(atual: dict, base: dict, tolerancia: float = TOLERANCIA_PADRAO) -> Dict[str, List[str]]:
+    """
+    {benchmark: [motivos]} dos que regrediram em relação à linha de base:
+    tempo ou pico de memória acima de (1 + tolerancia) vezes o da base, ou
+    qualquer query a mais.
+    """
+    regressoes = {}
+    for nome, r in atual["resultados"].items():
+        b = base.get("resultados", {}).get(nome)
+        if b is None:
+            continue
+        motivos = []
+        if r["tempo_ms"] > b["tempo_ms"] * (1 + tolerancia):
+            motivos.append(f"tempo {b['tempo_ms']:.1f} -> {r['tempo_ms']:.1f} ms")
+        if r["consultas"] > b["consultas"]:
+            motivos.append(f"consultas {b['consultas']} -> {r['consultas']}")
+        if r["pico_kib"] > b["pico_kib"] * (1 + tolerancia):
+            motivos.append(f"memória {b['pico_kib']:.0f} -> {r['pico_kib']:.0f} KiB")
+        if motivos:
+            regressoes[nome] = motivos
+    return regressoes
@@ -0,0 +1,123 @@
+# terapias/cache_agenda.py
+"""
+Cache dos fragmentos renderizados da agenda (grade da semana, cards do mês,
+lateral), com chave (fragmento, criança, partes, versão da agenda).
+
+A versão mora no banco (VersaoAgenda) e não no cache: com locmem cada
+processo tem o seu cache, e uma escrita num worker precisa invalidar os
+outros. Em vez de apagar chaves, quem escreve só incrementa a versão
+(tocar_agendas); as entradas antigas deixam de ser lidas e expiram sozinhas.
+
+Funciona com qualquer backend do Django (locmem, arquivo, memcached...).
+Configuração: AGENDA_CACHE (alias em CACHES, padrão "default") e
+AGENDA_CACHE_TIMEOUT (segundos).
+"""
+from typing import Callable, Iterable
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+
+from .models import VersaoAgenda
+
+PREFIXO = "agenda"
+FRAGMENTOS = ("grade", "indicadores", "lateral")
+
+
+def _cache():
+    return caches[getattr(settings, "AGENDA_CACHE", "default")]
+
+
+def _timeout():
+    return getattr(settings, "AGENDA_CACHE_TIMEOUT", 60 * 60)
+
+
+# ---------------- versão ----------------
+
+def versao_agenda(crianca_id: int) -> int:
+    return (VersaoAgenda.objects.filter(crianca_id=crianca_id)
+            .values_list("versao", flat=True).first()) or 0
+
+
+def marcador_agenda(crianca_id: int):
+    """(versao, atualizado_em) da agenda; serve de ETag/Last-Modified. (0, None) se não houver linha."""
+    return (VersaoAgenda.objects.filter(crianca_id=crianca_id)
+            .values_list("versao", "atualizado_em").first()) or (0, None)
+
+
+def tocar_agendas(crianca_ids: Iterable[int], *, criar: bool = True):
+    """
+    Incrementa a versão da agenda destas crianças (um UPDATE).
+
+    criar=False não cria linhas que faltam: é o caso das exclusões, em que a
+    criança pode estar sendo apagada junto (cascata). As linhas nascem com a
+    criança (signal em terapias.signals) e na migração, então só criança
+    gravada por bulk_create chega aqui sem linha.
+    """
+    ids = sorted({c for c in crianca_ids if c})
+    if not ids:
+        return
+    qs = VersaoAgenda.objects.filter(crianca_id__in=ids)
+    if qs.update(versao=F("versao") + 1, atualizado_em=timezone.now()) == len(ids) or not criar:
+        return
+    # garante as linhas e incrementa de novo (quem já existia sobe duas vezes, o que não faz mal)
+    for crianca_id in ids:
+        VersaoAgenda.objects.get_or_create(crianca_id=crianca_id)
+    qs.update(versao=F("versao") + 1, atualizado_em=timezone.now())
+
+
+# ---------------- fragmentos ----------------
+
+def _chave(nome: str, crianca_id: int, versao: int, partes) -> str:
+    return ":".join([PREFIXO, nome, str(crianca_id), f"v{versao}", *map(str, partes)])
+
+
+def fragmento(nome: str, crianca_id: int, versao: int, partes, gerar: Callable[[], str]) -> str:
+    """HTML do fragmento `nome`; só chama gerar() quando não está no cache."""
+    cache = _cache()
+    chave = _chave(nome, crianca_id, versao, partes)
+    html = cache.get(chave)
+    if html is None:
+        _contar(nome, "miss")
+        html = str(gerar())
+        cache.set(chave, html, _timeout())
+    else:
+        _contar(nome, "hit")
+    return mark_safe(html)
+
+
+# ---------------- acertos / faltas ----------------
+#
+# Os contadores ficam no próprio cache: com backend compartilhado (arquivo,
+# memcached) somam todos os processos; com locmem, são do processo atual.
+
+def _chave_contador(nome: str, tipo: str) -> str:
+    return f"{PREFIXO}:stats:{nome}:{tipo}"
+
+
+def _contar(nome: str, tipo: str):
+    cache = _cache()
+    chave = _chave_contador(nome, tipo)
+    try:
+        cache.incr(chave)
+    except ValueError:  # chave ainda não existe
+        cache.add(chave, 1, None)
+
+
+def estatisticas() -> dict:
+    """{fragmento: {"hit": n, "miss": n, "taxa": fração de acertos}}"""
+    cache = _cache()
+    chaves = {(n, t): _chave_contador(n, t) for n in FRAGMENTOS for t in ("hit", "miss")}
+    valores = cache.get_many(chaves.values())
+    saida = {}
+    for nome in FRAGMENTOS:
+        hit = valores.get(chaves[(nome, "hit")], 0)
+        miss = valores.get(chaves[(nome, "miss")], 0)
+        saida[nome] = {"hit": hit, "miss": miss, "taxa": hit / (hit + miss) if hit + miss else None}
+    return saida
+
+
+def zerar_estatisticas():
+    _cache().delete_many([_chave_contador(n, t) for n in FRAGMENTOS for t in ("hit", "miss")])
@@ -0,0 +1,388 @@
+# terapias/carga.py
+"""
+Carga em massa para onboarding e migrações de dados: Clinica, Profissional,
+Crianca e Evento a partir de linhas (dicts com os nomes dos campos), com as
+chaves estrangeiras dadas por nome.
+
+- Postgres: as linhas vão por COPY FROM STDIN para uma tabela temporária
+  (staging) e de lá para a tabela final num INSERT ... SELECT só, que
+  resolve as chaves com JOINs. Nada passa pelo ORM linha a linha.
+- Outros bancos: lotes de bulk_create, com as chaves resolvidas por lote
+  (uma query por referência).
+
+Usuário é achado pelo username (coluna "usuario"); criança, profissional e
+clínica pelo nome, dentro dos cadastros desse usuário. Havendo homônimos,
+vale o cadastro mais antigo (como em terapias.importacao). Linha sem um
+campo obrigatório, com um valor que o campo não aceita (data inválida,
+texto além do max_length...) ou cuja referência obrigatória não existe é
+rejeitada; referência opcional que não existe fica vazia.
+
+COPY e bulk_create não disparam signals: o que eles fariam vem no fim, por
+tipo (VersaoAgenda das crianças novas; ResumoMensal recalculado e versão da
+agenda das crianças que ganharam eventos). Tudo numa transação só.
+"""
+import time as _time
+from datetime import date, time, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Sequence, Tuple
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from usuario.models import Crianca
+
+from .cache_agenda import tocar_agendas
+from .metricas import reconstruir_resumo
+from .models import Clinica, Evento, Profissional, VersaoAgenda
+
+BATCH_SIZE_CARGA = 5000
+LINHAS_POR_BLOCO_COPY = 1000
+
+
+class Ref(NamedTuple):
+    """
+    Chave estrangeira `campo` resolvida por nome. `por` mapeia campo do modelo
+    referenciado -> coluna da entrada, ou "@outro" para a referência `outro`
+    já resolvida (ex.: a criança tem de ser do mesmo usuário do evento).
+    """
+    campo: str
+    modelo: type
+    por: Dict[str, str]
+    obrigatoria: bool = True
+
+
+class Carga(NamedTuple):
+    modelo: type
+    campos: Tuple[str, ...]
+    refs: Tuple[Ref, ...]
+    retorno: str                    # coluna de cada linha gravada que vai para `depois`
+    depois: Callable[[set], None]
+
+
+def _nada(_valores: set):
+    pass
+
+
+def _depois_criancas(ids: set):
+    # o signal que cria a VersaoAgenda não roda no COPY/bulk_create
+    VersaoAgenda.objects.bulk_create([VersaoAgenda(crianca_id=i) for i in ids],
+                                     batch_size=BATCH_SIZE_CARGA, ignore_conflicts=True)
+
+
+def _depois_eventos(crianca_ids: set):
+    if crianca_ids:
+        reconstruir_resumo(sorted(crianca_ids))
+        tocar_agendas(crianca_ids)
+
+
+_USUARIO = Ref("criado_por", User, {"username": "usuario"})
+
+CARGAS = {
+    "clinicas": Carga(Clinica, ("nome", "endereco", "telefone"), (_USUARIO,), "id", _nada),
+    "profissionais": Carga(
+        Profissional, ("nome", "tipo", "especialidade", "telefone", "email"),
+        (_USUARIO, Ref("clinica", Clinica, {"nome": "clinica", "criado_por": "@criado_por"}, obrigatoria=False)),
+        "id", _nada,
+    ),
+    "criancas": Carga(
+        Crianca, ("nome", "condicao", "data_nascimento", "telefone_contato"),
+        (Ref("responsavel", User, {"username": "usuario"}),),
+        "id", _depois_criancas,
+    ),
+    "eventos": Carga(
+        Evento, ("nome", "tipo", "data_evento", "hora_inicio", "hora_fim", "duracao", "notas", "presenca_confirmada"),
+        (
+            _USUARIO,
+            Ref("crianca", Crianca, {"nome": "crianca", "responsavel": "@criado_por"}),
+            Ref("profissional", Profissional, {"nome": "profissional", "criado_por": "@criado_por"}, obrigatoria=False),
+            Ref("clinica", Clinica, {"nome": "clinica", "criado_por": "@criado_por"}, obrigatoria=False),
+        ),
+        "crianca_id", _depois_eventos,
+    ),
+}
+
+
+def _colunas_de_chave(carga: Carga) -> List[str]:
+    """Colunas da entrada usadas pelas referências, na ordem em que aparecem."""
+    colunas = []
+    for ref in carga.refs:
+        for coluna in ref.por.values():
+            if not coluna.startswith("@") and coluna not in colunas:
+                colunas.append(coluna)
+    return colunas
+
+
+def _regras(carga: Carga) -> List[Tuple[str, object, object, bool]]:
+    """(nome, campo, padrão, obrigatório) de cada campo simples; montado uma vez por carga."""
+    regras = []
+    for nome in carga.campos:
+        campo = carga.modelo._meta.get_field(nome)
+        padrao = campo.get_default() if campo.has_default() else None
+        regras.append((nome, campo, padrao, padrao is None and not campo.null))
+    return regras
+
+
+def _valores(regras, linha: dict):
+    """
+    Valores dos campos simples, já convertidos pelo campo (to_python); None
+    se falta um obrigatório ou se algum valor não serve para o campo. A linha
+    ruim é rejeitada aqui, antes de chegar ao COPY/bulk_create, onde
+    derrubaria a carga inteira.
+    """
+    valores = []
+    for nome, campo, padrao, obrigatorio in regras:
+        v = linha.get(nome)
+        if v is None or v == "":
+            if obrigatorio:
+                return None
+            v = padrao
+        else:
+            try:
+                v = campo.to_python(v)
+            except ValidationError:
+                return None
+            if campo.max_length and len(v) > campo.max_length:
+                return None
+        valores.append(v)
+    return valores
+
+
+# ---------------- Postgres: COPY + staging ----------------
+
+_ESCAPES_COPY = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _texto(v) -> str:
+    """Valor no formato texto do COPY."""
+    if type(v) is str:  # o caso comum (CSV), testado primeiro
+        return v.translate(_ESCAPES_COPY) if v else r"\N"
+    if v is None:
+        return r"\N"
+    if isinstance(v, bool):
+        return "t" if v else "f"
+    if isinstance(v, timedelta):
+        return f"{v.total_seconds()} seconds"
+    if isinstance(v, (date, time)):
+        return v.isoformat()
+    return str(v).translate(_ESCAPES_COPY)
+
+
+def _blocos(carga: Carga, linhas: Iterable[dict], contagem: dict) -> Iterator[str]:
+    chaves = _colunas_de_chave(carga)
+    regras = _regras(carga)
+    bloco = []
+    for linha in linhas:
+        contagem["lidos"] += 1
+        valores = _valores(regras, linha)
+        if valores is None:
+            contagem["invalidos"] += 1
+            continue
+        bloco.append("\t".join(map(_texto, valores + [linha.get(c) for c in chaves])) + "\n")
+        if len(bloco) >= LINHAS_POR_BLOCO_COPY:
+            yield "".join(bloco)
+            bloco = []
+    if bloco:
+        yield "".join(bloco)
+
+
+class _Arquivo:
+    """Arquivo só de leitura sobre um gerador de blocos (é o que o copy_expert do psycopg2 lê)."""
+
+    def __init__(self, blocos: Iterable[str]):
+        self._blocos = iter(blocos)
+        self._resto = ""
+
+    def read(self, n: int = -1) -> str:
+        while n < 0 or len(self._resto) < n:
+            bloco = next(self._blocos, None)
+            if bloco is None:
+                break
+            self._resto += bloco
+        n = len(self._resto) if n < 0 else n
+        saida, self._resto = self._resto[:n], self._resto[n:]
+        return saida
+
+    readline = read
+
+
+def _copiar(cursor, sql: str, blocos: Iterable[str]):
+    bruto = cursor.cursor  # o cursor do driver por trás do CursorWrapper do Django
+    if hasattr(bruto, "copy"):  # psycopg 3
+        with bruto.copy(sql) as copia:
+            for bloco in blocos:
+                copia.write(bloco)
+    else:  # psycopg2
+        bruto.copy_expert(sql, _Arquivo(blocos))
+
+
+def copiar_para_tabela(modelo, colunas: Sequence[str], linhas: Iterable[tuple]) -> int:
+    """
+    COPY direto na tabela do modelo (só Postgres), sem staging: para quem já
+    tem os ids das chaves. `colunas` são attnames; retorna quantas linhas foram.
+    """
+    qn = connection.ops.quote_name
+    meta = modelo._meta
+    contagem = [0]
+
+    def blocos():
+        bloco = []
+        for linha in linhas:
+            bloco.append("\t".join(map(_texto, linha)) + "\n")
+            if len(bloco) >= LINHAS_POR_BLOCO_COPY:
+                contagem[0] += len(bloco)
+                yield "".join(bloco)
+                bloco = []
+        if bloco:
+            contagem[0] += len(bloco)
+            yield "".join(bloco)
+
+    nomes = ", ".join(qn(meta.get_field(c).column) for c in colunas)
+    with connection.cursor() as cursor:
+        _copiar(cursor, f"COPY {qn(meta.db_table)} ({nomes}) FROM STDIN", blocos())
+    return contagem[0]
+
+
+def _sql_insert(carga: Carga, staging: str) -> str:
+    qn = connection.ops.quote_name
+    meta = carga.modelo._meta
+    destino = [meta.get_field(n).column for n in carga.campos]
+    origem = [f"s.{qn(n)}" for n in carga.campos]
+    joins = []
+    for i, ref in enumerate(carga.refs):
+        alias = f"r{i}"
+        rmeta = ref.modelo._meta
+        colunas = [rmeta.get_field(c).column for c in ref.por]
+        # DISTINCT ON: um cadastro por nome, o mais antigo
+        sub = (f"(SELECT DISTINCT ON ({', '.join(map(qn, colunas))}) {qn(rmeta.pk.column)} AS pk, "
+               f"{', '.join(map(qn, colunas))} FROM {qn(rmeta.db_table)} "
+               f"ORDER BY {', '.join(map(qn, colunas))}, {qn(rmeta.pk.column)})")
+        condicoes = []
+        for coluna, entrada in zip(colunas, ref.por.values()):
+            if entrada.startswith("@"):
+                anterior = next(j for j, r in enumerate(carga.refs) if r.campo == entrada[1:])
+                condicoes.append(f"{alias}.{qn(coluna)} = r{anterior}.pk")
+            else:
+                condicoes.append(f"{alias}.{qn(coluna)} = s.{qn(entrada)}")
+        joins.append(f"{'JOIN' if ref.obrigatoria else 'LEFT JOIN'} {sub} {alias} ON {' AND '.join(condicoes)}")
+        destino.append(meta.get_field(ref.campo).column)
+        origem.append(f"{alias}.pk")
+    for campo in meta.concrete_fields:
+        if getattr(campo, "auto_now_add", False) or getattr(campo, "auto_now", False):
+            destino.append(campo.column)
+            origem.append("now()")
+
+    return (
+        f"WITH novos AS (INSERT INTO {qn(meta.db_table)} ({', '.join(map(qn, destino))}) "
+        f"SELECT {', '.join(origem)} FROM {qn(staging)} s {' '.join(joins)} "
+        f"RETURNING {qn(carga.retorno)}) "
+        f"SELECT count(*), array_agg(DISTINCT {qn(carga.retorno)}) FROM novos"
+    )
+
+
+def _carregar_copy(carga: Carga, linhas: Iterable[dict]) -> Tuple[int, set, dict]:
+    qn = connection.ops.quote_name
+    meta = carga.modelo._meta
+    staging = f"carga_{meta.db_table}"
+    chaves = _colunas_de_chave(carga)
+    definicoes = ([f"{qn(n)} {meta.get_field(n).db_type(connection)}" for n in carga.campos]
+                  + [f"{qn(c)} text" for c in chaves])
+    contagem = {"lidos": 0, "invalidos": 0}
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE TEMPORARY TABLE {qn(staging)} ({', '.join(definicoes)}) ON COMMIT DROP")
+        colunas = ", ".join(map(qn, [*carga.campos, *chaves]))
+        _copiar(cursor, f"COPY {qn(staging)} ({colunas}) FROM STDIN", _blocos(carga, linhas, contagem))
+        cursor.execute(f"ANALYZE {qn(staging)}")
+        cursor.execute(_sql_insert(carga, staging))
+        carregados, retornos = cursor.fetchone()
+        cursor.execute(f"DROP TABLE {qn(staging)}")  # libera o nome para outra carga na mesma transação
+    return carregados, set(retornos or ()), contagem
+
+
+# ---------------- outros bancos: bulk_create em lotes ----------------
+
+def _resolver_lote(carga: Carga, lote: List[dict]) -> List[dict]:
+    """{campo da ref: pk ou None} de cada linha, com uma query por referência."""
+    resolvidos = [{} for _ in lote]
+    for ref in carga.refs:
+        chaves = [
+            tuple(res.get(e[1:]) if e.startswith("@") else (linha.get(e) or None) for e in ref.por.values())
+            for linha, res in zip(lote, resolvidos)
+        ]
+        validas = {k for k in chaves if None not in k}
+        tabela = {}
+        if validas:
+            campos = list(ref.por)
+            qs = (ref.modelo._default_manager
+                  .filter(**{f"{campos[0]}__in": {k[0] for k in validas}})
+                  .order_by("-pk").values_list("pk", *campos))
+            for pk, *chave in qs:
+                tabela[tuple(chave)] = pk  # em ordem decrescente: o mais antigo fica
+        for chave, res in zip(chaves, resolvidos):
+            res[ref.campo] = tabela.get(chave)
+    return resolvidos
+
+
+def _gravar_lote(carga: Carga, lote: List[Tuple[dict, list]], batch_size: int) -> Tuple[List, int]:
+    """Grava as linhas do lote, (linha, valores já convertidos por _valores)."""
+    objetos, rejeitados = [], 0
+    for (linha, valores), refs in zip(lote, _resolver_lote(carga, [linha for linha, _ in lote])):
+        if any(refs[r.campo] is None for r in carga.refs if r.obrigatoria):
+            rejeitados += 1
+            continue
+        objetos.append(carga.modelo(**dict(zip(carga.campos, valores)),
+                                    **{f"{campo}_id": pk for campo, pk in refs.items()}))
+    carga.modelo.objects.bulk_create(objetos, batch_size=batch_size)
+    return objetos, rejeitados
+
+
+def _carregar_em_lotes(carga: Carga, linhas: Iterable[dict], batch_size: int) -> Tuple[int, set, dict]:
+    contagem = {"lidos": 0, "invalidos": 0}
+    regras = _regras(carga)
+    carregados, retornos, lote = 0, set(), []
+
+    def gravar():
+        nonlocal carregados
+        objetos, rejeitados = _gravar_lote(carga, lote, batch_size)
+        contagem["invalidos"] += rejeitados
+        carregados += len(objetos)
+        retornos.update(getattr(obj, carga.retorno) for obj in objetos)
+
+    for linha in linhas:
+        contagem["lidos"] += 1
+        valores = _valores(regras, linha)
+        if valores is None:
+            contagem["invalidos"] += 1
+            continue
+        lote.append((linha, valores))
+        if len(lote) >= batch_size:
+            gravar()
+            lote = []
+    if lote:
+        gravar()
+    return carregados, retornos, contagem
+
+
+def carregar(tipo: str, linhas: Iterable[dict], *, batch_size: int = BATCH_SIZE_CARGA) -> dict:
+    """
+    Carrega as linhas como `tipo` ("clinicas", "profissionais", "criancas" ou "eventos").
+
+    Retorna {"lidos", "carregados", "rejeitados", "segundos"}. Numa transação
+    só: se algo falha no meio, nada fica gravado.
+    """
+    if tipo not in CARGAS:
+        raise ValueError(f"tipo desconhecido: {tipo!r} (use {', '.join(CARGAS)})")
+    carga = CARGAS[tipo]
+    t0 = _time.perf_counter()
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            carregados, retornos, contagem = _carregar_copy(carga, linhas)
+        else:
+            carregados, retornos, contagem = _carregar_em_lotes(carga, linhas, batch_size)
+        carga.depois(retornos)
+    return {
+        "lidos": contagem["lidos"],
+        "carregados": carregados,
+        "rejeitados": contagem["lidos"] - carregados,
+        "segundos": _time.perf_counter() - t0,
+    }
@@ -0,0 +1,130 @@
+# terapias/datas_vetorizadas.py
+"""
+Geração de datas de recorrência com NumPy (datetime64[D]).
+
+Mesma semântica de services._datas_do_item — inclusive o "encolhimento" do
+dia no fim do mês de _datas_mensais, o passo de 14 dias da quinzenal e o
+29/02 -> 28/02 de _datas_anuais — mas calculando as datas de muitos
+RotinaItems de uma vez, sem laço em Python por data.
+
+NumPy é opcional no projeto: só este módulo (e quem o usa) depende dele.
+"""
+from datetime import date
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from .services import WEEKDAY_MAP
+
+DIA = np.timedelta64(1, "D")
+
+# (periodicidade, dias_semana, ancora)
+Regra = Tuple[str, Optional[str], date]
+
+
+def _weekday(d: np.ndarray) -> np.ndarray:
+    """weekday() do Python (segunda=0) para um array datetime64[D]."""
+    # 1970-01-01 foi uma quinta-feira (3)
+    return (d.astype(np.int64) + 3) % 7
+
+
+def _dias_no_mes(meses: np.ndarray) -> np.ndarray:
+    return ((meses + 1).astype("M8[D]") - meses.astype("M8[D]")).astype(np.int64)
+
+
+def _expandir(primeira: np.ndarray, n: np.ndarray, passo: np.ndarray):
+    """
+    Para cada posição i gera primeira[i] + k*passo[i], k = 0..n[i]-1.
+    Retorna (posicao, valores) já achatados, sem laço por item.
+    """
+    n = np.maximum(n, 0)
+    total = int(n.sum())
+    pos = np.repeat(np.arange(len(n)), n)
+    inicio_seg = np.repeat(np.cumsum(n) - n, n)
+    k = np.arange(total) - inicio_seg
+    return pos, primeira[pos] + k * passo[pos]
+
+
+def datas_em_lote(regras: Sequence[Regra], inicio, fim) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Datas de várias regras em [inicio, fim] (escalares ou um valor por regra).
+
+    Retorna (idx, datas): idx[j] é o índice em `regras` da data datas[j]
+    (datetime64[D]); ordenados por regra e depois por data.
+    """
+    n_regras = len(regras)
+    if not n_regras:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype="M8[D]")
+
+    per = np.array([r[0] for r in regras])
+    ancora = np.array([r[2] for r in regras], dtype="M8[D]")
+    ini = np.broadcast_to(np.asarray(inicio, dtype="M8[D]"), (n_regras,))
+    fim = np.broadcast_to(np.asarray(fim, dtype="M8[D]"), (n_regras,))
+    ini = np.maximum(ini, ancora)
+
+    partes_idx, partes_datas = [], []
+
+    # --- diária / semanal / quinzenal / pontual: progressões aritméticas ---
+    wd = np.array([WEEKDAY_MAP.get(r[1], -1) for r in regras], dtype=np.int64)
+    wd = np.where(wd < 0, _weekday(ancora), wd)
+
+    semanal = (per == "semanal") | (per == "quinzenal")
+    passo = np.where(per == "quinzenal", 14, 7)
+    primeira_sem = ancora + ((wd - _weekday(ancora)) % 7) * DIA
+    atraso = (ini - primeira_sem).astype(np.int64)
+    saltos = np.where(atraso > 0, -(-atraso // passo), 0)
+    primeira_sem = primeira_sem + saltos * passo * DIA
+
+    diaria = per == "diaria"
+    pontual = per == "pontual"
+
+    primeira = np.where(diaria, ini, np.where(semanal, primeira_sem, ancora))
+    passo = np.where(diaria | pontual, 1, passo)
+    n = np.where(primeira <= fim, (fim - primeira).astype(np.int64) // passo + 1, 0)
+    n = np.where(pontual, ((ancora >= ini) & (ancora <= fim)).astype(np.int64), n)
+    n = np.where(diaria | semanal | pontual, n, 0)
+
+    pos, datas = _expandir(primeira, n, passo * DIA)
+    partes_idx.append(pos)
+    partes_datas.append(datas)
+
+    # --- mensal / anual: caminha por meses/anos desde a âncora ---
+    dia0 = (ancora - ancora.astype("M8[M]").astype("M8[D]")).astype(np.int64) + 1
+    mes0 = ancora.astype("M8[M]")
+
+    mensal = np.flatnonzero(per == "mensal")
+    if len(mensal):
+        n_meses = (fim[mensal].astype("M8[M]") - mes0[mensal]).astype(np.int64) + 1
+        pos, meses = _expandir(mes0[mensal], n_meses, np.full(len(mensal), np.timedelta64(1, "M")))
+        limite = np.minimum(_dias_no_mes(meses), dia0[mensal][pos])
+        # o dia nunca volta a crescer depois de encolher (d.day carrega o mínimo):
+        # mínimo acumulado por regra, isolando as regras com um deslocamento grande
+        deslocamento = pos * 100
+        dia = np.minimum.accumulate(limite - deslocamento) + deslocamento
+        datas = meses.astype("M8[D]") + (dia - 1) * DIA
+        ok = (datas >= ini[mensal][pos]) & (datas <= fim[mensal][pos])
+        partes_idx.append(mensal[pos][ok])
+        partes_datas.append(datas[ok])
+
+    anual = np.flatnonzero(per == "anual")
+    if len(anual):
+        n_anos = (fim[anual].astype("M8[Y]") - ancora[anual].astype("M8[Y]")).astype(np.int64) + 1
+        pos, meses = _expandir(mes0[anual], n_anos, np.full(len(anual), np.timedelta64(12, "M")))
+        dia = np.minimum(_dias_no_mes(meses), dia0[anual][pos])
+        datas = meses.astype("M8[D]") + (dia - 1) * DIA
+        ok = (datas >= ini[anual][pos]) & (datas <= fim[anual][pos])
+        partes_idx.append(anual[pos][ok])
+        partes_datas.append(datas[ok])
+
+    idx = np.concatenate(partes_idx)
+    datas = np.concatenate(partes_datas)
+    # cada parte já sai em ordem de data dentro da regra; basta juntar por regra
+    ordem = np.argsort(idx, kind="stable")
+    return idx[ordem], datas[ordem]
+
+
+def datas_da_regra(periodicidade: str, dias_semana: Optional[str], inicio: date, fim: date,
+                   ancora: Optional[date] = None) -> np.ndarray:
+    """Equivalente vetorizado de services._datas_do_item para uma regra só."""
+    _, datas = datas_em_lote([(periodicidade, dias_semana, ancora or inicio)], inicio, fim)
+    return datas
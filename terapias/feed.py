@@ -0,0 +1,86 @@
+# terapias/feed.py
+"""
+Feed JSON da agenda de uma criança (AgendaFeedView).
+
+Formato, estável e compacto — cabeçalho de campos + uma lista por ocorrência:
+
+    {"crianca": 1, "de": "2025-03-01", "ate": "2025-03-31", "versao": 42,
+     "campos": ["id", "rotina_item", "nome", ...],
+     "eventos": [[10, 3, "Fono", "consulta", "2025-03-03", "09:00", "10:00", "Dra. B", "Clínica", true], ...]}
+
+`id` é null nas ocorrências calculadas das rotinas (ainda sem Evento
+gravado). As linhas saem em ordem de data/início/término/nome e são
+serializadas em blocos, então dá para mandar o corpo como streaming.
+"""
+import heapq
+import json
+from datetime import date, time
+from typing import Iterator
+
+from django.db.models import F
+
+from .models import Evento
+from .services import _default_tipo_evento, _ocorrencias_calculadas
+
+CAMPOS = ("id", "rotina_item", "nome", "tipo", "data", "inicio", "fim", "profissional", "clinica", "presenca")
+
+# linhas por bloco de JSON enviado
+LINHAS_POR_BLOCO = 500
+# intervalos maiores que isso vão como streaming, sem montar o corpo em memória
+DIAS_STREAMING = 62
+MAX_DIAS = 366 * 5
+
+_dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def _chave(linha):
+    return linha[4], linha[5] or time.min, linha[6] or time.min, linha[2]
+
+
+def _linhas(crianca, de: date, ate: date) -> Iterator[tuple]:
+    """Tuplas na ordem de CAMPOS, gravadas (do banco, em ordem) e calculadas intercaladas."""
+    no_intervalo = Evento.objects.filter(crianca=crianca, data_evento__range=(de, ate))
+    ja_gravadas = set(no_intervalo.filter(origem_rotina_item__isnull=False)
+                      .values_list("origem_rotina_item_id", "data_evento"))
+
+    gravados = (no_intervalo
+                .order_by("data_evento", F("hora_inicio").asc(nulls_first=True),
+                          F("hora_fim").asc(nulls_first=True), "nome")
+                .values_list("pk", "origem_rotina_item_id", "nome", "tipo", "data_evento", "hora_inicio",
+                             "hora_fim", "profissional__nome", "clinica__nome", "presenca_confirmada")
+                .iterator(chunk_size=2000))
+
+    tipo = _default_tipo_evento()
+    calculadas = sorted(
+        ((None, pk, nome, tipo, d, hi, hf, prof, clin, False)
+         for pk, nome, d, hi, hf, prof, clin in _ocorrencias_calculadas(crianca, de, ate, ja_gravadas)),
+        key=_chave,
+    )
+    return heapq.merge(gravados, calculadas, key=_chave)
+
+
+def _linha_json(linha) -> list:
+    pk, item, nome, tipo, d, hi, hf, prof, clin, presenca = linha
+    return [pk, item, nome, tipo, d.isoformat(),
+            hi.strftime("%H:%M") if hi else None,
+            hf.strftime("%H:%M") if hf else None,
+            prof, clin, presenca]
+
+
+def feed_json(crianca, de: date, ate: date, versao: int) -> Iterator[str]:
+    """Corpo do feed em pedaços de texto (para HttpResponse ou StreamingHttpResponse)."""
+    cabecalho = {"crianca": crianca.pk, "de": de.isoformat(), "ate": ate.isoformat(),
+                 "versao": versao, "campos": CAMPOS}
+    yield _dumps(cabecalho)[:-1] + ',"eventos":['
+
+    bloco = []
+    primeiro = True
+    for linha in _linhas(crianca, de, ate):
+        bloco.append(_linha_json(linha))
+        if len(bloco) == LINHAS_POR_BLOCO:
+            yield ("" if primeiro else ",") + _dumps(bloco)[1:-1]
+            primeiro = False
+            bloco = []
+    if bloco:
+        yield ("" if primeiro else ",") + _dumps(bloco)[1:-1]
+    yield "]}"
@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 from usuario.models import Crianca
 from datetime import date
 from .variaveis_categoricas import TIPOS_PERIODICIDADE, TIPOS_DIA_SEMANA
+from .services import salvar_itens
 
 class ClinicaForm(forms.ModelForm):
     class Meta:
@@ -246,10 +247,13 @@ class RotinaItemBulkForm(forms.Form):
             raise forms.ValidationError("Selecione pelo menos um dia da semana.")
         return cd
 
-    def save_many(self, rotina, user):
+    def save_many(self, rotina, user, commit=True):
         """
         Cria um RotinaItem para cada dia selecionado.
         Evita duplicados (mesmo dia+horário na mesma rotina).
+        Com commit=True os itens são gravados por services.salvar_itens (sem
+        gerar eventos); com commit=False voltam sem salvar (ex.: para
+        services.expandir_rotina).
         Retorna (criados, pulados).
         """
         criados, pulados = [], []
@@ -264,7 +268,16 @@ class RotinaItemBulkForm(forms.Form):
 
         dur = datetime.combine(date.today(), fim) - datetime.combine(date.today(), ini)
 
+        # dias que já têm item neste mesmo horário (ex.: submit repetido)
+        ocupados = set(
+            RotinaItem.objects.filter(rotina=rotina, hora_inicio=ini, dias_semana__in=dias)
+            .values_list("dias_semana", flat=True)
+        )
+
         for d in dias:
+            if d in ocupados:
+                pulados.append(d)
+                continue
             obj = RotinaItem(
                 nome_evento=nome,
                 descricao=desc,
@@ -278,7 +291,31 @@ class RotinaItemBulkForm(forms.Form):
                 rotina=rotina,
                 criado_por=user,
             )
-            obj.save()
             criados.append(obj)
 
-        return criados, pulados    
\ No newline at end of file
+        if commit:
+            # sobe a versão da agenda (cache dos fragmentos); os eventos ficam por conta de quem chama
+            salvar_itens(rotina, criados)
+
+        return criados, pulados    
+
+class ImportacaoAgendaForm(forms.Form):
+    crianca = forms.ModelChoiceField(queryset=Crianca.objects.none(), label="Criança")
+    arquivo = forms.FileField(label="Arquivo (.ics ou .csv)")
+    dry_run = forms.BooleanField(required=False, label="Só simular (não grava nada)")
+
+    def __init__(self, *args, **kwargs):
+        self.request = kwargs.pop("request", None)
+        super().__init__(*args, **kwargs)
+        qs = Crianca.objects.order_by("nome")
+        if self.request and not self.request.user.is_superuser:
+            qs = qs.filter(responsavel=self.request.user)
+        self.fields["crianca"].queryset = qs
+        if qs.count() == 1 and not self.is_bound:
+            self.fields["crianca"].initial = qs.first()
+
+    def clean_arquivo(self):
+        arquivo = self.cleaned_data["arquivo"]
+        if not arquivo.name.lower().endswith((".ics", ".ical", ".ifb", ".csv", ".txt")):
+            raise forms.ValidationError("Envie um arquivo .ics ou .csv.")
+        return arquivo
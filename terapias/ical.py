@@ -0,0 +1,273 @@
+# terapias/ical.py
+"""
+Exportação da agenda em iCalendar (RFC 5545) para assinatura em apps de
+calendário — por criança ou por profissional (nas crianças do responsável).
+
+- Cada RotinaItem vira UM VEVENT com RRULE quando a regra cabe numa RRULE
+  com a mesma semântica de services._datas_do_item. A série começa onde a
+  agenda passa a calcular as ocorrências (services._inicio_calculado: depois
+  do watermark, ou na criação do item), e não no início da rotina: a regra
+  atual não é projetada sobre o que já foi gerado com uma regra antiga.
+- Eventos gravados do item antes do início da série (ou fora da regra atual)
+  saem um por VEVENT, como os avulsos. Os que caem na série só aparecem,
+  como RECURRENCE-ID, se foram alterados em relação ao item.
+- Regras que o RRULE não reproduz (mensal em dia > 28, que "encolhe" e não
+  volta; anual em 29/02, que cai em 28/02) saem uma ocorrência por VEVENT,
+  a partir do mesmo início, até o término da rotina ou HORIZONTE_SEM_RRULE
+  dias à frente.
+- Eventos avulsos saem um por VEVENT, lidos com .iterator() em blocos.
+
+Tudo é gerado sob demanda (gerador de str), para StreamingHttpResponse.
+As URLs de assinatura levam um token assinado (django.core.signing), já que
+apps de calendário não fazem login.
+"""
+import hashlib
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from typing import Iterable, Iterator, Optional
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Max, Q
+
+from .models import Evento, RotinaItem, VersaoAgenda
+from .services import WEEKDAY_MAP, _datas_do_item, _default_tipo_evento, _inicio_calculado
+
+SALT = "terapias.ical"
+PRODID = "-//TherapyTrack//Agenda//PT-BR"
+HORIZONTE_SEM_RRULE = 365
+LINHAS_POR_BLOCO = 200
+
+BYDAY = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+
+# ---------------- token de assinatura ----------------
+
+def token_assinatura(user_id: int, *, crianca_id: Optional[int] = None, profissional_id: Optional[int] = None) -> str:
+    escopo = {"u": user_id}
+    if crianca_id is not None:
+        escopo["c"] = crianca_id
+    if profissional_id is not None:
+        escopo["p"] = profissional_id
+    return signing.dumps(escopo, salt=SALT, compress=True)
+
+
+def ler_token(token: str) -> dict:
+    """Escopo {"u": user_id, "c" | "p": id}. Levanta signing.BadSignature se inválido."""
+    return signing.loads(token, salt=SALT)
+
+
+# ---------------- ETag ----------------
+
+def marcador(versoes_qs):
+    """(etag, last_modified) a partir das VersaoAgenda do escopo do feed."""
+    versoes = sorted(versoes_qs.values_list("crianca_id", "versao"))
+    ultima = versoes_qs.aggregate(m=Max("atualizado_em"))["m"]
+    digest = hashlib.sha1(repr(versoes).encode()).hexdigest()[:20]
+    return f'"ics-{digest}"', int(ultima.timestamp()) if ultima else None
+
+
+def versoes_do_escopo(escopo: dict):
+    qs = VersaoAgenda.objects.filter(crianca__responsavel_id=escopo["u"])
+    if "c" in escopo:
+        qs = qs.filter(crianca_id=escopo["c"])
+    return qs
+
+
+# ---------------- formatação ----------------
+
+def _escapar(texto: str) -> str:
+    return (texto.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _dobrar(linha: str) -> str:
+    """Quebra em linhas de até 75 octetos (RFC 5545 §3.1), sem partir caracteres UTF-8."""
+    dados = linha.encode()
+    if len(dados) <= 75:
+        return linha + "\r\n"
+    partes, atual, limite = [], "", 75
+    for ch in linha:
+        if len((atual + ch).encode()) > limite:
+            partes.append(atual)
+            atual, limite = "", 74  # as continuações começam com um espaço
+        atual += ch
+    partes.append(atual)
+    return "\r\n ".join(partes) + "\r\n"
+
+
+def _prop_data(nome: str, d: date, hora, tzid: str) -> str:
+    if hora is None:
+        return f"{nome};VALUE=DATE:{d:%Y%m%d}"
+    return f"{nome};TZID={tzid}:{datetime.combine(d, hora):%Y%m%dT%H%M%S}"
+
+
+def _vtimezone(tzid: str) -> list:
+    # O projeto guarda horas locais de settings.TIME_ZONE. America/Sao_Paulo
+    # não tem horário de verão desde 2019: um STANDARD com o offset atual basta.
+    offset = datetime.now(ZoneInfo(tzid)).utcoffset() or timedelta()
+    minutos = int(offset.total_seconds() // 60)
+    sinal = "-" if minutos < 0 else "+"
+    hhmm = f"{sinal}{abs(minutos) // 60:02d}{abs(minutos) % 60:02d}"
+    return ["BEGIN:VTIMEZONE", f"TZID:{tzid}", "BEGIN:STANDARD", "DTSTART:19700101T000000",
+            f"TZOFFSETFROM:{hhmm}", f"TZOFFSETTO:{hhmm}", "END:STANDARD", "END:VTIMEZONE"]
+
+
+def _vevent(uid: str, dtstamp: str, tzid: str, *, nome, tipo, d, hi, hf, duracao=None,
+            profissional=None, clinica=None, notas=None, extras: Iterable[str] = ()) -> list:
+    linhas = ["BEGIN:VEVENT", f"UID:{uid}", f"DTSTAMP:{dtstamp}", _prop_data("DTSTART", d, hi, tzid)]
+    if hi is not None and hf is not None and hf > hi:
+        linhas.append(_prop_data("DTEND", d, hf, tzid))
+    elif hi is not None and duracao:
+        linhas.append(f"DURATION:PT{int(duracao.total_seconds() // 60)}M")
+    linhas.extend(extras)
+    linhas.append(f"SUMMARY:{_escapar(nome or tipo or '')}")
+    if clinica:
+        linhas.append(f"LOCATION:{_escapar(clinica)}")
+    descricao = [t for t in (tipo and f"Tipo: {tipo}", profissional and f"Profissional: {profissional}", notas) if t]
+    if descricao:
+        linhas.append(f"DESCRIPTION:{_escapar(chr(10).join(descricao))}")
+    linhas.append("END:VEVENT")
+    return linhas
+
+
+def _rrule(per: str, dias_semana: Optional[str], ancora: date, termino: Optional[date],
+           com_hora: bool, tzid: str) -> Optional[str]:
+    """RRULE com a mesma semântica de _datas_do_item, ou None se não houver uma."""
+    if per == "diaria":
+        regra = "FREQ=DAILY"
+    elif per in ("semanal", "quinzenal"):
+        dia = BYDAY[WEEKDAY_MAP.get(dias_semana, ancora.weekday())]
+        regra = f"FREQ=WEEKLY;BYDAY={dia}" + (";INTERVAL=2" if per == "quinzenal" else "")
+    elif per == "mensal" and ancora.day <= 28:
+        regra = f"FREQ=MONTHLY;BYMONTHDAY={ancora.day}"
+    elif per == "anual" and (ancora.month, ancora.day) != (2, 29):
+        regra = f"FREQ=YEARLY;BYMONTH={ancora.month};BYMONTHDAY={ancora.day}"
+    else:
+        return None
+    if termino and com_hora:
+        # com DTSTART;TZID o UNTIL vai em UTC: fim do dia local do término
+        fim = datetime.combine(termino, time(23, 59, 59), tzinfo=ZoneInfo(tzid)).astimezone(dt_timezone.utc)
+        regra += f";UNTIL={fim:%Y%m%dT%H%M%SZ}"
+    elif termino:
+        regra += f";UNTIL={termino:%Y%m%d}"
+    return "RRULE:" + regra
+
+
+# ---------------- o calendário ----------------
+
+_CAMPOS_ITEM = ("pk", "periodicidade", "dias_semana", "nome_evento", "hora_inicio", "hora_fim", "duracao",
+                "descricao", "profissional_id", "clinica_id", "profissional__nome", "clinica__nome",
+                "rotina__data_inicio", "rotina__data_termino", "rotina__crianca_id", "materializado_ate",
+                "data_criacao")
+
+_CAMPOS_EVENTO = ("pk", "origem_rotina_item_id", "nome", "tipo", "data_evento", "hora_inicio", "hora_fim",
+                  "duracao", "notas", "profissional_id", "clinica_id", "profissional__nome", "clinica__nome")
+
+
+def calendario(escopo: dict, nome: str) -> Iterator[str]:
+    """Texto .ics em blocos de linhas já dobradas (para StreamingHttpResponse)."""
+    tzid = settings.TIME_ZONE
+    dtstamp = datetime.now(dt_timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    tipo_padrao = _default_tipo_evento()
+    hoje = date.today()
+
+    filtro_item = Q(rotina__crianca__responsavel_id=escopo["u"])
+    filtro_evento = Q(crianca__responsavel_id=escopo["u"])
+    if "c" in escopo:
+        filtro_item &= Q(rotina__crianca_id=escopo["c"])
+        filtro_evento &= Q(crianca_id=escopo["c"])
+    if "p" in escopo:
+        filtro_item &= Q(profissional_id=escopo["p"])
+        filtro_evento &= Q(profissional_id=escopo["p"])
+
+    yield "".join(_dobrar(l) for l in [
+        "BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{PRODID}", "CALSCALE:GREGORIAN", "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_escapar(nome)}", f"X-WR-TIMEZONE:{tzid}", *_vtimezone(tzid),
+    ])
+
+    # Itens de rotina: poucos, ficam em memória para comparar com os eventos gravados
+    itens = {it[0]: dict(zip(_CAMPOS_ITEM, it))
+             for it in RotinaItem.objects.filter(filtro_item).values_list(*_CAMPOS_ITEM)}
+    rrules = {pk: _rrule(it["periodicidade"], it["dias_semana"], it["rotina__data_inicio"],
+                         it["rotina__data_termino"], it["hora_inicio"] is not None, tzid)
+              for pk, it in itens.items()}
+    # datas já gravadas dos itens sem RRULE, numa consulta só
+    gravadas = defaultdict(set)
+    sem_rrule = [pk for pk, rrule in rrules.items() if rrule is None]
+    if sem_rrule:
+        for pk, d in Evento.objects.filter(origem_rotina_item_id__in=sem_rrule).values_list(
+                "origem_rotina_item_id", "data_evento"):
+            gravadas[pk].add(d)
+
+    inicio_serie = {}  # item -> DTSTART da série com RRULE
+    bloco = []
+    for it in itens.values():
+        ancora, termino = it["rotina__data_inicio"], it["rotina__data_termino"]
+        inicio = max(ancora, _inicio_calculado(it["materializado_ate"], it["data_criacao"]))
+        rrule = rrules[it["pk"]]
+        valores = dict(nome=it["nome_evento"], tipo=tipo_padrao, hi=it["hora_inicio"], hf=it["hora_fim"],
+                       duracao=it["duracao"], profissional=it["profissional__nome"],
+                       clinica=it["clinica__nome"], notas=it["descricao"])
+        if rrule:
+            # a primeira data da regra a partir do início (a RRULE conta as repetições desde o DTSTART)
+            ate = min(inicio + timedelta(days=400), termino) if termino else inicio + timedelta(days=400)
+            datas = _datas_do_item(_regra(it), inicio, ate, ancora=ancora)[:1]
+            if datas:
+                inicio_serie[it["pk"]] = datas[0]
+                bloco += _vevent(f"rotinaitem-{it['pk']}@therapytrack", dtstamp, tzid, d=datas[0],
+                                 extras=[rrule], **valores)
+            continue
+        # sem RRULE equivalente: uma ocorrência por VEVENT (as gravadas saem com os eventos)
+        fim = termino or hoje + timedelta(days=HORIZONTE_SEM_RRULE)
+        for d in _datas_do_item(_regra(it), inicio, fim, ancora=ancora):
+            if d not in gravadas[it["pk"]]:
+                bloco += _vevent(f"rotinaitem-{it['pk']}-{d:%Y%m%d}@therapytrack", dtstamp, tzid, d=d, **valores)
+        if len(bloco) >= LINHAS_POR_BLOCO:
+            yield "".join(map(_dobrar, bloco))
+            bloco = []
+
+    # Eventos gravados: avulsos, os de rotina fora de uma série, e exceções (alterados) das séries
+    eventos = (Evento.objects.filter(filtro_evento)
+               .order_by("data_evento", "pk")
+               .values_list(*_CAMPOS_EVENTO)
+               .iterator(chunk_size=2000))
+    for linha in eventos:
+        ev = dict(zip(_CAMPOS_EVENTO, linha))
+        origem = ev["origem_rotina_item_id"]
+        item = itens.get(origem)
+        valores = dict(nome=ev["nome"], tipo=ev["tipo"], d=ev["data_evento"], hi=ev["hora_inicio"],
+                       hf=ev["hora_fim"], duracao=ev["duracao"], profissional=ev["profissional__nome"],
+                       clinica=ev["clinica__nome"], notas=ev["notas"])
+        if item is None or not _na_serie(ev["data_evento"], item, inicio_serie.get(origem)):
+            uid = (f"rotinaitem-{origem}-{ev['data_evento']:%Y%m%d}@therapytrack" if item
+                   else f"evento-{ev['pk']}@therapytrack")
+            bloco += _vevent(uid, dtstamp, tzid, **valores)
+        elif _alterado(ev, item):
+            recorrencia = _prop_data("RECURRENCE-ID", ev["data_evento"], item["hora_inicio"], tzid)
+            bloco += _vevent(f"rotinaitem-{origem}@therapytrack", dtstamp, tzid, extras=[recorrencia], **valores)
+        if len(bloco) >= LINHAS_POR_BLOCO:
+            yield "".join(map(_dobrar, bloco))
+            bloco = []
+
+    bloco.append("END:VCALENDAR")
+    yield "".join(map(_dobrar, bloco))
+
+
+def _regra(it: dict) -> RotinaItem:
+    return RotinaItem(periodicidade=it["periodicidade"], dias_semana=it["dias_semana"])
+
+
+def _na_serie(d: date, item: dict, inicio: Optional[date]) -> bool:
+    """A data é uma das repetições da RRULE do item (que começa em `inicio`)?"""
+    if inicio is None or d < inicio:
+        return False
+    return bool(_datas_do_item(_regra(item), d, d, ancora=item["rotina__data_inicio"]))
+
+
+def _alterado(ev: dict, item: dict) -> bool:
+    """O Evento gravado difere do que a RRULE do item já descreve?"""
+    return (ev["nome"] != item["nome_evento"] or ev["hora_inicio"] != item["hora_inicio"]
+            or ev["hora_fim"] != item["hora_fim"] or ev["profissional_id"] != item["profissional_id"]
+            or ev["clinica_id"] != item["clinica_id"] or (ev["notas"] or None) != (item["descricao"] or None))
@@ -0,0 +1,518 @@
+# terapias/importacao.py
+"""
+Importação em massa de agendas já existentes (CSV ou iCalendar) para Evento.
+
+- Os arquivos são lidos em streaming, linha a linha: o que fica em memória é
+  o lote corrente e o conjunto de chaves já vistas.
+- Profissional e Clínica são resolvidos pelo nome (sem diferenciar
+  maiúsculas/acentos) com dicionários montados uma vez a partir dos cadastros
+  do usuário; nomes que não existem deixam o campo vazio e são relatados.
+- Duplicados, no próprio arquivo ou já gravados, são pulados pela chave
+  (criança, data_evento, hora_inicio, nome). O banco é consultado uma vez
+  por lote, só na faixa de datas do lote.
+- A gravação vai por services._gravar_eventos (bulk_create + ResumoMensal +
+  versão da agenda), tudo numa transação só.
+
+CSV: cabeçalho com nome e data (obrigatórios) e, opcionalmente, tipo,
+hora_inicio, hora_fim, profissional, clinica, notas e presenca. Datas em
+AAAA-MM-DD ou DD/MM/AAAA; separador "," ou ";".
+
+iCalendar: cada VEVENT vira um Evento (SUMMARY -> nome, LOCATION -> clínica,
+DESCRIPTION -> notas; as linhas "Tipo:" e "Profissional:" escritas por
+terapias.ical são reconhecidas). RRULEs simples são expandidas até o
+UNTIL/COUNT (no máximo MAX_COUNT_RRULE ocorrências) ou HORIZONTE_RRULE dias
+à frente, respeitando EXDATE e as ocorrências alteradas (RECURRENCE-ID).
+Uma RRULE com parte inválida (INTERVAL, UNTIL, COUNT, BYDAY...) rejeita só
+o seu VEVENT.
+"""
+import csv
+import re
+import unicodedata
+from collections import Counter
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from itertools import islice
+from typing import Iterable, Iterator, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Clinica, Evento, Profissional
+from .services import _calcular_duracao, _default_tipo_evento, _gravar_eventos
+from .variaveis_categoricas import TIPOS_EVENTO
+
+BATCH_SIZE_IMPORTACAO = 5000
+MAX_ERROS_RELATADOS = 100
+HORIZONTE_RRULE = 365  # dias à frente de hoje para RRULE sem UNTIL/COUNT
+MAX_COUNT_RRULE = 1000  # teto do COUNT de uma RRULE (ocorrências por série)
+
+# (linha do arquivo, campos, motivo da rejeição ou None)
+Registro = Tuple[int, dict, Optional[str]]
+
+
+def _normalizar(texto: str) -> str:
+    """Chave de comparação de nomes: sem acentos, sem caixa, espaços colapsados."""
+    sem_acento = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode()
+    return " ".join(sem_acento.casefold().split())
+
+
+# ---------------- CSV ----------------
+
+_COLUNAS = {
+    "nome": "nome", "titulo": "nome", "evento": "nome",
+    "tipo": "tipo",
+    "data": "data", "data_evento": "data", "dia": "data",
+    "hora_inicio": "hora_inicio", "inicio": "hora_inicio", "hora": "hora_inicio",
+    "hora_fim": "hora_fim", "fim": "hora_fim", "termino": "hora_fim",
+    "profissional": "profissional",
+    "clinica": "clinica", "local": "clinica",
+    "notas": "notas", "observacoes": "notas", "descricao": "notas",
+    "presenca": "presenca", "presenca_confirmada": "presenca", "compareceu": "presenca",
+}
+
+
+def ler_csv(linhas: Iterable[str]) -> Iterator[Registro]:
+    """Registros de um CSV (iterável de linhas de texto, ex.: arquivo aberto)."""
+    linhas = iter(linhas)
+    cabecalho = next(linhas, "").lstrip("﻿")
+    separador = ";" if cabecalho.count(";") > cabecalho.count(",") else ","
+    nomes = next(csv.reader([cabecalho], delimiter=separador), [])
+    colunas = [_COLUNAS.get(_normalizar(n).replace(" ", "_")) for n in nomes]
+    if "nome" not in colunas or "data" not in colunas:
+        raise ValueError("O CSV precisa das colunas 'nome' e 'data'.")
+
+    leitor = csv.reader(linhas, delimiter=separador)
+    for valores in leitor:
+        if not any(v.strip() for v in valores):
+            continue
+        campos = {c: v.strip() for c, v in zip(colunas, valores) if c and v.strip()}
+        yield leitor.line_num + 1, campos, None  # +1: o cabeçalho foi lido à parte
+
+
+# ---------------- iCalendar ----------------
+
+_DIAS_ICS = {"MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4, "SA": 5, "SU": 6}
+_REGRAS_SUPORTADAS = {"FREQ", "INTERVAL", "UNTIL", "COUNT", "BYDAY", "BYMONTHDAY", "BYMONTH", "WKST"}
+_DURACAO = re.compile(r"^P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+
+
+def _desdobrar(linhas: Iterable[str]) -> Iterator[Tuple[int, str]]:
+    """Junta as continuações (RFC 5545 §3.1); devolve (nº da primeira linha, conteúdo)."""
+    atual, inicio = None, 0
+    for n, linha in enumerate(linhas, 1):
+        linha = linha.rstrip("\r\n")
+        if linha[:1] in (" ", "\t") and atual is not None:
+            atual += linha[1:]
+            continue
+        if atual:
+            yield inicio, atual
+        atual, inicio = linha.lstrip("﻿"), n
+    if atual:
+        yield inicio, atual
+
+
+def _propriedade(linha: str):
+    """'DTSTART;TZID=X:20250101T090000' -> ('DTSTART', {'TZID': 'X'}, '20250101T090000')"""
+    aspas = False
+    for i, ch in enumerate(linha):
+        if ch == '"':
+            aspas = not aspas
+        elif ch == ":" and not aspas:
+            break
+    else:
+        return None, {}, ""
+    nome, *params = linha[:i].split(";")
+    parametros = {}
+    for p in params:
+        chave, _, valor = p.partition("=")
+        parametros[chave.upper()] = valor.strip('"')
+    return nome.upper(), parametros, linha[i + 1:]
+
+
+def _desescapar(texto: str) -> str:
+    return re.sub(r"\\([\\;,nN])", lambda m: "\n" if m.group(1) in "nN" else m.group(1), texto)
+
+
+def _data_hora(parametros: dict, valor: str, tz_local) -> Tuple[date, Optional[time]]:
+    """DATE ou DATE-TIME (UTC, TZID ou flutuante) -> (data, hora) no fuso local."""
+    valor = valor.strip()
+    if parametros.get("VALUE") == "DATE" or len(valor) == 8:
+        return datetime.strptime(valor[:8], "%Y%m%d").date(), None
+    utc = valor.endswith("Z")
+    dt = datetime.strptime(valor.rstrip("Z")[:15], "%Y%m%dT%H%M%S")
+    if utc:
+        dt = dt.replace(tzinfo=dt_timezone.utc).astimezone(tz_local)
+    elif "TZID" in parametros:
+        try:
+            dt = dt.replace(tzinfo=ZoneInfo(parametros["TZID"])).astimezone(tz_local)
+        except (ZoneInfoNotFoundError, ValueError):
+            pass  # TZID fora da base IANA (ex.: nomes do Windows): trata como hora local
+    return dt.date(), dt.time().replace(second=0, microsecond=0)
+
+
+def _duracao(valor: str) -> Optional[timedelta]:
+    m = _DURACAO.match(valor.strip().lstrip("+"))
+    if not m:
+        return None
+    semanas, dias, horas, minutos, segundos = (int(x or 0) for x in m.groups())
+    return timedelta(weeks=semanas, days=dias, hours=horas, minutes=minutos, seconds=segundos)
+
+
+def _campos_do_vevent(props: dict, tz_local) -> dict:
+    params, valor = props["DTSTART"][0]
+    d, hi = _data_hora(params, valor, tz_local)
+    hf = None
+    if "DTEND" in props and hi is not None:
+        d_fim, hf = _data_hora(*props["DTEND"][0], tz_local)
+        if d_fim != d:
+            hf = None  # passa da meia-noite: Evento tem uma data só
+    elif "DURATION" in props and hi is not None:
+        dur = _duracao(props["DURATION"][0][1])
+        if dur and datetime.combine(d, hi) + dur < datetime.combine(d + timedelta(days=1), time(0)):
+            hf = (datetime.combine(d, hi) + dur).time()
+
+    campos = {"data": d, "hora_inicio": hi, "hora_fim": hf}
+    if "SUMMARY" in props:
+        campos["nome"] = _desescapar(props["SUMMARY"][0][1]).strip()
+    if "LOCATION" in props:
+        campos["clinica"] = _desescapar(props["LOCATION"][0][1]).strip()
+
+    notas = []
+    for linha in _desescapar(props["DESCRIPTION"][0][1]).splitlines() if "DESCRIPTION" in props else ():
+        rotulo, sep, resto = linha.partition(":")
+        if sep and _normalizar(rotulo) in ("tipo", "profissional") and _normalizar(rotulo) not in campos:
+            campos[_normalizar(rotulo)] = resto.strip()
+        else:
+            notas.append(linha)
+    if "\n".join(notas).strip():
+        campos["notas"] = "\n".join(notas).strip()
+    return campos
+
+
+def _regra(valor: str) -> dict:
+    return dict(p.partition("=")[::2] for p in valor.upper().split(";") if p)
+
+
+def _dias_no_mes(ano: int, mes: int, regra: dict, dia_padrao: int) -> list:
+    ultimo = (date(ano + mes // 12, mes % 12 + 1, 1) - timedelta(days=1)).day
+    if "BYDAY" in regra:
+        datas = []
+        for item in regra["BYDAY"].split(","):
+            ordem, wd = item[:-2], _DIAS_ICS[item[-2:]]
+            todos = [d for d in range(1, ultimo + 1) if date(ano, mes, d).weekday() == wd]
+            if not ordem:
+                datas += todos
+            elif -len(todos) <= int(ordem) <= len(todos) and int(ordem):
+                datas.append(todos[int(ordem) - 1 if int(ordem) > 0 else int(ordem)])
+        return datas
+    dias = [int(x) for x in regra["BYMONTHDAY"].split(",")] if "BYMONTHDAY" in regra else [dia_padrao]
+    # dia que não existe no mês não gera ocorrência (RFC 5545), ao contrário das rotinas
+    return [d if d > 0 else ultimo + 1 + d for d in dias if 1 <= (d if d > 0 else ultimo + 1 + d) <= ultimo]
+
+
+def _datas_rrule(regra: dict, inicio: date, ate: date) -> Iterator[date]:
+    """Datas da RRULE a partir de DTSTART (inclusive), em ordem, até `ate`."""
+    freq, passo = regra["FREQ"], int(regra.get("INTERVAL") or 1)
+    if freq == "DAILY":
+        d = inicio
+        while d <= ate:
+            yield d
+            d += timedelta(days=passo)
+    elif freq == "WEEKLY":
+        dias = sorted({_DIAS_ICS[x[-2:]] for x in regra["BYDAY"].split(",")}) if "BYDAY" in regra \
+            else [inicio.weekday()]
+        semana = inicio - timedelta(days=inicio.weekday())
+        while semana <= ate:
+            for wd in dias:
+                d = semana + timedelta(days=wd)
+                if inicio <= d <= ate:
+                    yield d
+            semana += timedelta(weeks=passo)
+    elif freq in ("MONTHLY", "YEARLY"):
+        meses_do_ano = [int(x) for x in regra["BYMONTH"].split(",")] if "BYMONTH" in regra else [inicio.month]
+        ano, mes = inicio.year, inicio.month
+        while date(ano, mes, 1) <= ate:
+            for m in ([mes] if freq == "MONTHLY" else sorted(meses_do_ano)):
+                for dia in sorted(_dias_no_mes(ano, m, regra, inicio.day)):
+                    d = date(ano, m, dia)
+                    if inicio <= d <= ate:
+                        yield d
+            if freq == "MONTHLY":
+                mes += passo
+                ano, mes = ano + (mes - 1) // 12, (mes - 1) % 12 + 1
+            else:
+                ano += passo
+
+
+def _suportada(regra: dict) -> bool:
+    freq = regra.get("FREQ")
+    if freq not in ("DAILY", "WEEKLY", "MONTHLY", "YEARLY") or set(regra) - _REGRAS_SUPORTADAS:
+        return False
+    intervalo = regra.get("INTERVAL", "1")
+    if not intervalo.isdigit() or int(intervalo) < 1:  # INTERVAL=0 não avança nunca
+        return False
+    if freq == "DAILY":
+        return not {"BYDAY", "BYMONTHDAY", "BYMONTH"} & set(regra)
+    if freq == "WEEKLY":
+        return not {"BYMONTHDAY", "BYMONTH"} & set(regra) and not re.search(r"\d", regra.get("BYDAY", ""))
+    if freq == "MONTHLY":
+        return "BYMONTH" not in regra
+    return "BYDAY" not in regra or "BYMONTH" in regra  # YEARLY com BYDAY só dentro de meses dados
+
+
+_BYDAY = re.compile(r"^([+-]?\d{1,2})?(MO|TU|WE|TH|FR|SA|SU)$")
+
+
+def _erro_na_regra(regra: dict, tz_local) -> Optional[str]:
+    """
+    Confere as partes que _expandir/_datas_rrule interpretam, antes de a série
+    ser guardada: o que falhar aqui rejeita só o VEVENT. Limita o COUNT a
+    MAX_COUNT_RRULE (no lugar). Retorna o motivo, ou None se a regra serve.
+    """
+    if "UNTIL" in regra:
+        try:
+            _data_hora({}, regra["UNTIL"], tz_local)
+        except ValueError:
+            return f"UNTIL={regra['UNTIL']}"
+    if "COUNT" in regra:
+        if not regra["COUNT"].isdigit() or int(regra["COUNT"]) < 1:
+            return f"COUNT={regra['COUNT']}"
+        regra["COUNT"] = str(min(int(regra["COUNT"]), MAX_COUNT_RRULE))
+    for item in filter(None, regra.get("BYDAY", "").split(",")):
+        if not _BYDAY.match(item):
+            return f"BYDAY={item}"
+    for item in filter(None, regra.get("BYMONTHDAY", "").split(",")):
+        if not re.fullmatch(r"[+-]?\d{1,2}", item) or not 1 <= abs(int(item)) <= 31:
+            return f"BYMONTHDAY={item}"
+    for item in filter(None, regra.get("BYMONTH", "").split(",")):
+        if not item.isdigit() or not 1 <= int(item) <= 12:
+            return f"BYMONTH={item}"
+    return None
+
+
+def _expandir(campos: dict, regra: dict, excluidas: set, tz_local) -> Iterator[dict]:
+    if "UNTIL" in regra:
+        ate = _data_hora({}, regra["UNTIL"], tz_local)[0]
+    elif "COUNT" in regra:
+        ate = date.max - timedelta(days=400)  # o islice abaixo é quem para
+    else:
+        ate = timezone.localdate() + timedelta(days=HORIZONTE_RRULE)
+    datas = _datas_rrule(regra, campos["data"], ate)
+    if "COUNT" in regra:
+        datas = islice(datas, int(regra["COUNT"]))
+    for d in datas:
+        if d not in excluidas:
+            yield {**campos, "data": d}
+
+
+def ler_ics(linhas: Iterable[str]) -> Iterator[Registro]:
+    """
+    Registros de um .ics. Os VEVENTs simples saem na hora; os que têm RRULE
+    (poucos) ficam guardados e são expandidos no fim, quando já se conhecem
+    as ocorrências alteradas (RECURRENCE-ID) do mesmo UID.
+    """
+    tz_local = timezone.get_current_timezone()
+    series, alteradas = [], set()
+    props, aninhado, inicio = None, 0, 0
+
+    for n, linha in _desdobrar(linhas):
+        nome, parametros, valor = _propriedade(linha)
+        if nome == "BEGIN":
+            if valor.upper() == "VEVENT" and props is None:
+                props, inicio = {}, n
+            elif props is not None:
+                aninhado += 1  # VALARM etc.
+            continue
+        if nome == "END" and props is not None:
+            if aninhado:
+                aninhado -= 1
+                continue
+            evento, props = props, None
+            yield from _registro_do_vevent(inicio, evento, tz_local, series, alteradas)
+            continue
+        if props is not None and not aninhado and nome:
+            props.setdefault(nome, []).append((parametros, valor))
+
+    for inicio, campos, regra, uid, exdates in series:
+        excluidas = exdates | {d for u, d in alteradas if u == uid}
+        for ocorrencia in _expandir(campos, regra, excluidas, tz_local):
+            yield inicio, ocorrencia, None
+
+
+def _registro_do_vevent(inicio: int, props: dict, tz_local, series: list, alteradas: set) -> Iterator[Registro]:
+    uid = props["UID"][0][1] if "UID" in props else None
+    if "DTSTART" not in props:
+        yield inicio, {}, "VEVENT sem DTSTART"
+        return
+    if props.get("STATUS", [({}, "")])[0][1].upper() == "CANCELLED":
+        yield inicio, {}, "evento cancelado (STATUS:CANCELLED)"
+        return
+    try:
+        campos = _campos_do_vevent(props, tz_local)
+        if "RECURRENCE-ID" in props:
+            alteradas.add((uid, _data_hora(*props["RECURRENCE-ID"][0], tz_local)[0]))
+        if "RRULE" not in props:
+            yield inicio, campos, None
+            return
+        regra = _regra(props["RRULE"][0][1])
+        if not _suportada(regra):
+            yield inicio, {}, f"RRULE não suportada: {props['RRULE'][0][1]}"
+            return
+        erro = _erro_na_regra(regra, tz_local)
+        if erro:
+            yield inicio, {}, f"RRULE inválida ({erro}): {props['RRULE'][0][1]}"
+            return
+        exdates = {_data_hora(p, v, tz_local)[0] for p, vs in props.get("EXDATE", []) for v in vs.split(",")}
+        series.append((inicio, campos, regra, uid, exdates))
+    except (ValueError, KeyError, IndexError) as e:
+        yield inicio, {}, f"data/hora inválida ({e})"
+
+
+# ---------------- gravação ----------------
+
+def _tabela_por_nome(qs) -> dict:
+    """{nome normalizado: pk}; havendo homônimos, fica o cadastro mais antigo."""
+    tabela = {}
+    for pk, nome in qs.order_by("-pk").values_list("pk", "nome"):
+        tabela[_normalizar(nome)] = pk
+    return tabela
+
+
+def _ler_data(valor) -> date:
+    if isinstance(valor, date):
+        return valor
+    try:
+        return date.fromisoformat(valor)  # o caso comum, bem mais barato que strptime
+    except ValueError:
+        pass
+    for formato in ("%d/%m/%Y", "%d/%m/%y"):
+        try:
+            return datetime.strptime(valor, formato).date()
+        except ValueError:
+            pass
+    raise ValueError(f"data inválida: {valor!r}")
+
+
+def _ler_hora(valor) -> Optional[time]:
+    if valor is None or isinstance(valor, time):
+        return valor
+    texto = valor.strip().lower().replace("h", ":")  # aceita também "9h" e "9h30"
+    texto = texto + "00" if texto.endswith(":") else texto
+    try:
+        return time.fromisoformat(texto.zfill(5) if len(texto) < 5 else texto)
+    except ValueError:
+        raise ValueError(f"hora inválida: {valor!r}") from None
+
+
+class _Contexto:
+    """O que é carregado uma vez por importação e usado em cada linha."""
+
+    def __init__(self, crianca, usuario):
+        self.crianca = crianca
+        self.usuario = usuario
+        self.profissionais = _tabela_por_nome(Profissional.objects.filter(criado_por=usuario))
+        self.clinicas = _tabela_por_nome(Clinica.objects.filter(criado_por=usuario))
+        self.tipos = {}
+        for chave, rotulo in TIPOS_EVENTO:
+            self.tipos[_normalizar(chave)] = self.tipos[_normalizar(rotulo)] = chave
+        self.tipo_padrao = _default_tipo_evento()
+        self.nao_encontrados = Counter()
+
+    def _resolver(self, tabela: dict, valor: Optional[str], rotulo: str) -> Optional[int]:
+        if not valor:
+            return None
+        pk = tabela.get(_normalizar(valor))
+        if pk is None:
+            self.nao_encontrados[f"{rotulo}: {valor}"] += 1
+        return pk
+
+    def evento(self, campos: dict) -> Evento:
+        nome = (campos.get("nome") or "").strip()[:100]
+        if not nome:
+            raise ValueError("sem nome")
+        if not campos.get("data"):
+            raise ValueError("sem data")
+        tipo = self.tipo_padrao
+        if campos.get("tipo"):
+            tipo = self.tipos.get(_normalizar(campos["tipo"]))
+            if tipo is None:
+                raise ValueError(f"tipo desconhecido: {campos['tipo']!r}")
+        hi, hf = _ler_hora(campos.get("hora_inicio")), _ler_hora(campos.get("hora_fim"))
+        if hi and hf and hf <= hi:
+            raise ValueError("término antes do início")
+        return Evento(
+            nome=nome, tipo=tipo, data_evento=_ler_data(campos["data"]),
+            hora_inicio=hi, hora_fim=hf, duracao=_calcular_duracao(hi, hf),
+            profissional_id=self._resolver(self.profissionais, campos.get("profissional"), "profissional"),
+            clinica_id=self._resolver(self.clinicas, campos.get("clinica"), "clínica"),
+            crianca=self.crianca, criado_por=self.usuario, notas=campos.get("notas") or None,
+            presenca_confirmada=_normalizar(str(campos.get("presenca") or "")) in ("sim", "s", "1", "true", "x", "yes"),
+        )
+
+
+def _gravar_lote(lote: list, crianca, resultado: dict, batch_size: int, dry_run: bool):
+    """Tira o que já está no banco (uma query na faixa de datas do lote) e grava o resto."""
+    de = min(ev.data_evento for ev in lote)
+    ate = max(ev.data_evento for ev in lote)
+    existentes = set(Evento.objects.filter(crianca=crianca, data_evento__range=(de, ate))
+                     .values_list("data_evento", "hora_inicio", "nome"))
+    novos = [ev for ev in lote if (ev.data_evento, ev.hora_inicio, ev.nome) not in existentes]
+    resultado["duplicados"] += len(lote) - len(novos)
+    resultado["criados"] += len(novos)
+    if novos and not dry_run:
+        _gravar_eventos(novos, batch_size)
+
+
+def importar(registros: Iterable[Registro], crianca, usuario, *, batch_size: int = BATCH_SIZE_IMPORTACAO,
+             dry_run: bool = False) -> dict:
+    """
+    Grava os registros (de ler_csv/ler_ics) como Eventos da criança.
+
+    Retorna {"criados", "duplicados", "rejeitados", "erros": [(linha, motivo)]
+    (só os primeiros MAX_ERROS_RELATADOS), "nao_encontrados": {nome: linhas}}.
+    dry_run conta tudo igual, sem gravar.
+    """
+    ctx = _Contexto(crianca, usuario)
+    resultado = {"criados": 0, "duplicados": 0, "rejeitados": 0, "erros": []}
+    vistos, lote = set(), []
+
+    with transaction.atomic():
+        for linha, campos, motivo in registros:
+            if motivo is None:
+                try:
+                    ev = ctx.evento(campos)
+                except ValueError as e:
+                    motivo = str(e)
+            if motivo is not None:
+                resultado["rejeitados"] += 1
+                if len(resultado["erros"]) < MAX_ERROS_RELATADOS:
+                    resultado["erros"].append((linha, motivo))
+                continue
+
+            chave = (ev.data_evento, ev.hora_inicio, ev.nome)
+            if chave in vistos:
+                resultado["duplicados"] += 1
+                continue
+            vistos.add(chave)
+            lote.append(ev)
+            if len(lote) >= batch_size:
+                _gravar_lote(lote, crianca, resultado, batch_size, dry_run)
+                lote = []
+        if lote:
+            _gravar_lote(lote, crianca, resultado, batch_size, dry_run)
+
+    resultado["nao_encontrados"] = dict(ctx.nao_encontrados.most_common())
+    return resultado
+
+
+def ler_arquivo(linhas: Iterable[str], formato: str) -> Iterator[Registro]:
+    """formato: "csv" ou "ics"."""
+    if formato == "ics":
+        return ler_ics(linhas)
+    if formato == "csv":
+        return ler_csv(linhas)
+    raise ValueError(f"formato desconhecido: {formato!r}")
+
+
+def formato_pelo_nome(nome: str) -> str:
+    return "ics" if nome.lower().endswith((".ics", ".ical", ".ifb")) else "csv"
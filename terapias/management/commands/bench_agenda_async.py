@@ -0,0 +1,106 @@
+import socket
+import statistics
+import threading
+import time as _time
+import urllib.request
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.utils import override_settings
+
+from terapias.benchmarks import escolher_alvo
+from terapias.sintetico import PREFIXO_USUARIO
+
+
+class Command(BaseCommand):
+    help = ("Compara a latência da agenda síncrona (/) com a assíncrona (/agenda/async/) num uvicorn local, "
+            "com latência de banco simulada em cada query e em cada conexão aberta.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requisicoes", type=int, default=30, help="Requests medidas por view.")
+        parser.add_argument("--latencia-ms", type=float, default=5.0,
+                            help="Atraso somado a cada query (e a cada conexão nova), simulando a rede até o banco.")
+        parser.add_argument("--com-cache", action="store_true",
+                            help="Mantém o cache de fragmentos entre as requests (padrão: limpa antes de cada uma).")
+        parser.add_argument("--usuario", type=int, default=0, help="Índice do usuário sintético usado como alvo.")
+        parser.add_argument("--prefixo", default=PREFIXO_USUARIO)
+
+    def handle(self, *args, **opts):
+        try:
+            import uvicorn
+        except ImportError:
+            raise CommandError("uvicorn não está instalado.")
+        try:
+            alvo = escolher_alvo(opts["usuario"], opts["prefixo"])
+        except LookupError as e:
+            raise CommandError(str(e))
+
+        if not settings.DATABASES["default"].get("CONN_MAX_AGE"):
+            self.stdout.write(self.style.WARNING(
+                "CONN_MAX_AGE = 0: cada fragmento da view assíncrona abre uma conexão nova por request "
+                "(defina DB_CONN_MAX_AGE)."))
+
+        cliente = Client()
+        cliente.force_login(alvo.usuario)
+        cookie = f"{settings.SESSION_COOKIE_NAME}={cliente.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+        latencia = opts["latencia_ms"] / 1000
+
+        def atrasar(execute, sql, params, many, context):
+            _time.sleep(latencia)
+            return execute(sql, params, many, context)
+
+        def ao_conectar(sender, connection, **kwargs):
+            _time.sleep(latencia)
+            connection.execute_wrappers.append(atrasar)
+
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            porta = s.getsockname()[1]
+        servidor = uvicorn.Server(uvicorn.Config("therapytrack.asgi:application", host="127.0.0.1", port=porta,
+                                                 log_level="warning", lifespan="off"))
+
+        connection_created.connect(ao_conectar)
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "127.0.0.1"]):
+                thread = threading.Thread(target=servidor.run, daemon=True)
+                thread.start()
+                while not servidor.started:
+                    if not thread.is_alive():
+                        raise CommandError("uvicorn não subiu.")
+                    _time.sleep(0.05)
+
+                consulta = f"?crianca={alvo.crianca.pk}&d={alvo.semana_pesada:%Y-%m-%d}"
+                urls = {"síncrona": f"http://127.0.0.1:{porta}/{consulta}",
+                        "assíncrona": f"http://127.0.0.1:{porta}/agenda/async/{consulta}"}
+                tempos = {nome: [] for nome in urls}
+                for rodada in range(opts["requisicoes"] + 1):
+                    for nome, url in urls.items():
+                        if not opts["com_cache"]:
+                            cache.clear()  # o cache é do processo, o mesmo do uvicorn
+                        t0 = _time.perf_counter()
+                        with urllib.request.urlopen(urllib.request.Request(url, headers={"Cookie": cookie})) as r:
+                            r.read()
+                        if rodada:  # a primeira só aquece (conexões, templates)
+                            tempos[nome].append(_time.perf_counter() - t0)
+        finally:
+            servidor.should_exit = True
+            connection_created.disconnect(ao_conectar)
+            cliente.logout()
+
+        self.stdout.write(f"Alvo: {alvo.usuario.username} / {alvo.crianca.nome}, semana de "
+                          f"{alvo.semana_pesada:%d/%m/%Y}; latência simulada {opts['latencia_ms']:g} ms/query; "
+                          f"{opts['requisicoes']} requests por view.")
+        self.stdout.write(f"  {'view':<12} {'mediana':>10} {'p95':>10} {'melhor':>10}")
+        medianas = {}
+        for nome, ts in tempos.items():
+            medianas[nome] = statistics.median(ts)
+            p95 = statistics.quantiles(ts, n=20)[-1] if len(ts) > 1 else ts[0]
+            self.stdout.write(f"  {nome:<12} {medianas[nome] * 1000:8.1f}ms {p95 * 1000:8.1f}ms "
+                              f"{min(ts) * 1000:8.1f}ms")
+        variacao = medianas["assíncrona"] / medianas["síncrona"] - 1
+        estilo = self.style.SUCCESS if variacao < 0 else self.style.WARNING
+        self.stdout.write(estilo(f"Mediana da assíncrona: {variacao:+.0%} em relação à síncrona."))
@@ -0,0 +1,115 @@
+import gc
+import random
+import time as _time
+import tracemalloc
+from datetime import date, time, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from terapias.models import Clinica, Evento, Profissional, Rotina, RotinaItem
+from terapias.services import linhas_no_intervalo, ocorrencias_no_intervalo
+from terapias.variaveis_categoricas import TIPOS_DIA_SEMANA
+from usuario.models import Crianca
+
+
+def _grade_instancias(crianca, ini, fim):
+    """Caminho antigo: Eventos completos com select_related e grade em dicts por (dia, hora)."""
+    horas = [time(h, 0) for h in range(8, 21)]
+    grade = {key: {h: [] for h in horas} for key, _ in TIPOS_DIA_SEMANA}
+    chaves = [key for key, _ in TIPOS_DIA_SEMANA]
+    for ev in ocorrencias_no_intervalo(crianca, ini, fim):
+        hcell = time(ev.hora_inicio.hour, 0) if ev.hora_inicio else horas[0]
+        grade[chaves[ev.data_evento.weekday()]][hcell].append(ev)
+    return [{"hora": h, "cells": [{"dia_key": k, "events": grade[k][h]} for k in chaves]} for h in horas]
+
+
+def _grade_projecao(crianca, ini, fim):
+    """Caminho novo: LinhaAgenda (values_list) e grade montada numa passada."""
+    horas = [time(h, 0) for h in range(8, 21)]
+    rows = [{"hora": h, "cells": [{"dia_key": k, "events": []} for k, _ in TIPOS_DIA_SEMANA]} for h in horas]
+    for ln in linhas_no_intervalo(crianca, ini, fim):
+        i = min(max(ln.hora_inicio.hour - 8, 0), len(horas) - 1) if ln.hora_inicio else 0
+        rows[i]["cells"][ln.data_evento.weekday()]["events"].append(ln)
+    return rows
+
+
+class Command(BaseCommand):
+    help = ("Compara tempo e alocações (tracemalloc) da grade semanal montada com instâncias de "
+            "Evento vs. a projeção LinhaAgenda, numa semana sintética. Tudo é desfeito no fim.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--eventos", type=int, default=2000, help="Eventos gravados na semana.")
+        parser.add_argument("--itens", type=int, default=50, help="RotinaItems diários (ocorrências calculadas).")
+        parser.add_argument("--repeticoes", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **opts):
+        with transaction.atomic():
+            crianca, ini, fim = self._popular(opts)
+            caminhos = (("instancias", _grade_instancias), ("projecao", _grade_projecao))
+
+            resultados = {}
+            for nome, fn in caminhos:
+                fn(crianca, ini, fim)  # aquece (conexão, ContentTypes, compilação das queries)
+                melhor = float("inf")
+                for _ in range(opts["repeticoes"]):
+                    t0 = _time.perf_counter()
+                    fn(crianca, ini, fim)
+                    melhor = min(melhor, _time.perf_counter() - t0)
+
+                gc.collect()
+                tracemalloc.start()
+                rows = fn(crianca, ini, fim)
+                retido, pico = tracemalloc.get_traced_memory()
+                blocos = sum(s.count for s in tracemalloc.take_snapshot().statistics("filename"))
+                tracemalloc.stop()
+
+                n = sum(len(c["events"]) for r in rows for c in r["cells"])
+                resultados[nome] = (melhor, pico, retido, blocos)
+                self.stdout.write(f"  {nome:<11} {melhor * 1000:8.1f} ms  pico {pico / 1024:8.0f} KiB  "
+                                  f"retido {retido / 1024:8.0f} KiB  {blocos:7d} blocos  ({n} ocorrências)")
+                del rows
+
+            a, b = resultados["instancias"], resultados["projecao"]
+            self.stdout.write(self.style.SUCCESS(
+                f"tempo {a[0] / b[0]:.1f}x menor, pico de memória {a[1] / b[1]:.1f}x menor, "
+                f"blocos retidos {a[3] / max(b[3], 1):.1f}x menos"
+            ))
+            transaction.set_rollback(True)
+
+    def _popular(self, opts):
+        rng = random.Random(opts["seed"])
+        hoje = date.today()
+        ini = hoje - timedelta(days=hoje.weekday())
+        fim = ini + timedelta(days=6)
+
+        user = User.objects.create(username=f"bench-grade-{rng.random()}")
+        crianca = Crianca.objects.create(nome="Bench", condicao="-", data_nascimento=date(2018, 1, 1),
+                                         responsavel=user)
+        clinicas = [Clinica.objects.create(nome=f"Clínica {i}", criado_por=user) for i in range(5)]
+        profissionais = [Profissional.objects.create(nome=f"Profissional {i}", tipo="medico", criado_por=user)
+                         for i in range(10)]
+
+        Evento.objects.bulk_create([
+            Evento(nome=f"Consulta {i}", tipo="consulta", crianca=crianca, criado_por=user,
+                   data_evento=ini + timedelta(days=rng.randrange(7)),
+                   hora_inicio=time(rng.randrange(8, 20), rng.choice((0, 30))),
+                   hora_fim=time(rng.randrange(8, 20), 50),
+                   profissional=rng.choice(profissionais), clinica=rng.choice(clinicas),
+                   presenca_confirmada=rng.random() < 0.5, notas="x" * 200)
+            for i in range(opts["eventos"])
+        ], batch_size=1000)
+
+        rotina = Rotina.objects.create(crianca=crianca, nome="Bench", data_inicio=ini, criado_por=user)
+        RotinaItem.objects.bulk_create([
+            RotinaItem(rotina=rotina, nome_evento=f"Terapia {i}", periodicidade="diaria",
+                       hora_inicio=time(rng.randrange(8, 20), 0), hora_fim=time(rng.randrange(8, 20), 50),
+                       profissional=rng.choice(profissionais), clinica=rng.choice(clinicas), criado_por=user)
+            for i in range(opts["itens"])
+        ])
+
+        self.stdout.write(f"{opts['eventos']} eventos gravados + {opts['itens']} itens diários "
+                          f"na semana {ini:%d/%m}–{fim:%d/%m}")
+        return crianca, ini, fim
@@ -0,0 +1,140 @@
+import random
+import time as _time
+from datetime import date, time, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from terapias.models import Evento, Rotina, RotinaItem
+from usuario.models import Crianca
+
+
+class Command(BaseCommand):
+    help = ("Popula uma tabela de eventos sintética e mostra o plano/tempo das consultas "
+            "quentes da agenda sem e com os índices de Evento.Meta.indexes. Tudo é desfeito no fim.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--eventos", type=int, default=200_000)
+        parser.add_argument("--criancas", type=int, default=200)
+        parser.add_argument("--repeticoes", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--planos", action="store_true", help="Imprime o plano completo de cada consulta.")
+
+    def handle(self, *args, **opts):
+        with transaction.atomic():
+            alvo = self._popular(opts)
+            consultas = self._consultas(*alvo)
+
+            self._criar_indices(False)
+            self._analisar()
+            antes = self._medir("sem índices", consultas, opts)
+
+            self._criar_indices(True)
+            self._analisar()
+            depois = self._medir("com índices", consultas, opts)
+
+            self.stdout.write("")
+            for nome in consultas:
+                ganho = antes[nome] / depois[nome] if depois[nome] else float("inf")
+                self.stdout.write(f"  {nome:<12} {antes[nome] * 1000:9.2f} ms -> {depois[nome] * 1000:9.2f} ms  ({ganho:.1f}x)")
+
+            transaction.set_rollback(True)
+
+    # ---------------- dados ----------------
+
+    def _popular(self, opts):
+        rng = random.Random(opts["seed"])
+        hoje = date.today()
+        user = User.objects.create(username=f"bench-indices-{rng.random()}")
+        criancas = Crianca.objects.bulk_create([
+            Crianca(nome=f"Bench {i}", condicao="-", data_nascimento=date(2018, 1, 1), responsavel=user)
+            for i in range(opts["criancas"])
+        ])
+        rotinas = Rotina.objects.bulk_create([
+            Rotina(crianca=c, nome="Bench", data_inicio=hoje - timedelta(days=365), criado_por=user)
+            for c in criancas
+        ])
+        itens = RotinaItem.objects.bulk_create([
+            RotinaItem(rotina=r, nome_evento="Bench", periodicidade="diaria", criado_por=user)
+            for r in rotinas
+        ])
+
+        t0 = _time.perf_counter()
+        lote = []
+        for i in range(opts["eventos"]):
+            c = rng.randrange(len(criancas))
+            lote.append(Evento(
+                nome="Bench", tipo="consulta",
+                data_evento=hoje + timedelta(days=rng.randrange(-365, 365)),
+                hora_inicio=time(rng.randrange(7, 20), rng.choice((0, 30))),
+                crianca=criancas[c], criado_por=user,
+                presenca_confirmada=rng.random() < 0.8,
+                origem_rotina_item=itens[c] if rng.random() < 0.5 else None,
+            ))
+            if len(lote) == 5000:
+                Evento.objects.bulk_create(lote, ignore_conflicts=True)
+                lote = []
+        Evento.objects.bulk_create(lote, ignore_conflicts=True)
+        self.stdout.write(f"{Evento.objects.count()} eventos em {_time.perf_counter() - t0:.1f}s "
+                          f"({connection.vendor})")
+
+        c = criancas[rng.randrange(len(criancas))]
+        return c, itens[criancas.index(c)], hoje
+
+    def _consultas(self, crianca, item, hoje):
+        semana_ini = hoje - timedelta(days=hoje.weekday())
+        m_ini = hoje.replace(day=1)
+        m_fim = (m_ini + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        base = Evento.objects.filter(crianca=crianca)
+        return {
+            # mesmas formas de ocorrencias_no_intervalo, proximos e indicadores_do_mes
+            "grade": base.filter(data_evento__range=(semana_ini, semana_ini + timedelta(days=6)))
+                         .order_by("data_evento", "hora_inicio"),
+            "proximos": base.filter(data_evento__gte=hoje).order_by("data_evento", "hora_inicio")[:10],
+            "pendentes": base.filter(data_evento__range=(hoje, m_fim), presenca_confirmada=False),
+            # sincronizar_eventos_do_item
+            "sincronia": Evento.objects.filter(origem_rotina_item=item, data_evento__gte=hoje),
+        }
+
+    # ---------------- medição ----------------
+
+    def _criar_indices(self, criar: bool):
+        # SQL direto, e não editor.add_index/remove_index: no SQLite o schema
+        # editor não pode ser aberto dentro do atomic() que desfaz o benchmark
+        editor = connection.schema_editor()
+        tabela = editor.quote_name(Evento._meta.db_table)
+        with connection.cursor() as cursor:
+            for index in Evento._meta.indexes:
+                if criar:
+                    sql = str(index.create_sql(Evento, editor))
+                else:
+                    sql = editor.sql_delete_index % {"name": editor.quote_name(index.name), "table": tabela}
+                cursor.execute(sql)
+
+    def _analisar(self):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {Evento._meta.db_table}")
+
+    def _medir(self, titulo, consultas, opts):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n== {titulo} =="))
+        tempos = {}
+        for nome, qs in consultas.items():
+            if connection.vendor == "postgresql":
+                plano = qs.explain(analyze=True, buffers=True)
+            else:
+                plano = qs.explain()
+            melhor = float("inf")
+            for _ in range(opts["repeticoes"]):
+                t0 = _time.perf_counter()
+                list(qs.all())  # .all(): sem o cache de resultados do queryset
+                melhor = min(melhor, _time.perf_counter() - t0)
+            tempos[nome] = melhor
+
+            linhas = plano.splitlines()
+            self.stdout.write(f"{nome:<12} {melhor * 1000:9.2f} ms  {linhas[0].strip() if linhas else ''}")
+            if opts["planos"]:
+                for linha in linhas[1:]:
+                    self.stdout.write(f"{'':14}{linha}")
+        return tempos
@@ -0,0 +1,57 @@
+import random
+import time as _time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from terapias.models import RotinaItem
+from terapias.services import _datas_do_item
+from terapias.variaveis_categoricas import TIPOS_DIA_SEMANA, TIPOS_PERIODICIDADE
+
+
+class Command(BaseCommand):
+    help = "Compara os geradores _datas_* (Python) com datas_vetorizadas (NumPy) em N itens × D dias."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--itens", type=int, default=10_000)
+        parser.add_argument("--dias", type=int, default=365)
+        parser.add_argument("--repeticoes", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **opts):
+        try:
+            from terapias.datas_vetorizadas import datas_em_lote
+        except ImportError:
+            raise CommandError("NumPy não está instalado.")
+
+        rng = random.Random(opts["seed"])
+        periodicidades = [p for p, _ in TIPOS_PERIODICIDADE]
+        dias_semana = [d for d, _ in TIPOS_DIA_SEMANA]
+        inicio = date.today()
+        fim = inicio + timedelta(days=opts["dias"] - 1)
+
+        regras = [
+            (rng.choice(periodicidades), rng.choice(dias_semana), inicio - timedelta(days=rng.randrange(0, 400)))
+            for _ in range(opts["itens"])
+        ]
+        itens = [RotinaItem(periodicidade=p, dias_semana=d) for p, d, _ in regras]
+
+        def python():
+            return sum(len(_datas_do_item(ri, inicio, fim, ancora=a)) for ri, (_, _, a) in zip(itens, regras))
+
+        def numpy():
+            idx, _ = datas_em_lote(regras, inicio, fim)
+            return len(idx)
+
+        self.stdout.write(f"{opts['itens']} itens × {opts['dias']} dias, {opts['repeticoes']} repetição(ões)")
+        tempos = {}
+        for nome, fn in (("python", python), ("numpy", numpy)):
+            melhor, total = float("inf"), None
+            for _ in range(opts["repeticoes"]):
+                t0 = _time.perf_counter()
+                total = fn()
+                melhor = min(melhor, _time.perf_counter() - t0)
+            tempos[nome] = melhor
+            self.stdout.write(f"  {nome:<7} {melhor * 1000:9.1f} ms  ({total} datas)")
+
+        self.stdout.write(self.style.SUCCESS(f"speedup: {tempos['python'] / tempos['numpy']:.1f}x"))
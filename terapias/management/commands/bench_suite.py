@@ -0,0 +1,55 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from terapias.benchmarks import TOLERANCIA_PADRAO, comparar, escolher_alvo, rodar
+from terapias.sintetico import PREFIXO_USUARIO
+
+
+class Command(BaseCommand):
+    help = ("Mede os caminhos quentes (expansão/sincronização de rotinas, agenda, grade da rotina, buscas) "
+            "sobre o dataset sintético: tempo, queries, tempo de SQL e pico de memória. Nada fica gravado.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeticoes", type=int, default=5)
+        parser.add_argument("--usuario", type=int, default=0, help="Índice do usuário sintético usado como alvo.")
+        parser.add_argument("--prefixo", default=PREFIXO_USUARIO)
+        parser.add_argument("--so", action="append", help="Roda só os benchmarks com este trecho no nome (pode repetir).")
+        parser.add_argument("--saida", help="Grava os resultados neste JSON.")
+        parser.add_argument("--comparar", help="JSON de linha de base; sai com erro se houver regressão.")
+        parser.add_argument("--tolerancia", type=float, default=TOLERANCIA_PADRAO,
+                            help="Folga de tempo/memória antes de contar como regressão (padrão: 0.2 = 20%%).")
+
+    def handle(self, *args, **opts):
+        try:
+            alvo = escolher_alvo(opts["usuario"], opts["prefixo"])
+        except LookupError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"Alvo: {alvo.usuario.username} / {alvo.crianca.nome}; semanas "
+                          f"{alvo.semana_leve:%d/%m/%Y} (leve) e {alvo.semana_pesada:%d/%m/%Y} (pesada).")
+        self.stdout.write(f"  {'benchmark':<38} {'melhor':>10} {'mediana':>10} {'queries':>8} "
+                          f"{'sql':>10} {'pico':>10}")
+        resultado = rodar(alvo, repeticoes=opts["repeticoes"], filtro=opts["so"], relatar=self._relatar)
+
+        if opts["saida"]:
+            with open(opts["saida"], "w", encoding="utf-8") as f:
+                json.dump(resultado, f, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Resultados em {opts['saida']}.")
+
+        if opts["comparar"]:
+            try:
+                with open(opts["comparar"], encoding="utf-8") as f:
+                    base = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Não foi possível ler {opts['comparar']}: {e}")
+            regressoes = comparar(resultado, base, opts["tolerancia"])
+            for nome, motivos in regressoes.items():
+                self.stdout.write(self.style.ERROR(f"  {nome}: {'; '.join(motivos)}"))
+            if regressoes:
+                raise CommandError(f"{len(regressoes)} benchmark(s) regrediram em relação a {opts['comparar']}.")
+            self.stdout.write(self.style.SUCCESS(f"Sem regressões em relação a {opts['comparar']}."))
+
+    def _relatar(self, nome: str, r: dict):
+        self.stdout.write(f"  {nome:<38} {r['tempo_ms']:8.1f}ms {r['mediana_ms']:8.1f}ms {r['consultas']:8d} "
+                          f"{r['sql_ms']:8.1f}ms {r['pico_kib']:7.0f}KiB")
@@ -0,0 +1,32 @@
+import csv
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DataError
+
+from terapias.carga import BATCH_SIZE_CARGA, CARGAS, carregar
+
+
+class Command(BaseCommand):
+    help = ("Carga em massa de um CSV (cabeçalho com os nomes dos campos) como clínicas, profissionais, "
+            "crianças ou eventos. No Postgres usa COPY + tabela de staging; nos outros bancos, bulk_create.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("tipo", choices=list(CARGAS))
+        parser.add_argument("arquivo", help="Caminho do CSV (UTF-8). Referências por nome: usuario, crianca, "
+                                            "profissional, clinica.")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE_CARGA,
+                            help="Linhas por lote (só fora do Postgres).")
+
+    def handle(self, *args, **opts):
+        try:
+            with open(opts["arquivo"], encoding="utf-8-sig", newline="") as f:
+                res = carregar(opts["tipo"], csv.DictReader(f), batch_size=opts["batch_size"])
+        except (OSError, ValueError, ValidationError, DataError) as e:
+            raise CommandError(f"Não foi possível carregar {opts['arquivo']}: {e}")
+
+        por_segundo = res["lidos"] / res["segundos"] if res["segundos"] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{res['carregados']} carregado(s), {res['rejeitados']} rejeitado(s) de {res['lidos']} linha(s) "
+            f"em {res['segundos']:.2f}s ({por_segundo:,.0f} linhas/s)."
+        ))
@@ -0,0 +1,87 @@
+import os
+import time as _time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from terapias.sintetico import BATCH_SIZE_SINTETICO, PREFIXO_USUARIO, gerar_faixa
+
+
+def _inicializar_worker():
+    # cada processo abre a própria conexão (nunca herdar o socket do pai)
+    import django
+    django.setup()
+    connections.close_all()
+
+
+def _gerar(ini: int, fim: int, semente: int, params: dict) -> dict:
+    t0 = _time.perf_counter()
+    res = gerar_faixa(ini, fim, semente, **params)
+    return {**res, "faixa": (ini, fim), "segundos": _time.perf_counter() - t0}
+
+
+class Command(BaseCommand):
+    help = ("Gera usuários, crianças, profissionais, clínicas, rotinas e anos de Eventos sintéticos, de forma "
+            "determinística a partir de --semente. Linha de base de 10M eventos: "
+            "--usuarios 9000 --criancas 2 --anos 3 (confira antes com --dry-run).")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--usuarios", type=int, default=100, help="Quantos usuários (padrão: 100).")
+        parser.add_argument("--primeiro", type=int, default=0, help="Índice do primeiro usuário (padrão: 0).")
+        parser.add_argument("--criancas", type=int, default=2, help="Crianças por usuário (padrão: 2).")
+        parser.add_argument("--anos", type=int, default=3, help="Anos de histórico de eventos (padrão: 3).")
+        parser.add_argument("--dias-futuros", type=int, default=30, help="Eventos até hoje + N dias (padrão: 30).")
+        parser.add_argument("--semente", type=int, default=42)
+        parser.add_argument("--hoje", type=date.fromisoformat, default=None,
+                            help="Data de referência AAAA-MM-DD (padrão: hoje). Fixe para reproduzir os dados.")
+        parser.add_argument("--prefixo", default=PREFIXO_USUARIO, help="Prefixo do username.")
+        parser.add_argument("--processos", type=int, default=os.cpu_count() or 1,
+                            help="Tamanho do pool de processos (1 = roda no próprio processo).")
+        parser.add_argument("--lote", type=int, default=20, help="Usuários por transação.")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE_SINTETICO, help="Linhas por INSERT.")
+        parser.add_argument("--dry-run", action="store_true", help="Só conta o que seria gerado, sem gravar.")
+
+    def handle(self, *args, **opts):
+        ini, fim = opts["primeiro"], opts["primeiro"] + opts["usuarios"]
+        semente = opts["semente"]
+        processos = max(1, opts["processos"])
+        params = {
+            "criancas": opts["criancas"], "anos": opts["anos"], "hoje": opts["hoje"] or date.today(),
+            "dias_futuros": opts["dias_futuros"], "prefixo": opts["prefixo"], "lote": opts["lote"],
+            "batch_size": opts["batch_size"], "dry_run": opts["dry_run"],
+        }
+        # faixas do tamanho de alguns lotes: os processos terminam juntos mesmo com usuários de tamanhos diferentes
+        passo = max(opts["lote"], -(-(fim - ini) // (processos * 4)))
+        faixas = [(a, min(a + passo, fim)) for a in range(ini, fim, passo)]
+
+        prefixo = "[dry-run] " if opts["dry_run"] else ""
+        self.stdout.write(f"{prefixo}Usuários {ini}-{fim - 1} (semente {semente}, referência "
+                          f"{params['hoje']:%d/%m/%Y}): {len(faixas)} faixa(s), {processos} processo(s).")
+
+        t0 = _time.perf_counter()
+        resultados = []
+        if processos == 1:
+            for a, b in faixas:
+                resultados.append(self._relatar(_gerar(a, b, semente, params)))
+        else:
+            connections.close_all()  # não levar a conexão do pai para os filhos
+            with ProcessPoolExecutor(max_workers=processos, initializer=_inicializar_worker) as pool:
+                futuros = [pool.submit(_gerar, a, b, semente, params) for a, b in faixas]
+                for futuro in as_completed(futuros):
+                    resultados.append(self._relatar(futuro.result()))
+
+        total = {k: sum(r[k] for r in resultados) for k in ("usuarios", "criancas", "itens", "eventos", "pulados")}
+        segundos = _time.perf_counter() - t0
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefixo}{total['usuarios']} usuário(s), {total['criancas']} criança(s), {total['itens']} item(ns) "
+            f"de rotina, {total['eventos']} evento(s) em {segundos:.2f}s "
+            f"({total['eventos'] / segundos if segundos else 0:,.0f} eventos/s); "
+            f"{total['pulados']} usuário(s) já existiam."
+        ))
+
+    def _relatar(self, res: dict) -> dict:
+        ini, fim = res["faixa"]
+        self.stdout.write(f"  usuários {ini}-{fim - 1}: {res['eventos']} evento(s) em {res['segundos']:.2f}s")
+        return res
@@ -0,0 +1,54 @@
+import time as _time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from terapias.importacao import BATCH_SIZE_IMPORTACAO, formato_pelo_nome, importar, ler_arquivo
+from usuario.models import Crianca
+
+
+class Command(BaseCommand):
+    help = ("Importa uma agenda existente (.ics ou .csv) como Eventos de uma criança. "
+            "Profissionais e clínicas são resolvidos pelo nome nos cadastros do usuário; "
+            "duplicados (data, horário, nome) são pulados.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("arquivo", help="Caminho do .ics ou .csv (UTF-8).")
+        parser.add_argument("--crianca", type=int, required=True, help="id da criança.")
+        parser.add_argument("--usuario", help="username dono dos eventos (padrão: o responsável da criança).")
+        parser.add_argument("--formato", choices=("csv", "ics"), help="Padrão: pela extensão do arquivo.")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE_IMPORTACAO, help="Linhas por lote/INSERT.")
+        parser.add_argument("--dry-run", action="store_true", help="Só conta o que seria importado, sem gravar.")
+
+    def handle(self, *args, **opts):
+        try:
+            crianca = Crianca.objects.get(pk=opts["crianca"])
+        except Crianca.DoesNotExist:
+            raise CommandError(f"Criança {opts['crianca']} não existe.")
+        if opts["usuario"]:
+            try:
+                usuario = User.objects.get(username=opts["usuario"])
+            except User.DoesNotExist:
+                raise CommandError(f"Usuário {opts['usuario']!r} não existe.")
+        else:
+            usuario = crianca.responsavel
+
+        formato = opts["formato"] or formato_pelo_nome(opts["arquivo"])
+        t0 = _time.perf_counter()
+        try:
+            with open(opts["arquivo"], encoding="utf-8-sig", newline="") as f:
+                res = importar(ler_arquivo(f, formato), crianca, usuario,
+                               batch_size=opts["batch_size"], dry_run=opts["dry_run"])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Não foi possível importar {opts['arquivo']}: {e}")
+
+        for linha, motivo in res["erros"]:
+            self.stdout.write(f"  linha {linha}: {motivo}")
+        for nome, n in res["nao_encontrados"].items():
+            self.stdout.write(f"  sem cadastro: {nome} ({n} linha(s))")
+
+        prefixo = "[dry-run] " if opts["dry_run"] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefixo}{res['criados']} criado(s), {res['duplicados']} duplicado(s), "
+            f"{res['rejeitados']} rejeitado(s) em {_time.perf_counter() - t0:.2f}s."
+        ))
@@ -0,0 +1,107 @@
+import os
+import time as _time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Max, Min
+
+from terapias.services import BATCH_SIZE_PADRAO, estender_horizonte, itens_ativos
+
+
+def _inicializar_worker():
+    # cada processo abre a própria conexão (nunca herdar o socket do pai)
+    import django
+    django.setup()
+    connections.close_all()
+
+
+def _processar_faixa(pk_ini: int, pk_fim: int, ate: date, dry_run: bool, lote: int, batch_size: int) -> dict:
+    """Estende o horizonte dos itens ativos com pk em [pk_ini, pk_fim], `lote` itens por vez."""
+    t0 = _time.perf_counter()
+    qs = (itens_ativos(ate)
+          .select_related("rotina")
+          .filter(pk__gte=pk_ini, pk__lte=pk_fim)
+          .order_by("pk"))
+
+    total_itens = total_criadas = 0
+    ultimo_pk = pk_ini - 1
+    while True:
+        bloco = list(qs.filter(pk__gt=ultimo_pk)[:lote])
+        if not bloco:
+            break
+        ultimo_pk = bloco[-1].pk
+        res = estender_horizonte(bloco, ate, dry_run=dry_run, batch_size=batch_size)
+        total_itens += res["itens"]
+        total_criadas += res["criadas"]
+
+    return {
+        "faixa": (pk_ini, pk_fim),
+        "itens": total_itens,
+        "criadas": total_criadas,
+        "segundos": _time.perf_counter() - t0,
+    }
+
+
+class Command(BaseCommand):
+    help = "Estende os Eventos de todas as rotinas ativas até hoje + N dias, a partir do watermark de cada item."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=90, help="Horizonte a partir de hoje (padrão: 90).")
+        parser.add_argument("--processos", type=int, default=os.cpu_count() or 1,
+                            help="Tamanho do pool de processos (1 = roda no próprio processo).")
+        parser.add_argument("--faixas", type=int, default=None,
+                            help="Quantas faixas de id criar (padrão: 4 por processo).")
+        parser.add_argument("--lote", type=int, default=500, help="Itens carregados por vez em cada faixa.")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE_PADRAO, help="Linhas por INSERT.")
+        parser.add_argument("--dry-run", action="store_true", help="Só conta o que seria gerado, sem gravar.")
+
+    def handle(self, *args, **opts):
+        ate = date.today() + timedelta(days=opts["dias"])
+        dry_run = opts["dry_run"]
+        processos = max(1, opts["processos"])
+
+        limites = itens_ativos(ate).aggregate(ini=Min("pk"), fim=Max("pk"))
+        if limites["ini"] is None:
+            self.stdout.write("Nenhum item precisa ser estendido.")
+            return
+
+        n_faixas = opts["faixas"] or processos * 4
+        faixas = self._faixas(limites["ini"], limites["fim"], n_faixas)
+        params = (ate, dry_run, opts["lote"], opts["batch_size"])
+
+        prefixo = "[dry-run] " if dry_run else ""
+        self.stdout.write(f"{prefixo}Horizonte até {ate:%d/%m/%Y}: {len(faixas)} faixa(s), {processos} processo(s).")
+
+        t0 = _time.perf_counter()
+        resultados = []
+        if processos == 1:
+            for ini, fim in faixas:
+                resultados.append(self._relatar(_processar_faixa(ini, fim, *params)))
+        else:
+            connections.close_all()  # não levar a conexão do pai para os filhos
+            with ProcessPoolExecutor(max_workers=processos, initializer=_inicializar_worker) as pool:
+                futuros = [pool.submit(_processar_faixa, ini, fim, *params) for ini, fim in faixas]
+                for futuro in as_completed(futuros):
+                    resultados.append(self._relatar(futuro.result()))
+
+        total_itens = sum(r["itens"] for r in resultados)
+        total_criadas = sum(r["criadas"] for r in resultados)
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefixo}{total_itens} item(ns) estendido(s), {total_criadas} evento(s) "
+            f"em {_time.perf_counter() - t0:.2f}s."
+        ))
+
+    @staticmethod
+    def _faixas(ini: int, fim: int, n: int):
+        """Divide [ini, fim] em até n faixas contíguas de ids."""
+        passo = max(1, -(-(fim - ini + 1) // n))
+        return [(a, min(a + passo - 1, fim)) for a in range(ini, fim + 1, passo)]
+
+    def _relatar(self, res: dict) -> dict:
+        ini, fim = res["faixa"]
+        self.stdout.write(
+            f"  faixa {ini}-{fim}: {res['itens']} item(ns), {res['criadas']} evento(s) em {res['segundos']:.2f}s"
+        )
+        return res
@@ -0,0 +1,38 @@
+import signal
+import threading
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from terapias.tarefas import TIMEOUT_PADRAO, processar_pendentes, rodar_worker
+
+
+class Command(BaseCommand):
+    help = ("Worker da fila de geração de eventos (TarefaRotina): executa as tarefas pendentes "
+            "com um pool de threads até receber SIGTERM/Ctrl+C.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=4, help="Tarefas executadas em paralelo.")
+        parser.add_argument("--intervalo", type=float, default=1.0,
+                            help="Segundos de espera de cada thread quando a fila está vazia.")
+        parser.add_argument("--timeout", type=int, default=int(TIMEOUT_PADRAO.total_seconds()),
+                            help="Segundos em \"executando\" depois dos quais a tarefa volta para a fila.")
+        parser.add_argument("--uma-vez", action="store_true",
+                            help="Executa as pendentes que já podem rodar, nesta thread, e sai.")
+
+    def handle(self, *args, **opts):
+        if opts["uma_vez"]:
+            res = processar_pendentes()
+            self.stdout.write(self.style.SUCCESS(
+                f"{res['concluidas']} tarefa(s) concluída(s), {res['falhas']} com erro."))
+            return
+
+        parar = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: parar.set())
+        self.stdout.write(f"Processando a fila com {opts['threads']} thread(s). Ctrl+C para parar.")
+        try:
+            rodar_worker(parar, threads=max(1, opts["threads"]), intervalo=opts["intervalo"],
+                         timeout=timedelta(seconds=opts["timeout"]))
+        except KeyboardInterrupt:
+            parar.set()
+        self.stdout.write("Worker parado.")
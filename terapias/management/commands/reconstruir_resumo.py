@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from terapias.metricas import reconstruir_resumo, verificar_resumo
+
+
+class Command(BaseCommand):
+    help = "Recalcula o ResumoMensal a partir de Evento e/ou confere se o resumo gravado bate com os eventos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--crianca", type=int, action="append", dest="criancas",
+                            help="Restringe a estas crianças (pode repetir).")
+        parser.add_argument("--verificar", action="store_true",
+                            help="Só confere o resumo atual, sem reconstruir.")
+
+    def handle(self, *args, **opts):
+        criancas = opts["criancas"]
+
+        if not opts["verificar"]:
+            n = reconstruir_resumo(criancas)
+            self.stdout.write(f"Resumo reconstruído: {n} linha(s).")
+
+        divergencias = verificar_resumo(criancas)
+        for chave, gravado, esperado in divergencias[:20]:
+            self.stdout.write(f"  {chave}: gravado={gravado} esperado={esperado}")
+        if divergencias:
+            raise CommandError(f"{len(divergencias)} divergência(s) entre ResumoMensal e Evento.")
+        self.stdout.write(self.style.SUCCESS("ResumoMensal confere com Evento."))
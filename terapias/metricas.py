@@ -0,0 +1,242 @@
+# terapias/metricas.py
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+
+from .models import Evento, Profissional, ResumoMensal
+
+
+def duracao_efetiva():
+    """
+    Expressão SQL da duração do evento: o campo `duracao`; se vazio,
+    hora_fim - hora_inicio; sem horários, zero (mesma regra do antigo _duration).
+    """
+    return Coalesce(
+        "duracao",
+        ExpressionWrapper(F("hora_fim") - F("hora_inicio"), output_field=DurationField()),
+        Value(timedelta()),
+        output_field=DurationField(),
+    )
+
+
+def _duracao_py(ev: Evento) -> timedelta:
+    """Mesma regra de duracao_efetiva(), para eventos em memória."""
+    if ev.duracao is not None:
+        return ev.duracao
+    if ev.hora_inicio and ev.hora_fim:
+        base = date.today()
+        return datetime.combine(base, ev.hora_fim) - datetime.combine(base, ev.hora_inicio)
+    return timedelta()
+
+
+def indicadores_do_mes(crianca, m_ini: date, m_fim: date, hoje: date) -> dict:
+    """
+    Agendados, comparecimentos, faltas e pendentes do mês, lidos do ResumoMensal.
+
+    O resumo guarda agendados/comparecimentos; os não confirmados viram
+    faltas (antes de hoje) ou pendentes (de hoje em diante). Só o mês
+    corrente precisa de uma contagem extra em Evento para dividir os dois.
+
+    Conta só Eventos gravados. As ocorrências que a grade calcula na leitura
+    (depois do watermark de cada item; ver services.linhas_no_intervalo)
+    não entram aqui, em carga_do_mes nem nos "próximos": num mês além do
+    horizonte já materializado os cards mostram menos que a grade. Com o
+    horizonte rolante (manage.py materializar_rotinas) à frente do mês,
+    os dois batem.
+    """
+    totais = (ResumoMensal.objects
+              .filter(crianca=crianca, mes=m_ini)
+              .aggregate(agendados=Sum("agendados"), comparecimentos=Sum("comparecimentos")))
+    agendados = totais["agendados"] or 0
+    comparecimentos = totais["comparecimentos"] or 0
+    nao_confirmados = agendados - comparecimentos
+
+    if m_fim < hoje:
+        pendentes = 0
+    elif m_ini >= hoje:
+        pendentes = nao_confirmados
+    else:
+        pendentes = (Evento.objects
+                     .filter(crianca=crianca, data_evento__range=(hoje, m_fim), presenca_confirmada=False)
+                     .count())
+
+    return {
+        "total_agendados": agendados,
+        "total_comparecimentos": comparecimentos,
+        "total_faltas": nao_confirmados - pendentes,
+        "total_pendentes": pendentes,
+    }
+
+
+def carga_do_mes(crianca, m_ini: date, m_fim: date):
+    """
+    Horas do mês por nome de clínica e por Profissional.tipo, lidas do
+    ResumoMensal (poucas linhas por mês, independente do volume de eventos).
+    Como em indicadores_do_mes, só Eventos gravados.
+
+    Retorna (por_clinica, por_tipo): {nome ou None: timedelta}, {tipo ou None: timedelta}
+    """
+    linhas = (ResumoMensal.objects
+              .filter(crianca=crianca, mes=m_ini)
+              .values("clinica__nome", "profissional_tipo")
+              .annotate(total=Sum("duracao_total"))
+              .order_by())
+
+    por_clinica = defaultdict(timedelta)
+    por_tipo = defaultdict(timedelta)
+    for linha in linhas:
+        total = linha["total"] or timedelta()
+        por_clinica[linha["clinica__nome"]] += total
+        por_tipo[linha["profissional_tipo"] or None] += total
+    return por_clinica, por_tipo
+
+
+# ---------------- manutenção do ResumoMensal ----------------
+#
+# Um "delta" é {(crianca_id, mes, clinica_id, profissional_tipo): [agendados, comparecimentos, duracao]}.
+# Gravações de um Evento só (save/delete) são tratadas pelos signals em
+# terapias/signals.py; os caminhos em massa de terapias.services calculam o
+# delta do lote inteiro e chamam aplicar_deltas() uma vez, dentro de
+# resumo_manual() para os signals não contarem de novo.
+
+_estado = threading.local()
+
+
+@contextmanager
+def resumo_manual():
+    """Dentro do bloco os signals não mexem no resumo; quem chama aplica os deltas."""
+    anterior = getattr(_estado, "manual", False)
+    _estado.manual = True
+    try:
+        yield
+    finally:
+        _estado.manual = anterior
+
+
+def resumo_automatico() -> bool:
+    return not getattr(_estado, "manual", False)
+
+
+def _novo_delta():
+    return defaultdict(lambda: [0, 0, timedelta()])
+
+
+def somar_deltas(*deltas) -> dict:
+    total = _novo_delta()
+    for delta in deltas:
+        for chave, (ag, comp, dur) in delta.items():
+            t = total[chave]
+            t[0] += ag
+            t[1] += comp
+            t[2] += dur
+    return total
+
+
+def deltas_de_eventos(eventos, sinal: int = 1) -> dict:
+    """Delta de uma lista de Eventos em memória (ex.: os que acabaram de ir num bulk_create)."""
+    ids = {ev.profissional_id for ev in eventos if ev.profissional_id}
+    tipos = dict(Profissional.objects.filter(pk__in=ids).values_list("pk", "tipo")) if ids else {}
+
+    delta = _novo_delta()
+    for ev in eventos:
+        chave = (ev.crianca_id, ev.data_evento.replace(day=1), ev.clinica_id, tipos.get(ev.profissional_id, ""))
+        d = delta[chave]
+        d[0] += sinal
+        d[1] += sinal if ev.presenca_confirmada else 0
+        d[2] += _duracao_py(ev) * sinal
+    return delta
+
+
+def _agregar_por_chave(qs):
+    return (qs.annotate(mes=TruncMonth("data_evento"))
+            .values("crianca_id", "mes", "clinica_id", "profissional__tipo")
+            .annotate(agendados=Count("pk"),
+                      comparecimentos=Count("pk", filter=Q(presenca_confirmada=True)),
+                      duracao_total=Sum(duracao_efetiva()))
+            .order_by())
+
+
+def deltas_de_queryset(qs, sinal: int = 1) -> dict:
+    """Delta de um queryset de Evento, agregado no banco (um GROUP BY)."""
+    delta = _novo_delta()
+    for linha in _agregar_por_chave(qs):
+        chave = (linha["crianca_id"], linha["mes"], linha["clinica_id"], linha["profissional__tipo"] or "")
+        d = delta[chave]
+        d[0] += linha["agendados"] * sinal
+        d[1] += linha["comparecimentos"] * sinal
+        d[2] += (linha["duracao_total"] or timedelta()) * sinal
+    return delta
+
+
+def aplicar_deltas(delta: dict):
+    """Soma o delta nas linhas do resumo (UPDATE ... SET x = x + n; cria a linha se faltar)."""
+    for (crianca_id, mes, clinica_id, tipo), (ag, comp, dur) in delta.items():
+        if not (ag or comp or dur):
+            continue
+        qs = ResumoMensal.objects.filter(crianca_id=crianca_id, mes=mes, clinica_id=clinica_id, profissional_tipo=tipo)
+        mudancas = {
+            "agendados": F("agendados") + ag,
+            "comparecimentos": F("comparecimentos") + comp,
+            "duracao_total": F("duracao_total") + dur,
+        }
+        if qs.update(**mudancas) or ag <= 0:
+            # sem linha e delta negativo: a linha já foi junto (ex.: cascata da criança)
+            continue
+        try:
+            with transaction.atomic():
+                ResumoMensal.objects.create(
+                    crianca_id=crianca_id, mes=mes, clinica_id=clinica_id, profissional_tipo=tipo,
+                    agendados=ag, comparecimentos=comp, duracao_total=dur,
+                )
+        except IntegrityError:
+            qs.update(**mudancas)  # outra transação criou a linha antes
+
+
+def _calcular_resumo(criancas=None) -> dict:
+    qs = Evento.objects.all()
+    if criancas is not None:
+        qs = qs.filter(crianca__in=criancas)
+    return {chave: tuple(v) for chave, v in deltas_de_queryset(qs).items()}
+
+
+def _resumo_gravado(criancas=None) -> dict:
+    qs = ResumoMensal.objects.all()
+    if criancas is not None:
+        qs = qs.filter(crianca__in=criancas)
+    return {
+        (r.crianca_id, r.mes, r.clinica_id, r.profissional_tipo): (r.agendados, r.comparecimentos, r.duracao_total)
+        for r in qs.iterator()
+        if r.agendados or r.comparecimentos or r.duracao_total
+    }
+
+
+@transaction.atomic
+def reconstruir_resumo(criancas=None, *, batch_size: int = 1000) -> int:
+    """Recalcula o ResumoMensal do zero a partir de Evento. Retorna quantas linhas gravou."""
+    atual = _calcular_resumo(criancas)
+    antigo = ResumoMensal.objects.all()
+    if criancas is not None:
+        antigo = antigo.filter(crianca__in=criancas)
+    antigo.delete()
+    ResumoMensal.objects.bulk_create([
+        ResumoMensal(crianca_id=c, mes=m, clinica_id=cl, profissional_tipo=t,
+                     agendados=ag, comparecimentos=comp, duracao_total=dur)
+        for (c, m, cl, t), (ag, comp, dur) in atual.items()
+    ], batch_size=batch_size)
+    return len(atual)
+
+
+def verificar_resumo(criancas=None) -> list:
+    """Compara o resumo gravado com o recalculado. Retorna [(chave, gravado, esperado)] divergentes."""
+    esperado = _calcular_resumo(criancas)
+    gravado = _resumo_gravado(criancas)
+    return [
+        (chave, gravado.get(chave), esperado.get(chave))
+        for chave in sorted(set(esperado) | set(gravado), key=str)
+        if gravado.get(chave) != esperado.get(chave)
+    ]
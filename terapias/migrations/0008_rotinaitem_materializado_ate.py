@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:49
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+
+def preencher_materializado_ate(apps, schema_editor):
+    """Itens já expandidos recebem como watermark a data do último evento gerado."""
+    RotinaItem = apps.get_model('terapias', 'RotinaItem')
+    Evento = apps.get_model('terapias', 'Evento')
+    ultimo = (Evento.objects
+              .filter(origem_rotina_item=OuterRef('pk'))
+              .values('origem_rotina_item')
+              .annotate(ultimo=Max('data_evento'))
+              .values('ultimo'))
+    RotinaItem.objects.update(materializado_ate=Subquery(ultimo))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terapias', '0007_evento_origem_rotina_item'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rotinaitem',
+            name='materializado_ate',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.RunPython(preencher_materializado_ate, migrations.RunPython.noop),
+    ]
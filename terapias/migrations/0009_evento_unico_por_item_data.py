@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:52
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remover_duplicados(apps, schema_editor):
+    """
+    Antes da constraint: para cada (item, data) repetido fica só um evento,
+    de preferência o que já tem presença confirmada; os demais são apagados.
+    """
+    Evento = apps.get_model('terapias', 'Evento')
+    repetidos = (Evento.objects
+                 .filter(origem_rotina_item__isnull=False)
+                 .values('origem_rotina_item', 'data_evento')
+                 .annotate(n=Count('id'))
+                 .filter(n__gt=1))
+    for grupo in repetidos.iterator():
+        pks = list(Evento.objects
+                   .filter(origem_rotina_item=grupo['origem_rotina_item'], data_evento=grupo['data_evento'])
+                   .order_by('-presenca_confirmada', 'pk')
+                   .values_list('pk', flat=True))
+        Evento.objects.filter(pk__in=pks[1:]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terapias', '0008_rotinaitem_materializado_ate'),
+        ('usuario', '0005_alter_crianca_responsavel'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remover_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='evento',
+            constraint=models.UniqueConstraint(fields=('origem_rotina_item', 'data_evento'), name='evento_unico_por_item_data'),
+        ),
+    ]
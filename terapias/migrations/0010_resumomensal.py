@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:53
+
+import datetime
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+
+
+def popular_resumo(apps, schema_editor):
+    Evento = apps.get_model('terapias', 'Evento')
+    ResumoMensal = apps.get_model('terapias', 'ResumoMensal')
+    duracao = Coalesce(
+        'duracao',
+        ExpressionWrapper(F('hora_fim') - F('hora_inicio'), output_field=DurationField()),
+        Value(datetime.timedelta()),
+        output_field=DurationField(),
+    )
+    linhas = (Evento.objects
+              .annotate(mes=TruncMonth('data_evento'))
+              .values('crianca_id', 'mes', 'clinica_id', 'profissional__tipo')
+              .annotate(agendados=Count('pk'),
+                        comparecimentos=Count('pk', filter=Q(presenca_confirmada=True)),
+                        duracao_total=Sum(duracao))
+              .order_by())
+    ResumoMensal.objects.bulk_create([
+        ResumoMensal(
+            crianca_id=linha['crianca_id'],
+            mes=linha['mes'],
+            clinica_id=linha['clinica_id'],
+            profissional_tipo=linha['profissional__tipo'] or '',
+            agendados=linha['agendados'],
+            comparecimentos=linha['comparecimentos'],
+            duracao_total=linha['duracao_total'] or datetime.timedelta(),
+        )
+        for linha in linhas.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terapias', '0009_evento_unico_por_item_data'),
+        ('usuario', '0005_alter_crianca_responsavel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField()),
+                ('profissional_tipo', models.CharField(blank=True, default='', max_length=50)),
+                ('agendados', models.IntegerField(default=0)),
+                ('comparecimentos', models.IntegerField(default=0)),
+                ('duracao_total', models.DurationField(default=datetime.timedelta)),
+                ('clinica', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='resumos_mensais', to='terapias.clinica')),
+                ('crianca', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumos_mensais', to='usuario.crianca')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('clinica__isnull', False)), fields=('crianca', 'mes', 'clinica', 'profissional_tipo'), name='resumo_mensal_unico'), models.UniqueConstraint(condition=models.Q(('clinica__isnull', True)), fields=('crianca', 'mes', 'profissional_tipo'), name='resumo_mensal_unico_sem_clinica')],
+            },
+        ),
+        migrations.RunPython(popular_resumo, migrations.RunPython.noop),
+    ]
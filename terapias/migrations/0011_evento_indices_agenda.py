@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terapias', '0010_resumomensal'),
+        ('usuario', '0005_alter_crianca_responsavel'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='evento',
+            index=models.Index(fields=['crianca', 'data_evento', 'hora_inicio'], name='evento_crianca_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='evento',
+            index=models.Index(condition=models.Q(('presenca_confirmada', False)), fields=['crianca', 'data_evento'], name='evento_nao_confirmado_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def criar_versoes(apps, schema_editor):
+    Crianca = apps.get_model('usuario', 'Crianca')
+    VersaoAgenda = apps.get_model('terapias', 'VersaoAgenda')
+    VersaoAgenda.objects.bulk_create(
+        [VersaoAgenda(crianca_id=pk) for pk in Crianca.objects.values_list('pk', flat=True)],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terapias', '0011_evento_indices_agenda'),
+        ('usuario', '0005_alter_crianca_responsavel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersaoAgenda',
+            fields=[
+                ('crianca', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='versao_agenda', serialize=False, to='usuario.crianca')),
+                ('versao', models.PositiveBigIntegerField(default=0)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(criar_versoes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:46
+
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terapias', '0012_versaoagenda'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TarefaRotina',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('expandir', 'Gerar eventos'), ('sincronizar', 'Ressincronizar eventos')], max_length=20)),
+                ('estado', models.CharField(choices=[('pendente', 'Na fila'), ('executando', 'Em execução'), ('concluida', 'Concluída'), ('falhou', 'Falhou')], default='pendente', max_length=20)),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('executar_apos', models.DateTimeField(default=django.utils.timezone.now)),
+                ('iniciada_em', models.DateTimeField(blank=True, null=True)),
+                ('concluida_em', models.DateTimeField(blank=True, null=True)),
+                ('resultado', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('erro', models.TextField(blank=True, default='')),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('criado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tarefas', to='terapias.rotinaitem')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('estado', 'pendente')), fields=['executar_apos', 'id'], name='tarefa_fila_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('estado', 'pendente')), fields=('item',), name='tarefa_pendente_unica_por_item')],
+            },
+        ),
+    ]
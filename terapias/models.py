@@ -1,7 +1,11 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
-from datetime import date
+from django.utils import timezone
+from datetime import date, timedelta
 from usuario.models import Crianca
-from .variaveis_categoricas import TIPOS_PROFISSIONAL, TIPOS_EVENTO, TIPOS_PERIODICIDADE, TIPOS_DIA_SEMANA
+from .variaveis_categoricas import (
+    ESTADOS_TAREFA, TIPOS_PROFISSIONAL, TIPOS_EVENTO, TIPOS_PERIODICIDADE, TIPOS_DIA_SEMANA, TIPOS_TAREFA,
+)
 
 class Clinica(models.Model):
     nome = models.CharField(max_length=100)
@@ -51,6 +55,8 @@ class RotinaItem(models.Model):
     rotina = models.ForeignKey(Rotina, on_delete=models.CASCADE, related_name='rotinas_itens')
     criado_por = models.ForeignKey('auth.User', on_delete=models.CASCADE, default='auth.User')
     data_criacao = models.DateTimeField(auto_now_add=True)
+    # até que data os Eventos deste item já foram gerados (watermark do horizonte)
+    materializado_ate = models.DateField(null=True, blank=True)
 
     def __str__(self):
         return f"Item de {self.rotina.nome} - {self.descricao}"
@@ -74,5 +80,97 @@ class Evento(models.Model):
         related_name="eventos_gerados"
     )
 
+    class Meta:
+        constraints = [
+            # uma ocorrência por item/data (eventos avulsos têm origem NULL e não entram)
+            models.UniqueConstraint(fields=["origem_rotina_item", "data_evento"], name="evento_unico_por_item_data"),
+        ]
+        indexes = [
+            # agenda (grade da semana, métricas do mês, próximos): crianca + faixa de datas,
+            # já na ordem data_evento, hora_inicio. O caminho da sincronização
+            # (origem_rotina_item + data_evento >= X) usa o índice da constraint acima.
+            models.Index(fields=["crianca", "data_evento", "hora_inicio"], name="evento_crianca_data_idx"),
+            # pendentes/faltas: só os não confirmados, que são a minoria com o tempo
+            models.Index(fields=["crianca", "data_evento"], condition=models.Q(presenca_confirmada=False),
+                         name="evento_nao_confirmado_idx"),
+        ]
+
+    def __str__(self):
+        return f"Evento de {self.crianca} com {self.profissional or '—'} em {self.data_evento}"
+
+class ResumoMensal(models.Model):
+    """
+    Totais de Evento por (criança, mês, clínica, tipo de profissional),
+    mantidos incrementalmente a cada gravação (ver terapias.metricas).
+
+    Faltas e pendentes não são guardadas: dependem de "hoje" e mudam sem
+    nenhuma escrita. São derivadas de agendados - comparecimentos.
+    """
+    crianca = models.ForeignKey(Crianca, on_delete=models.CASCADE, related_name='resumos_mensais')
+    mes = models.DateField()  # sempre o dia 1
+    clinica = models.ForeignKey(Clinica, on_delete=models.CASCADE, related_name='resumos_mensais', blank=True, null=True)
+    profissional_tipo = models.CharField(max_length=50, blank=True, default='')  # '' = sem profissional
+    agendados = models.IntegerField(default=0)
+    comparecimentos = models.IntegerField(default=0)
+    duracao_total = models.DurationField(default=timedelta)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["crianca", "mes", "clinica", "profissional_tipo"], name="resumo_mensal_unico",
+                condition=models.Q(clinica__isnull=False),
+            ),
+            models.UniqueConstraint(
+                fields=["crianca", "mes", "profissional_tipo"], name="resumo_mensal_unico_sem_clinica",
+                condition=models.Q(clinica__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f"Resumo de {self.crianca} em {self.mes:%m/%Y}"
+
+class VersaoAgenda(models.Model):
+    """
+    Versão dos dados da agenda de uma criança. Toda escrita que muda o que a
+    agenda mostra (Evento, RotinaItem, Rotina, nomes de profissional/clínica)
+    incrementa `versao`; os fragmentos em cache usam a versão na chave
+    (ver terapias.cache_agenda), então nunca servem conteúdo velho.
+    """
+    crianca = models.OneToOneField(Crianca, on_delete=models.CASCADE, primary_key=True, related_name='versao_agenda')
+    versao = models.PositiveBigIntegerField(default=0)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Agenda de {self.crianca} v{self.versao}"
+
+class TarefaRotina(models.Model):
+    """
+    Geração de eventos de um RotinaItem feita fora da request, pelo worker
+    (manage.py processar_tarefas; ver terapias.tarefas). Só pode haver uma
+    tarefa pendente por item: pedidos repetidos se juntam nela.
+    """
+    item = models.ForeignKey(RotinaItem, on_delete=models.CASCADE, related_name='tarefas')
+    tipo = models.CharField(max_length=20, choices=TIPOS_TAREFA)
+    estado = models.CharField(max_length=20, choices=ESTADOS_TAREFA, default='pendente')
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    executar_apos = models.DateTimeField(default=timezone.now)  # adiada entre tentativas
+    iniciada_em = models.DateTimeField(null=True, blank=True)
+    concluida_em = models.DateTimeField(null=True, blank=True)
+    resultado = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    erro = models.TextField(blank=True, default='')
+    criado_por = models.ForeignKey('auth.User', on_delete=models.CASCADE, null=True, blank=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["item"], condition=models.Q(estado="pendente"),
+                                    name="tarefa_pendente_unica_por_item"),
+        ]
+        indexes = [
+            # a fila: só as pendentes, na ordem em que podem rodar
+            models.Index(fields=["executar_apos", "id"], condition=models.Q(estado="pendente"),
+                         name="tarefa_fila_idx"),
+        ]
+
     def __str__(self):
-        return f"Evento de {self.crianca} com {self.profissional or '—'} em {self.data_evento}"
\ No newline at end of file
+        return f"{self.get_tipo_display()} do item {self.item_id} ({self.get_estado_display()})"
@@ -1,8 +1,17 @@
 # terapias/services.py
-from datetime import date, timedelta, datetime
-from typing import Iterable, List
+from datetime import date, timedelta, datetime, time
+from typing import Iterable, List, Optional
 from django.db import transaction
-from .models import Evento, RotinaItem
+from django.db.models import F, Q
+from django.utils import timezone
+from therapytrack.telemetria import medir_servico
+from .cache_agenda import tocar_agendas
+from .metricas import aplicar_deltas, deltas_de_eventos, deltas_de_queryset, resumo_manual, somar_deltas
+from .models import Evento, Rotina, RotinaItem
+from .variaveis_categoricas import TIPOS_EVENTO
+
+# quantas linhas vão em cada INSERT nas gravações em massa
+BATCH_SIZE_PADRAO = 500
 
 # mapeia suas keys -> weekday() do Python (segunda=0..domingo=6)
 WEEKDAY_MAP = {
@@ -43,10 +52,12 @@ def _datas_mensais(inicio: date, fim: date) -> Iterable[date]:
         d = date(y, m, dia)
 
 def _datas_anuais(inicio: date, fim: date) -> Iterable[date]:
-    d = inicio
+    """mesmo dia/mês do início; 29/02 cai em 28/02 nos anos não bissextos"""
+    ano, d = inicio.year, inicio
     while d <= fim:
         yield d
-        d = date(d.year + 1, d.month, d.day)
+        ano += 1
+        d = date(ano, inicio.month, min(inicio.day, _ultimo_dia_do_mes(ano, inicio.month)))
 
 def _calcular_duracao(hora_inicio, hora_fim):
     if not (hora_inicio and hora_fim):
@@ -57,15 +68,169 @@ def _calcular_duracao(hora_inicio, hora_fim):
     return dt_f - dt_i
 
 def _default_tipo_evento():
-    # tenta usar o primeiro de TIPOS_EVENTO; se não houver, cai em "pontual"
-    try:
-        from .models import TIPOS_EVENTO
-        return TIPOS_EVENTO[0][0] if TIPOS_EVENTO else "pontual"
-    except Exception:
-        return "pontual"
+    # usa o primeiro de TIPOS_EVENTO; se não houver, cai em "pontual"
+    return TIPOS_EVENTO[0][0] if TIPOS_EVENTO else "pontual"
+
+def _intervalo_da_rotina(rotina: Rotina, dias_horizonte_if_no_end: int):
+    """[data_inicio da rotina (ou hoje), data_termino (ou início + N)] sem retroativos."""
+    hoje = date.today()
+    start = rotina.data_inicio or hoje
+    # se não quiser criar retroativo, segure no hoje:
+    start = max(start, hoje)
+    end = rotina.data_termino or (start + timedelta(days=dias_horizonte_if_no_end))
+    return start, end
+
+def _datas_do_item(ri: RotinaItem, start: date, end: date, ancora: Optional[date] = None) -> List[date]:
+    """
+    Datas do item em [start, end]. A regra é ancorada em `ancora` (normalmente
+    rotina.data_inicio; padrão: start), então quinzenal/mensal/anual caem
+    sempre nos mesmos dias, não importa a partir de quando se expande.
+    """
+    ancora = ancora or start
+    start = max(start, ancora)
+    per = ri.periodicidade
+
+    if per == "diaria":
+        return list(_datas_diarias(start, end))
+    if per in ("semanal", "quinzenal"):
+        weekday = WEEKDAY_MAP.get(ri.dias_semana, ancora.weekday())
+        passo = 7 if per == "semanal" else 14
+        primeira = _primeira_data_no_ou_apos(ancora, weekday)
+        if primeira < start:
+            # pula direto para a primeira ocorrência >= start, sem perder o passo
+            saltos = -(-(start - primeira).days // passo)
+            primeira += timedelta(days=saltos * passo)
+        return list(_datas_semanais(primeira, end, weekday, passo_dias=passo))
+    if per == "mensal":
+        return [d for d in _datas_mensais(ancora, end) if d >= start]
+    if per == "anual":
+        return [d for d in _datas_anuais(ancora, end) if d >= start]
+    if per == "pontual":
+        return [ancora] if start <= ancora <= end else []
+    return []
+
+# campos copiados do item para cada evento; são os que a ressincronização atualiza
+CAMPOS_SINCRONIZADOS = ("nome", "hora_inicio", "hora_fim", "duracao", "profissional_id", "clinica_id")
+
+def _valores_do_item(ri: RotinaItem) -> dict:
+    return {
+        "nome": ri.nome_evento,
+        "hora_inicio": ri.hora_inicio,
+        "hora_fim": ri.hora_fim,
+        "duracao": ri.duracao or _calcular_duracao(ri.hora_inicio, ri.hora_fim),
+        "profissional_id": ri.profissional_id,
+        "clinica_id": ri.clinica_id,
+    }
+
+def _eventos_do_item(ri: RotinaItem, datas: Iterable[date], *, crianca_id: int, tipo: str) -> List[Evento]:
+    """Monta (sem salvar) os Eventos do item para as datas informadas."""
+    valores = _valores_do_item(ri)
+    return [
+        Evento(
+            **valores,
+            tipo=tipo,
+            data_evento=d,
+            crianca_id=crianca_id,
+            notas=ri.descricao,
+            presenca_confirmada=False,
+            criado_por_id=ri.criado_por_id,
+            origem_rotina_item=ri,
+        )
+        for d in datas
+    ]
+
+def _travar_itens(pks) -> dict:
+    """
+    SELECT ... FOR UPDATE nos itens (em ordem de pk, para não dar deadlock).
+    Duas sincronizações do mesmo item passam a rodar uma depois da outra.
+    Devolve {pk: materializado_ate} já lido sob a trava.
+    """
+    return dict(RotinaItem.objects.select_for_update()
+                .filter(pk__in=list(pks)).order_by("pk")
+                .values_list("pk", "materializado_ate"))
+
+def _datas_ja_geradas(pks, start: date, end: date) -> set:
+    """{(item_pk, data)} que já têm Evento gravado no intervalo."""
+    return set(Evento.objects
+               .filter(origem_rotina_item__in=list(pks), data_evento__range=(start, end))
+               .values_list("origem_rotina_item_id", "data_evento"))
+
+def _so_os_novos(eventos: List[Evento]) -> List[Evento]:
+    """
+    Tira da lista os eventos de rotina cujo (item, data) já tem Evento gravado
+    (ou que se repetem na própria lista). Uma consulta só; avulsos passam direto.
+    """
+    de_rotina = [ev for ev in eventos if ev.origem_rotina_item_id]
+    if not de_rotina:
+        return eventos
+    datas = [ev.data_evento for ev in de_rotina]
+    vistos = _datas_ja_geradas({ev.origem_rotina_item_id for ev in de_rotina}, min(datas), max(datas))
+    novos = []
+    for ev in eventos:
+        if ev.origem_rotina_item_id:
+            chave = (ev.origem_rotina_item_id, ev.data_evento)
+            if chave in vistos:
+                continue
+            vistos.add(chave)
+        novos.append(ev)
+    return novos
+
+def _gravar_eventos(eventos: List[Evento], batch_size: int) -> List[Evento]:
+    """
+    Grava os eventos que ainda não existem e devolve só esses: o ResumoMensal
+    e as contagens ("criadas") refletem o que entrou de fato. Quem chama
+    trava os itens (_travar_itens), então ninguém grava o mesmo (item, data)
+    entre a leitura de _so_os_novos e o INSERT.
+    """
+    eventos = _so_os_novos(eventos)
+    if not eventos:
+        return eventos
+    # ON CONFLICT DO NOTHING: a constraint (origem_rotina_item, data_evento) continua como rede de segurança
+    Evento.objects.bulk_create(eventos, batch_size=batch_size, ignore_conflicts=True)
+    aplicar_deltas(deltas_de_eventos(eventos, +1))
+    tocar_agendas(ev.crianca_id for ev in eventos)
+    return eventos
+
+def _apagar_eventos(qs) -> int:
+    """DELETE em massa, tirando o lote do ResumoMensal com um GROUP BY só."""
+    with resumo_manual():
+        delta = deltas_de_queryset(qs, -1)
+        aplicar_deltas(delta)
+        deletados, _ = qs.delete()
+    tocar_agendas(crianca_id for crianca_id, *_ in delta)
+    return deletados
+
+def _atualizar_eventos(qs, valores: dict) -> int:
+    """UPDATE em massa, movendo os totais no ResumoMensal (sai o antes, entra o depois)."""
+    antes = deltas_de_queryset(qs, -1)
+    n = qs.update(**valores)
+    aplicar_deltas(somar_deltas(antes, deltas_de_queryset(qs, +1)))
+    tocar_agendas(crianca_id for crianca_id, *_ in antes)
+    return n
+
+def _fim_do_item(rotina: Rotina, end: date, marca: Optional[date]) -> date:
+    """
+    `end`, mas nunca antes do watermark: numa rotina sem término o horizonte
+    rolante pode já ter gerado além dos N dias padrão, e essas datas
+    continuam valendo (senão a ressincronização as apagaria como "fora da
+    regra"). Com término, ele é o limite.
+    """
+    if marca and marca > end and not rotina.data_termino:
+        return marca
+    return end
 
+def _marcar_materializado(ri: RotinaItem, ate: date):
+    """Avança o watermark do item até `ate`; nunca o recua."""
+    RotinaItem.objects.filter(pk=ri.pk).filter(
+        Q(materializado_ate__isnull=True) | Q(materializado_ate__lt=ate)
+    ).update(materializado_ate=ate)
+    if ri.materializado_ate is None or ri.materializado_ate < ate:
+        ri.materializado_ate = ate
+
+@medir_servico("expandir_rotina_item")
 @transaction.atomic
-def expandir_rotina_item(ri: RotinaItem, *, dias_horizonte_if_no_end: int = 30) -> dict:
+def expandir_rotina_item(ri: RotinaItem, *, dias_horizonte_if_no_end: int = 30,
+                         batch_size: int = BATCH_SIZE_PADRAO) -> dict:
     """
     Gera Eventos correspondentes ao RotinaItem no intervalo:
     [ri.rotina.data_inicio (ou hoje), ri.rotina.data_termino (ou hoje + N)].
@@ -78,66 +243,367 @@ def expandir_rotina_item(ri: RotinaItem, *, dias_horizonte_if_no_end: int = 30)
       - anual: mesma data (mês/dia) ancorada em data_inicio
       - pontual: apenas na data_inicio
 
+    Os eventos são montados em memória e gravados com INSERTs de várias
+    linhas (``batch_size`` linhas por comando). É idempotente: o item fica
+    travado durante a expansão e datas que já têm Evento são puladas. Se o
+    horizonte rolante já levou o item além de hoje + N, vai até o watermark
+    (que nunca recua).
+
     Retorna: {"criadas": X, "puladas": Y, "de": start, "ate": end}
     """
-    rotina = ri.rotina
-    hoje = date.today()
-    start = rotina.data_inicio or hoje
-    # se não quiser criar retroativo, segure no hoje:
-    start = max(start, hoje)
-    end = rotina.data_termino or (start + timedelta(days=dias_horizonte_if_no_end))
+    start, end = _intervalo_da_rotina(ri.rotina, dias_horizonte_if_no_end)
+    end = _fim_do_item(ri.rotina, end, _travar_itens([ri.pk]).get(ri.pk))
+    datas = _datas_do_item(ri, start, end, ancora=ri.rotina.data_inicio)
 
-    # seleciona datas
-    datas: List[date] = []
-    per = ri.periodicidade
+    eventos = _eventos_do_item(ri, datas, crianca_id=ri.rotina.crianca_id, tipo=_default_tipo_evento())
+    criados = _gravar_eventos(eventos, batch_size)  # sem as datas que já têm Evento
+    _marcar_materializado(ri, end)
 
-    if per == "diaria":
-        datas = list(_datas_diarias(start, end))
-    elif per in ("semanal", "quinzenal"):
-        weekday = WEEKDAY_MAP.get(ri.dias_semana, start.weekday())
-        passo = 7 if per == "semanal" else 14
-        datas = list(_datas_semanais(start, end, weekday, passo_dias=passo))
-    elif per == "mensal":
-        datas = list(_datas_mensais(start, end))
-    elif per == "anual":
-        datas = list(_datas_anuais(start, end))
-    elif per == "pontual":
-        datas = [start] if start <= end else []
-
-    dur = ri.duracao or _calcular_duracao(ri.hora_inicio, ri.hora_fim)
-    tipo_padrao = _default_tipo_evento()
-
-    criadas = 0
-    puladas = 0
-
-    for d in datas:
-        Evento.objects.create(
-            nome=ri.nome_evento,
-            tipo=_default_tipo_evento(),      # ajuste para um tipo válido seu
-            data_evento=d,
-            hora_inicio=ri.hora_inicio,
-            hora_fim=ri.hora_fim,
-            duracao=dur,
-            profissional=ri.profissional,
-            clinica=ri.clinica,
-            crianca=ri.rotina.crianca,
-            notas=ri.descricao,
-            presenca_confirmada=False,
-            criado_por=ri.criado_por,
-            # se tiver o FK opcional:
-            **({"origem_rotina_item": ri} if hasattr(Evento, "origem_rotina_item") else {})
-        )
-        criadas += 1
+    return {"criadas": len(criados), "puladas": len(datas) - len(criados), "de": start, "ate": end}
+
+@medir_servico("expandir_rotina")
+@transaction.atomic
+def expandir_rotina(rotina: Rotina, itens: Optional[Iterable[RotinaItem]] = None, *,
+                    dias_horizonte_if_no_end: int = 30, batch_size: int = BATCH_SIZE_PADRAO) -> dict:
+    """
+    Expande vários itens da mesma rotina de uma vez.
+
+    - itens=None: usa todos os itens já salvos da rotina;
+    - itens ainda não salvos (pk=None) são criados com um único bulk_create.
 
-    return {"criadas": criadas, "puladas": puladas, "de": start, "ate": end}
+    A rotina é lida uma vez só e os eventos de todos os itens saem num único
+    bulk_create, então o número de queries não depende de quantos itens
+    (dias marcados) vieram no formulário.
 
-def sincronizar_eventos_do_item(ri: RotinaItem, *, apagar_passado: bool = False):
+    Retorna: {"itens": N, "criadas": X, "puladas": Y, "de": start, "ate": end}
     """
-    Remove eventos gerados por este item (futuros por padrão) e reexpande.
+    start, end = _intervalo_da_rotina(rotina, dias_horizonte_if_no_end)
+    tipo = _default_tipo_evento()
+
+    if itens is None:
+        itens = list(rotina.rotinas_itens.all())
+    itens = list(itens)
+    novos = [it for it in itens if it.pk is None]
+    existentes = [it.pk for it in itens if it.pk is not None]
+
+    fins = {}
+    if existentes:
+        marcas = _travar_itens(existentes)
+        fins = {pk: _fim_do_item(rotina, end, marca) for pk, marca in marcas.items()}
+        # só avança: quem já está além de `end` fica onde está
+        (RotinaItem.objects.filter(pk__in=existentes)
+         .filter(Q(materializado_ate__isnull=True) | Q(materializado_ate__lt=end))
+         .update(materializado_ate=end))
+    for it in itens:
+        it.materializado_ate = fins.get(it.pk, end)
+    if novos:
+        RotinaItem.objects.bulk_create(novos, batch_size=batch_size)
+
+    eventos: List[Evento] = []
+    for ri in itens:
+        datas = _datas_do_item(ri, start, ri.materializado_ate, ancora=rotina.data_inicio)
+        eventos.extend(_eventos_do_item(ri, datas, crianca_id=rotina.crianca_id, tipo=tipo))
+    criados = _gravar_eventos(eventos, batch_size)  # sem as datas que já têm Evento
+    if novos:
+        # itens novos mudam as ocorrências calculadas além do horizonte, mesmo sem Evento gravado
+        tocar_agendas([rotina.crianca_id])
+
+    return {"itens": len(itens), "criadas": len(criados), "puladas": len(eventos) - len(criados),
+            "de": start, "ate": end}
+
+def salvar_itens(rotina: Rotina, itens: List[RotinaItem], *, batch_size: int = BATCH_SIZE_PADRAO) -> List[RotinaItem]:
+    """
+    Grava itens novos da rotina com um bulk_create, sem gerar os eventos
+    (quem chama enfileira a expansão; ver terapias.tarefas). Os itens já
+    mudam as ocorrências calculadas da agenda, então a versão sobe aqui.
     """
+    if itens:
+        RotinaItem.objects.bulk_create(itens, batch_size=batch_size)
+        tocar_agendas([rotina.crianca_id])
+    return itens
+
+@medir_servico("sincronizar_eventos_do_item")
+@transaction.atomic
+def sincronizar_eventos_do_item(ri: RotinaItem, *, apagar_passado: bool = False,
+                                dias_horizonte_if_no_end: int = 30,
+                                batch_size: int = BATCH_SIZE_PADRAO) -> dict:
+    """
+    Ressincroniza os eventos gerados por este item (futuros por padrão)
+    comparando as datas que já existem com as datas que a regra gera hoje:
+
+      - datas que deixaram de valer são apagadas (um DELETE);
+      - datas que continuam valendo são mantidas, e as que estão com
+        nome/horário/profissional/clínica desatualizados recebem um UPDATE só;
+      - datas novas são inseridas em massa.
+
+    Presença e notas já registradas nos eventos mantidos são preservadas.
+    O intervalo vai até o watermark do item quando ele já está além do
+    horizonte padrão, então o que o horizonte rolante gerou não é apagado.
+    O item fica travado durante a sincronização: edições concorrentes do
+    mesmo item se enfileiram e a segunda só aplica a diferença que sobrou.
+    "puladas" conta as datas que já tinham Evento e não foram inseridas.
+
+    Retorna: {"deletados": D, "atualizadas": U, "criadas": X, "puladas": Y, "de": start, "ate": end}
+    """
+    start, end = _intervalo_da_rotina(ri.rotina, dias_horizonte_if_no_end)
+    end = _fim_do_item(ri.rotina, end, _travar_itens([ri.pk]).get(ri.pk))
+    desejadas = set(_datas_do_item(ri, start, end, ancora=ri.rotina.data_inicio))
+    valores = _valores_do_item(ri)
+
+    qs = Evento.objects.filter(origem_rotina_item=ri)
+    if not apagar_passado:
+        qs = qs.filter(data_evento__gte=date.today())
+
+    existentes = set()
+    remover, desatualizados = [], []
+    for row in qs.order_by("pk").values("pk", "data_evento", *CAMPOS_SINCRONIZADOS):
+        d = row["data_evento"]
+        if d not in desejadas or d in existentes:  # fora da regra ou duplicado
+            remover.append(row["pk"])
+            continue
+        existentes.add(d)
+        if any(row[campo] != valores[campo] for campo in CAMPOS_SINCRONIZADOS):
+            desatualizados.append(row["pk"])
+
+    deletados = 0
+    if remover:
+        deletados = _apagar_eventos(Evento.objects.filter(pk__in=remover))
+    if desatualizados:
+        _atualizar_eventos(Evento.objects.filter(pk__in=desatualizados), valores)
+
+    faltando = sorted(desejadas - existentes)
+    eventos = _eventos_do_item(ri, faltando, crianca_id=ri.rotina.crianca_id, tipo=_default_tipo_evento())
+    criados = _gravar_eventos(eventos, batch_size)
+    _marcar_materializado(ri, end)
+
+    return {
+        "deletados": deletados,
+        "atualizadas": len(desatualizados),
+        "criadas": len(criados),
+        "puladas": len(existentes),
+        "de": start,
+        "ate": end,
+    }
+
+@medir_servico("remover_eventos_do_item", contar=lambda n: (0, n))
+def remover_eventos_do_item(ri: RotinaItem, *, apagar_passado: bool = False) -> int:
+    """Apaga os eventos gerados por este item (futuros por padrão). Retorna quantos."""
     qs = Evento.objects.filter(origem_rotina_item=ri)
     if not apagar_passado:
         qs = qs.filter(data_evento__gte=date.today())
-    deletados = qs.delete()
-    res = expandir_rotina_item(ri)
-    return {"deletados": deletados, **res}
+    return _apagar_eventos(qs)
+
+# ---------------- horizonte rolante ----------------
+
+def itens_ativos(ate: date):
+    """RotinaItems de rotinas ainda vigentes cujo watermark não chegou em `ate`."""
+    hoje = date.today()
+    return (RotinaItem.objects
+            .filter(Q(rotina__data_termino__isnull=True) | Q(rotina__data_termino__gte=hoje))
+            .filter(Q(materializado_ate__isnull=True) | Q(materializado_ate__lt=ate))
+            .filter(Q(rotina__data_termino__isnull=True) | Q(materializado_ate__isnull=True)
+                    | Q(materializado_ate__lt=F("rotina__data_termino"))))
+
+def estender_horizonte(itens: Iterable[RotinaItem], ate: date, *, dry_run: bool = False,
+                       batch_size: int = BATCH_SIZE_PADRAO) -> dict:
+    """
+    Leva cada item até `ate` (ou até o término da rotina, o que vier antes),
+    gerando só as datas posteriores ao seu watermark `materializado_ate`.
+    Os itens devem vir com select_related("rotina").
+
+    Eventos saem num bulk_create e os watermarks num UPDATE por data final.
+    Os itens ficam travados e o watermark é relido sob a trava, então duas
+    execuções simultâneas não geram a mesma faixa duas vezes.
+    Com dry_run=True só conta, sem gravar nada.
+
+    Retorna: {"itens": N, "criadas": X}
+    """
+    hoje = date.today()
+    tipo = _default_tipo_evento()
+    itens = list(itens)
+
+    with transaction.atomic():
+        if dry_run:
+            marcas = {ri.pk: ri.materializado_ate for ri in itens}
+        else:
+            marcas = _travar_itens(ri.pk for ri in itens)
+
+        eventos: List[Evento] = []
+        por_marca = {}  # nova marca -> [pks]
+        for ri in itens:
+            rotina = ri.rotina
+            fim = min(ate, rotina.data_termino) if rotina.data_termino else ate
+            desde = max(hoje, rotina.data_inicio or hoje)
+            marca = marcas.get(ri.pk)
+            if marca:
+                desde = max(desde, marca + timedelta(days=1))
+            if desde > fim:
+                continue
+            datas = _datas_do_item(ri, desde, fim, ancora=rotina.data_inicio)
+            eventos.extend(_eventos_do_item(ri, datas, crianca_id=rotina.crianca_id, tipo=tipo))
+            por_marca.setdefault(fim, []).append(ri.pk)
+
+        # datas além do watermark podem já ter Evento (ex.: materializar_ocorrencia): ficam de fora
+        if dry_run:
+            eventos = _so_os_novos(eventos)
+        else:
+            eventos = _gravar_eventos(eventos, batch_size)
+            for marca, pks in por_marca.items():
+                RotinaItem.objects.filter(pk__in=pks).update(materializado_ate=marca)
+                for ri in itens:
+                    if ri.pk in pks:
+                        ri.materializado_ate = marca
+
+    return {"itens": sum(len(pks) for pks in por_marca.values()), "criadas": len(eventos)}
+
+# ---------------- recorrência virtual (leitura) ----------------
+
+def _chave_ordem_agenda(ev: Evento):
+    return (ev.data_evento, ev.hora_inicio or time.min, ev.hora_fim or time.min, ev.nome)
+
+def _inicio_calculado(materializado_ate: Optional[date], data_criacao) -> date:
+    """
+    Primeira data em que as ocorrências de um item são calculadas na leitura.
+
+    Até o watermark vale só o que está gravado: uma data que falta ali foi
+    apagada pelo usuário ou saiu da regra numa edição, e a regra atual não
+    deve ser projetada sobre o que já foi gerado. Item ainda sem eventos
+    gerados começa no dia em que foi criado (a expansão também não gera
+    retroativos).
+    """
+    if materializado_ate:
+        return materializado_ate + timedelta(days=1)
+    return timezone.localdate(data_criacao)
+
+def ocorrencias_no_intervalo(crianca, de: date, ate: date) -> List[Evento]:
+    """
+    Agenda da criança em [de, ate], sem depender de eventos pré-gerados.
+
+    Junta os Eventos gravados no intervalo (avulsos, já materializados ou
+    exceções com presença/notas/horário alterados) com as ocorrências
+    calculadas na hora para cada RotinaItem ativo, a partir de
+    _inicio_calculado() do item. Uma ocorrência só é calculada se ainda não
+    existir Evento gravado para (item, data).
+
+    As ocorrências virtuais são Eventos NÃO salvos (pk=None) com
+    profissional/clínica/origem já preenchidos, então servem direto nos
+    templates da agenda. Para guardar estado numa delas use
+    materializar_ocorrencia().
+
+    Lista ordenada por data, início, término e nome.
+    """
+    gravados = list(
+        Evento.objects
+        .select_related("profissional", "clinica")
+        .filter(crianca=crianca, data_evento__range=(de, ate))
+    )
+    ja_gravadas = {(ev.origem_rotina_item_id, ev.data_evento) for ev in gravados if ev.origem_rotina_item_id}
+
+    itens = (RotinaItem.objects
+             .select_related("rotina", "profissional", "clinica")
+             .filter(rotina__crianca=crianca, rotina__data_inicio__lte=ate)
+             .filter(Q(rotina__data_termino__isnull=True) | Q(rotina__data_termino__gte=de)))
+
+    tipo = _default_tipo_evento()
+    virtuais = []
+    for ri in itens:
+        rotina = ri.rotina
+        fim = min(ate, rotina.data_termino) if rotina.data_termino else ate
+        desde = max(de, _inicio_calculado(ri.materializado_ate, ri.data_criacao))
+        datas = [d for d in _datas_do_item(ri, desde, fim, ancora=rotina.data_inicio)
+                 if (ri.pk, d) not in ja_gravadas]
+        for ev in _eventos_do_item(ri, datas, crianca_id=rotina.crianca_id, tipo=tipo):
+            ev.profissional = ri.profissional
+            ev.clinica = ri.clinica
+            virtuais.append(ev)
+
+    return sorted(gravados + virtuais, key=_chave_ordem_agenda)
+
+def _ocorrencias_calculadas(crianca, de: date, ate: date, ja_gravadas: set) -> Iterable[tuple]:
+    """
+    (item_pk, nome, data, hora_inicio, hora_fim, profissional_nome, clinica_nome)
+    de cada ocorrência das rotinas em [de, ate], a partir de _inicio_calculado()
+    de cada item, que não está em `ja_gravadas` ({(item_pk, data)}). Uma
+    consulta só, com as colunas necessárias.
+    """
+    itens = (RotinaItem.objects
+             .filter(rotina__crianca=crianca, rotina__data_inicio__lte=ate)
+             .filter(Q(rotina__data_termino__isnull=True) | Q(rotina__data_termino__gte=de))
+             .values_list("pk", "periodicidade", "dias_semana", "nome_evento", "hora_inicio", "hora_fim",
+                          "profissional__nome", "clinica__nome", "rotina__data_inicio", "rotina__data_termino",
+                          "materializado_ate", "data_criacao"))
+    for pk, per, dia, nome, hi, hf, prof, clin, inicio, termino, marca, criado in itens:
+        fim = min(ate, termino) if termino else ate
+        desde = max(de, _inicio_calculado(marca, criado))
+        regra = RotinaItem(periodicidade=per, dias_semana=dia)
+        for d in _datas_do_item(regra, desde, fim, ancora=inicio):
+            if (pk, d) not in ja_gravadas:
+                yield pk, nome, d, hi, hf, prof, clin
+
+class LinhaAgenda:
+    """
+    Projeção de uma ocorrência só com o que a grade da semana mostra.
+    Bem mais leve que um Evento com profissional/clínica carregados.
+    """
+    __slots__ = ("nome", "tipo", "data_evento", "hora_inicio", "hora_fim",
+                 "profissional_nome", "clinica_nome", "presenca_confirmada")
+
+    def __init__(self, nome, tipo, data_evento, hora_inicio, hora_fim,
+                 profissional_nome, clinica_nome, presenca_confirmada):
+        self.nome = nome
+        self.tipo = tipo
+        self.data_evento = data_evento
+        self.hora_inicio = hora_inicio
+        self.hora_fim = hora_fim
+        self.profissional_nome = profissional_nome
+        self.clinica_nome = clinica_nome
+        self.presenca_confirmada = presenca_confirmada
+
+def linhas_no_intervalo(crianca, de: date, ate: date) -> List[LinhaAgenda]:
+    """
+    Mesmas ocorrências de ocorrencias_no_intervalo(), mas como LinhaAgenda:
+    as duas consultas trazem só as colunas usadas (values_list, com os nomes
+    de profissional/clínica via JOIN), sem montar instâncias de modelo.
+
+    Lista ordenada por data, início, término e nome.
+    """
+    gravados = (Evento.objects
+                .filter(crianca=crianca, data_evento__range=(de, ate))
+                .values_list("nome", "tipo", "data_evento", "hora_inicio", "hora_fim",
+                             "profissional__nome", "clinica__nome", "presenca_confirmada",
+                             "origem_rotina_item_id"))
+    linhas = []
+    ja_gravadas = set()
+    for *campos, origem in gravados:
+        linhas.append(LinhaAgenda(*campos))
+        if origem:
+            ja_gravadas.add((origem, campos[2]))
+
+    tipo = _default_tipo_evento()
+    for pk, nome, d, hi, hf, prof, clin in _ocorrencias_calculadas(crianca, de, ate, ja_gravadas):
+        linhas.append(LinhaAgenda(nome, tipo, d, hi, hf, prof, clin, False))
+
+    linhas.sort(key=_chave_ordem_agenda)
+    return linhas
+
+@transaction.atomic
+def materializar_ocorrencia(ri: RotinaItem, data_evento: date, **campos) -> Evento:
+    """
+    Grava a ocorrência (ri, data_evento) — se ainda não existir — e aplica
+    `campos` (ex.: presenca_confirmada=True, notas="...", hora_inicio=...).
+    Só ocorrências com estado precisam virar linha em Evento.
+
+    Uma data além do watermark leva o item até ela antes (estender_horizonte):
+    assim tudo o que está gravado fica até o watermark, a ressincronização
+    enxerga a data e a leitura não a calcula de novo.
+    """
+    marca = _travar_itens([ri.pk]).get(ri.pk)
+    if marca is None or data_evento > marca:
+        estender_horizonte([ri], data_evento)
+    ev = Evento.objects.filter(origem_rotina_item=ri, data_evento=data_evento).first()
+    if ev is None:
+        ev = _eventos_do_item(ri, [data_evento], crianca_id=ri.rotina.crianca_id, tipo=_default_tipo_evento())[0]
+    for campo, valor in campos.items():
+        setattr(ev, campo, valor)
+    ev.save()
+    return ev
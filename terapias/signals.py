@@ -0,0 +1,109 @@
+# terapias/signals.py
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from usuario.models import Crianca
+
+from .cache_agenda import tocar_agendas
+from .metricas import aplicar_deltas, deltas_de_eventos, deltas_de_queryset, resumo_automatico, somar_deltas
+from .models import Clinica, Evento, Profissional, Rotina, RotinaItem, VersaoAgenda
+
+
+@receiver(pre_save, sender=Evento)
+def guardar_evento_anterior(sender, instance, raw=False, **kwargs):
+    """Numa edição, guarda a versão antiga para tirar do resumo no post_save."""
+    instance._resumo_anterior = None
+    if raw or not resumo_automatico() or not instance.pk:
+        return
+    instance._resumo_anterior = Evento.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=Evento)
+def atualizar_resumo_ao_salvar(sender, instance, raw=False, **kwargs):
+    if raw or not resumo_automatico():
+        return
+    deltas = [deltas_de_eventos([instance], +1)]
+    anterior = getattr(instance, "_resumo_anterior", None)
+    if anterior is not None:
+        deltas.append(deltas_de_eventos([anterior], -1))
+    aplicar_deltas(somar_deltas(*deltas))
+    tocar_agendas([instance.crianca_id, anterior and anterior.crianca_id])
+
+
+@receiver(pre_delete, sender=Evento)
+def calcular_delta_ao_apagar(sender, instance, **kwargs):
+    # o delta sai no pre_delete: numa cascata (ex.: apagar o Profissional)
+    # o post_delete chega quando o tipo do profissional já não existe mais
+    instance._resumo_delta = deltas_de_eventos([instance], -1) if resumo_automatico() else None
+    if resumo_automatico():
+        tocar_agendas([instance.crianca_id], criar=False)
+
+
+@receiver(post_delete, sender=Evento)
+def atualizar_resumo_ao_apagar(sender, instance, **kwargs):
+    delta = getattr(instance, "_resumo_delta", None)
+    if delta and resumo_automatico():
+        aplicar_deltas(delta)
+
+
+@receiver(pre_save, sender=Profissional)
+def guardar_resumo_do_tipo_anterior(sender, instance, raw=False, **kwargs):
+    """
+    O tipo do profissional faz parte da chave do ResumoMensal: se ele mudar,
+    os eventos do profissional saem das linhas do tipo antigo (delta lido
+    aqui, antes do UPDATE) e entram nas do novo no post_save.
+    """
+    instance._resumo_tipo_anterior = None
+    if raw or not resumo_automatico() or not instance.pk:
+        return
+    tipo = Profissional.objects.filter(pk=instance.pk).values_list("tipo", flat=True).first()
+    if tipo is not None and tipo != instance.tipo:
+        instance._resumo_tipo_anterior = deltas_de_queryset(instance.eventos.all(), -1)
+
+
+@receiver(post_save, sender=Profissional)
+def mover_resumo_para_o_tipo_novo(sender, instance, raw=False, **kwargs):
+    anterior = getattr(instance, "_resumo_tipo_anterior", None)
+    if anterior is None or raw or not resumo_automatico():
+        return
+    aplicar_deltas(somar_deltas(anterior, deltas_de_queryset(instance.eventos.all(), +1)))
+    instance._resumo_tipo_anterior = None
+
+
+# ---------------- versão da agenda (cache dos fragmentos) ----------------
+#
+# Escritas em massa de Evento já incrementam a versão em terapias.services;
+# aqui ficam as gravações unitárias do que mais aparece na agenda. Nas
+# exclusões o toque vai no pre_delete, enquanto a rotina/criança ainda existe
+# (o Collector roda tudo na mesma transação).
+
+@receiver(post_save, sender=Crianca)
+def criar_versao_agenda(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        VersaoAgenda.objects.get_or_create(crianca=instance)
+
+
+@receiver(post_save, sender=Rotina)
+@receiver(pre_delete, sender=Rotina)
+def tocar_agenda_da_rotina(sender, instance, raw=False, **kwargs):
+    if not raw:
+        tocar_agendas([instance.crianca_id], criar=False)
+
+
+@receiver(post_save, sender=RotinaItem)
+@receiver(pre_delete, sender=RotinaItem)
+def tocar_agenda_do_item(sender, instance, raw=False, **kwargs):
+    if not raw:
+        tocar_agendas(Rotina.objects.filter(pk=instance.rotina_id).values_list("crianca_id", flat=True),
+                      criar=False)
+
+
+@receiver(post_save, sender=Profissional)
+@receiver(post_save, sender=Clinica)
+def tocar_agendas_do_cadastro(sender, instance, created, raw=False, **kwargs):
+    """Renomear profissional/clínica muda o texto dos eventos na agenda de quem os usa."""
+    if created or raw:
+        return
+    ids = set(instance.eventos.values_list("crianca_id", flat=True).distinct())
+    ids.update(instance.rotinas_itens.values_list("rotina__crianca_id", flat=True).distinct())
+    tocar_agendas(ids, criar=False)
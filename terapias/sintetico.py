@@ -0,0 +1,226 @@
+# terapias/sintetico.py
+"""
+Dados sintéticos para testes de carga e de escala.
+
+Cada usuário sai de um random.Random(f"{semente}:{indice}") próprio, então o
+que é gerado para o usuário N não depende de quantos processos rodam nem de
+como os índices foram divididos entre eles: mesma semente + mesma data de
+referência = mesmos dados.
+
+Por usuário: 1 a 3 clínicas, 3 a 6 profissionais (tipos de
+TIPOS_PROFISSIONAL), `criancas` crianças e, para cada uma, uma Rotina com 2 a
+6 itens (mistura de TIPOS_PERIODICIDADE em PESOS_PERIODICIDADE) e o histórico
+de `anos` anos de Eventos até `dias_futuros` depois da data de referência,
+mais alguns eventos avulsos (avaliações, consultas). As datas vêm das mesmas
+regras de terapias.services, os itens ficam com o watermark no último dia
+gerado e cada criança tem uma taxa de comparecimento própria.
+
+A gravação é em massa (bulk_create por nível, um lote de usuários por
+transação; no Postgres os eventos vão por COPY). Como bulk_create não dispara signals, a VersaoAgenda das crianças
+é criada junto e o ResumoMensal do lote é recalculado no fim.
+"""
+import random
+from datetime import date, time, timedelta
+from typing import Dict, Iterable, List
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from usuario.models import Crianca
+
+from .carga import copiar_para_tabela
+from .metricas import reconstruir_resumo
+from .models import Clinica, Evento, Profissional, Rotina, RotinaItem, VersaoAgenda
+from .services import _calcular_duracao, _datas_do_item, _default_tipo_evento
+from .variaveis_categoricas import TIPOS_DIA_SEMANA, TIPOS_EVENTO, TIPOS_PROFISSIONAL
+
+PREFIXO_USUARIO = "sintetico-"
+BATCH_SIZE_SINTETICO = 5000
+
+# diária é rara (e pesa: 365 eventos/ano); semanal domina
+PESOS_PERIODICIDADE = {"diaria": 3, "semanal": 50, "quinzenal": 17, "mensal": 17, "anual": 5, "pontual": 8}
+PESOS_PROFISSIONAL = {"psicologo": 20, "medico": 15, "terapeuta_ocupacional": 20, "fisioterapeuta": 10,
+                      "nutricionista": 5, "fonoaudiologo": 25, "outros": 5}
+AVULSOS_POR_ANO = 6
+
+_NOMES = ("Ana", "Bia", "Caio", "Davi", "Eva", "Enzo", "Gael", "Helena", "Iris", "João", "Léo", "Lia", "Luna",
+          "Maya", "Noah", "Otto", "Pedro", "Rafa", "Sofia", "Theo", "Valentina", "Zoe")
+_SOBRENOMES = ("Almeida", "Barros", "Costa", "Dias", "Fagundes", "Lima", "Moura", "Nunes", "Rocha", "Souza")
+_CONDICOES = ("TEA", "TDAH", "Síndrome de Down", "Paralisia cerebral", "Atraso de fala", "Dislexia")
+_ESPECIALIDADES = {
+    "psicologo": "Psicologia infantil", "medico": "Neuropediatria", "terapeuta_ocupacional": "Integração sensorial",
+    "fisioterapeuta": "Fisioterapia motora", "nutricionista": "Nutrição infantil", "fonoaudiologo": "Linguagem",
+    "outros": "Psicopedagogia",
+}
+_SESSOES = {
+    "psicologo": "Psicoterapia", "medico": "Consulta", "terapeuta_ocupacional": "TO",
+    "fisioterapeuta": "Fisioterapia", "nutricionista": "Nutrição", "fonoaudiologo": "Fono", "outros": "Sessão",
+}
+_DURACOES = (30, 40, 45, 50, 60)
+
+
+def nome_de_usuario(indice: int, prefixo: str = PREFIXO_USUARIO) -> str:
+    return f"{prefixo}{indice:07d}"
+
+
+def _escolher(rng: random.Random, pesos: Dict[str, int]) -> str:
+    return rng.choices(list(pesos), weights=list(pesos.values()))[0]
+
+
+def _nome(rng: random.Random) -> str:
+    return f"{rng.choice(_NOMES)} {rng.choice(_SOBRENOMES)}"
+
+
+def _anos_antes(d: date, anos: int) -> date:
+    try:
+        return d.replace(year=d.year - anos)
+    except ValueError:  # 29/02
+        return d.replace(year=d.year - anos, day=28)
+
+
+def _somar_minutos(t: time, minutos: int) -> time:
+    total = min(t.hour * 60 + t.minute + minutos, 23 * 60 + 59)
+    return time(total // 60, total % 60)
+
+
+def planejar_usuario(semente: int, indice: int, *, criancas: int, anos: int, hoje: date,
+                     dias_futuros: int = 30, prefixo: str = PREFIXO_USUARIO) -> dict:
+    """
+    Monta (sem gravar) um usuário e tudo o que é dele, como instâncias ligadas
+    entre si pelos objetos; bulk_create copia os ids na hora de gravar.
+    """
+    rng = random.Random(f"{semente}:{indice}")
+    inicio, fim = _anos_antes(hoje, anos), hoje + timedelta(days=dias_futuros)
+    dias_semana = [k for k, _ in TIPOS_DIA_SEMANA[:5]]  # terapias caem em dia útil
+    tipos_avulsos = [k for k, _ in TIPOS_EVENTO if k != _default_tipo_evento()] or [_default_tipo_evento()]
+
+    usuario = User(username=nome_de_usuario(indice, prefixo), first_name=rng.choice(_NOMES),
+                   last_name=rng.choice(_SOBRENOMES), password="!")
+    plano = {"usuario": usuario, "clinicas": [], "profissionais": [], "criancas": [], "rotinas": [],
+             "itens": [], "eventos": []}
+
+    for k in range(rng.randint(1, 3)):
+        plano["clinicas"].append(Clinica(nome=f"Clínica {rng.choice(_SOBRENOMES)} {k + 1}",
+                                         telefone=f"11 9{rng.randrange(10**7, 10**8)}", criado_por=usuario))
+    for _ in range(rng.randint(3, 6)):
+        tipo = _escolher(rng, PESOS_PROFISSIONAL)
+        plano["profissionais"].append(Profissional(
+            nome=_nome(rng), tipo=tipo, especialidade=_ESPECIALIDADES[tipo], criado_por=usuario,
+            clinica=rng.choice(plano["clinicas"]) if rng.random() < 0.7 else None,
+        ))
+
+    for _ in range(criancas):
+        crianca = Crianca(nome=_nome(rng), condicao=rng.choice(_CONDICOES), responsavel=usuario,
+                          data_nascimento=hoje - timedelta(days=rng.randint(2 * 365, 14 * 365)))
+        rotina = Rotina(nome=f"Rotina de {crianca.nome.split()[0]}", crianca=crianca, data_inicio=inicio,
+                        criado_por=usuario)
+        plano["criancas"].append(crianca)
+        plano["rotinas"].append(rotina)
+        comparecimento = rng.uniform(0.65, 0.95)
+
+        for _ in range(rng.randint(2, 6)):
+            prof = rng.choice(plano["profissionais"])
+            inicio_h = time(rng.randint(7, 17), rng.choice((0, 30)))
+            fim_h = _somar_minutos(inicio_h, rng.choice(_DURACOES))
+            item = RotinaItem(
+                nome_evento=_SESSOES[prof.tipo], periodicidade=_escolher(rng, PESOS_PERIODICIDADE),
+                dias_semana=rng.choice(dias_semana), hora_inicio=inicio_h, hora_fim=fim_h,
+                duracao=_calcular_duracao(inicio_h, fim_h), profissional=prof,
+                clinica=prof.clinica or rng.choice(plano["clinicas"]), rotina=rotina, criado_por=usuario,
+                materializado_ate=fim,
+            )
+            plano["itens"].append(item)
+            for d in _datas_do_item(item, inicio, fim, ancora=inicio):
+                plano["eventos"].append(Evento(
+                    nome=item.nome_evento, tipo=_default_tipo_evento(), data_evento=d,
+                    hora_inicio=item.hora_inicio, hora_fim=item.hora_fim, duracao=item.duracao,
+                    profissional=prof, clinica=item.clinica, crianca=crianca, criado_por=usuario,
+                    presenca_confirmada=d < hoje and rng.random() < comparecimento, origem_rotina_item=item,
+                ))
+
+        for _ in range(AVULSOS_POR_ANO * anos):
+            prof = rng.choice(plano["profissionais"])
+            d = inicio + timedelta(days=rng.randrange((fim - inicio).days + 1))
+            inicio_h = time(rng.randint(7, 17))
+            plano["eventos"].append(Evento(
+                nome=f"{_SESSOES[prof.tipo]} (avulso)", tipo=rng.choice(tipos_avulsos), data_evento=d,
+                hora_inicio=inicio_h, hora_fim=_somar_minutos(inicio_h, 60), duracao=timedelta(minutes=60),
+                profissional=prof, clinica=prof.clinica, crianca=crianca, criado_por=usuario,
+                presenca_confirmada=d < hoje and rng.random() < comparecimento,
+                notas="Gerado para teste de carga" if rng.random() < 0.2 else None,
+            ))
+    return plano
+
+
+def gravar_planos(planos: List[dict], *, batch_size: int = BATCH_SIZE_SINTETICO) -> dict:
+    """Grava os planos com um bulk_create por modelo, numa transação. Retorna as contagens."""
+    def juntar(chave):
+        return [obj for p in planos for obj in p[chave]]
+
+    with transaction.atomic():
+        User.objects.bulk_create([p["usuario"] for p in planos], batch_size=batch_size)
+        Clinica.objects.bulk_create(juntar("clinicas"), batch_size=batch_size)
+        Profissional.objects.bulk_create(juntar("profissionais"), batch_size=batch_size)
+        criancas = Crianca.objects.bulk_create(juntar("criancas"), batch_size=batch_size)
+        VersaoAgenda.objects.bulk_create([VersaoAgenda(crianca=c) for c in criancas], batch_size=batch_size)
+        Rotina.objects.bulk_create(juntar("rotinas"), batch_size=batch_size)
+        RotinaItem.objects.bulk_create(juntar("itens"), batch_size=batch_size)
+        _gravar_eventos(juntar("eventos"), batch_size)
+        reconstruir_resumo([c.pk for c in criancas])
+
+    return contar_planos(planos)
+
+
+_COLUNAS_EVENTO = ("nome", "tipo", "data_evento", "hora_inicio", "hora_fim", "duracao", "profissional_id",
+                   "clinica_id", "crianca_id", "notas", "presenca_confirmada", "criado_por_id", "data_criacao",
+                   "origem_rotina_item_id")
+
+
+def _gravar_eventos(eventos: List[Evento], batch_size: int):
+    """No Postgres vai por COPY (é o grosso dos dados); nos outros, bulk_create."""
+    if connection.vendor != "postgresql":
+        Evento.objects.bulk_create(eventos, batch_size=batch_size)
+        return
+    agora = timezone.now()
+    copiar_para_tabela(Evento, _COLUNAS_EVENTO, (
+        (ev.nome, ev.tipo, ev.data_evento, ev.hora_inicio, ev.hora_fim, ev.duracao,
+         ev.profissional and ev.profissional.pk, ev.clinica and ev.clinica.pk, ev.crianca.pk, ev.notas,
+         ev.presenca_confirmada, ev.criado_por.pk, agora, ev.origem_rotina_item and ev.origem_rotina_item.pk)
+        for ev in eventos
+    ))
+
+
+def contar_planos(planos: Iterable[dict]) -> dict:
+    totais = {"usuarios": 0, "criancas": 0, "itens": 0, "eventos": 0}
+    for p in planos:
+        totais["usuarios"] += 1
+        totais["criancas"] += len(p["criancas"])
+        totais["itens"] += len(p["itens"])
+        totais["eventos"] += len(p["eventos"])
+    return totais
+
+
+def gerar_faixa(ini: int, fim: int, semente: int, *, criancas: int, anos: int, hoje: date,
+                dias_futuros: int = 30, prefixo: str = PREFIXO_USUARIO, lote: int = 20,
+                batch_size: int = BATCH_SIZE_SINTETICO, dry_run: bool = False) -> dict:
+    """
+    Gera os usuários de índice em [ini, fim), `lote` usuários por transação.
+    Usuários que já existem são pulados, então dá para retomar uma geração
+    interrompida. Com dry_run=True só conta o que seria gravado.
+    """
+    totais = {"usuarios": 0, "criancas": 0, "itens": 0, "eventos": 0, "pulados": 0}
+    for a in range(ini, fim, lote):
+        indices = range(a, min(a + lote, fim))
+        existentes = set(User.objects.filter(username__in=[nome_de_usuario(i, prefixo) for i in indices])
+                         .values_list("username", flat=True))
+        planos = [
+            planejar_usuario(semente, i, criancas=criancas, anos=anos, hoje=hoje,
+                             dias_futuros=dias_futuros, prefixo=prefixo)
+            for i in indices if nome_de_usuario(i, prefixo) not in existentes
+        ]
+        totais["pulados"] += len(existentes)
+        parcial = contar_planos(planos) if dry_run else gravar_planos(planos, batch_size=batch_size)
+        for chave, n in parcial.items():
+            totais[chave] += n
+    return totais
@@ -0,0 +1,165 @@
+# terapias/tarefas.py
+"""
+Fila de tarefas no banco (TarefaRotina) para gerar/ressincronizar os
+eventos dos itens de rotina fora da request: o modal grava os itens,
+enfileira e responde; o worker (manage.py processar_tarefas) executa.
+
+- enfileirar: uma tarefa pendente por item. Pedir de novo para um item que
+  já está na fila não duplica; "sincronizar" cobre "expandir", então uma
+  pendente de expandir vira sincronizar. Grave na mesma transação dos
+  itens: o worker só enxerga a tarefa depois do commit.
+- reservar/executar: o worker pega a próxima pendente (SKIP LOCKED no
+  Postgres, e uma troca de estado condicional que vale em qualquer banco),
+  roda o serviço e grava o resultado. Erro volta para a fila com espera
+  crescente até MAX_TENTATIVAS; depois fica como "falhou".
+- recuperar_travadas: tarefas "executando" há mais de `timeout` (worker
+  morto no meio) voltam para a fila.
+
+Com TAREFAS_SINCRONAS = True, enfileirar já executa na hora (desenvolvimento
+sem worker).
+"""
+import logging
+import threading
+from datetime import timedelta
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from .models import RotinaItem, TarefaRotina
+from .services import expandir_rotina_item, sincronizar_eventos_do_item
+
+logger = logging.getLogger(__name__)
+
+MAX_TENTATIVAS = 3
+ESPERA_BASE = timedelta(seconds=10)  # 10s, 20s, 40s... entre tentativas
+TIMEOUT_PADRAO = timedelta(minutes=10)
+
+SERVICOS = {
+    "expandir": lambda item: expandir_rotina_item(item),
+    "sincronizar": lambda item: sincronizar_eventos_do_item(item, apagar_passado=False),
+}
+
+
+def enfileirar(itens: Iterable[RotinaItem], tipo: str, usuario=None) -> List[int]:
+    """Põe os itens na fila (sem duplicar pendentes); devolve os ids das tarefas pendentes deles."""
+    pks = sorted({it.pk for it in itens})
+    if not pks:
+        return []
+    # a pendente que já existir para o item fica (conflito na constraint parcial)
+    TarefaRotina.objects.bulk_create(
+        [TarefaRotina(item_id=pk, tipo=tipo, criado_por=usuario) for pk in pks], ignore_conflicts=True,
+    )
+    pendentes = TarefaRotina.objects.filter(item_id__in=pks, estado="pendente")
+    if tipo == "sincronizar":
+        pendentes.exclude(tipo=tipo).update(tipo=tipo)
+    ids = list(pendentes.order_by("pk").values_list("pk", flat=True))
+
+    if getattr(settings, "TAREFAS_SINCRONAS", False):
+        processar_pendentes(ids)
+    return ids
+
+
+def reservar(ids: Optional[List[int]] = None) -> Optional[TarefaRotina]:
+    """Marca a próxima tarefa pendente (que já pode rodar) como "executando" e a devolve."""
+    agora = timezone.now()
+    fila = TarefaRotina.objects.filter(estado="pendente", executar_apos__lte=agora)
+    if ids is not None:
+        fila = fila.filter(pk__in=ids)
+    while True:
+        with transaction.atomic():
+            tarefa = fila.select_for_update(skip_locked=True).order_by("executar_apos", "pk").first()
+            if tarefa is None:
+                return None
+            # sem SELECT FOR UPDATE (SQLite) outra thread pode ter pegado a mesma: só uma troca o estado
+            if TarefaRotina.objects.filter(pk=tarefa.pk, estado="pendente").update(
+                    estado="executando", tentativas=tarefa.tentativas + 1, iniciada_em=agora):
+                tarefa.estado, tarefa.tentativas, tarefa.iniciada_em = "executando", tarefa.tentativas + 1, agora
+                return tarefa
+
+
+def executar(tarefa: TarefaRotina) -> bool:
+    """Roda o serviço da tarefa reservada e grava o resultado (ou reagenda). True se deu certo."""
+    item = RotinaItem.objects.select_related("rotina").filter(pk=tarefa.item_id).first()
+    if item is None:  # item apagado no meio: a tarefa já foi junto (cascata)
+        return True
+    try:
+        resultado = SERVICOS[tarefa.tipo](item)
+    except Exception as e:
+        logger.exception("Tarefa %s (%s do item %s) falhou na tentativa %s",
+                         tarefa.pk, tarefa.tipo, tarefa.item_id, tarefa.tentativas)
+        _reagendar(tarefa, f"{type(e).__name__}: {e}")
+        return False
+    TarefaRotina.objects.filter(pk=tarefa.pk).update(
+        estado="concluida", concluida_em=timezone.now(), resultado=resultado, erro="")
+    return True
+
+
+def _reagendar(tarefa: TarefaRotina, erro: str):
+    mesma = TarefaRotina.objects.filter(pk=tarefa.pk)
+    if tarefa.tentativas >= MAX_TENTATIVAS:
+        mesma.update(estado="falhou", concluida_em=timezone.now(), erro=erro)
+        return
+    try:
+        with transaction.atomic():
+            mesma.update(estado="pendente", erro=erro,
+                         executar_apos=timezone.now() + ESPERA_BASE * 2 ** (tarefa.tentativas - 1))
+    except IntegrityError:
+        # o item foi pedido de novo enquanto esta rodava: a pendente nova refaz o trabalho
+        mesma.update(estado="falhou", concluida_em=timezone.now(),
+                     erro=f"{erro} (não reagendada: já há outra tarefa pendente para o item)")
+
+
+def recuperar_travadas(timeout: timedelta = TIMEOUT_PADRAO) -> int:
+    """Devolve à fila as tarefas "executando" há mais de `timeout`. Retorna quantas."""
+    travadas = TarefaRotina.objects.filter(estado="executando", iniciada_em__lt=timezone.now() - timeout)
+    n = 0
+    for tarefa in travadas:
+        _reagendar(tarefa, "interrompida: worker parou no meio da execução")
+        n += 1
+    return n
+
+
+def processar_pendentes(ids: Optional[List[int]] = None) -> dict:
+    """Executa, nesta thread, as pendentes que já podem rodar (ou só as de `ids`) até a fila esvaziar."""
+    contagem = {"concluidas": 0, "falhas": 0}
+    while (tarefa := reservar(ids)) is not None:
+        contagem["concluidas" if executar(tarefa) else "falhas"] += 1
+    return contagem
+
+
+def rodar_worker(parar: threading.Event, *, threads: int = 4, intervalo: float = 1.0,
+                 timeout: timedelta = TIMEOUT_PADRAO):
+    """Processa a fila com `threads` threads até `parar` ser sinalizado."""
+
+    def laco():
+        while not parar.is_set():
+            try:
+                tarefa = reservar()
+                if tarefa is None:
+                    parar.wait(intervalo)
+                else:
+                    executar(tarefa)
+            except Exception:  # banco fora do ar etc.: espera e tenta de novo
+                logger.exception("Erro no worker de tarefas")
+                parar.wait(intervalo)
+            finally:
+                close_old_connections()
+
+    pool = [threading.Thread(target=laco, name=f"tarefas-{i}", daemon=True) for i in range(threads)]
+    for t in pool:
+        t.start()
+    try:
+        while True:
+            try:
+                if n := recuperar_travadas(timeout):
+                    logger.warning("%s tarefa(s) travada(s) voltaram para a fila", n)
+            finally:
+                close_old_connections()
+            if parar.wait(timeout.total_seconds() / 2):
+                break
+    finally:  # Ctrl+C cai aqui: as threads terminam a tarefa em andamento antes de sair
+        parar.set()
+        for t in pool:
+            t.join()
@@ -1,3 +1,1224 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import date, datetime, time, timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from therapytrack import telemetria
+from therapytrack.telemetria import registro
+from usuario.models import Crianca
+
+from . import benchmarks, carga, ical, importacao, sintetico, tarefas
+from .cache_agenda import fragmento, versao_agenda
+from .metricas import indicadores_do_mes, verificar_resumo
+from .forms import RotinaItemBulkForm
+from .models import Clinica, Evento, Profissional, ResumoMensal, Rotina, RotinaItem, TarefaRotina
+from .variaveis_categoricas import TIPOS_DIA_SEMANA
+from .views import _grade_ctx
+from .services import (
+    WEEKDAY_MAP, _datas_anuais, _datas_do_item, estender_horizonte, expandir_rotina, expandir_rotina_item,
+    linhas_no_intervalo, materializar_ocorrencia, ocorrencias_no_intervalo, remover_eventos_do_item,
+    sincronizar_eventos_do_item,
+)
+
+try:
+    import numpy  # noqa: F401
+    from .datas_vetorizadas import datas_da_regra, datas_em_lote
+    TEM_NUMPY = True
+except ImportError:
+    TEM_NUMPY = False
+
+
+class DatasAnuaisTests(SimpleTestCase):
+    def test_29_de_fevereiro_cai_em_28_nos_anos_nao_bissextos(self):
+        datas = list(_datas_anuais(date(2024, 2, 29), date(2029, 1, 1)))
+        self.assertEqual(datas, [
+            date(2024, 2, 29), date(2025, 2, 28), date(2026, 2, 28),
+            date(2027, 2, 28), date(2028, 2, 29),
+        ])
+
+
+@skipUnless(TEM_NUMPY, "NumPy não instalado")
+class DatasVetorizadasTests(SimpleTestCase):
+    """datas_vetorizadas deve gerar exatamente as mesmas datas que services._datas_do_item."""
+
+    CASOS = [
+        # (periodicidade, dias_semana, ancora, inicio, fim)
+        ("diaria", None, date(2025, 1, 1), date(2025, 1, 1), date(2025, 12, 31)),
+        ("diaria", None, date(2025, 3, 10), date(2025, 1, 1), date(2025, 3, 12)),
+        ("semanal", "segunda", date(2025, 1, 1), date(2025, 1, 1), date(2025, 12, 31)),
+        ("semanal", "domingo", date(2025, 1, 5), date(2025, 1, 5), date(2025, 1, 5)),
+        ("semanal", None, date(2025, 1, 1), date(2025, 2, 1), date(2025, 4, 1)),
+        ("quinzenal", "quarta", date(2025, 1, 1), date(2025, 1, 1), date(2025, 12, 31)),
+        ("quinzenal", "quarta", date(2025, 1, 1), date(2025, 1, 9), date(2025, 6, 1)),
+        ("quinzenal", "sexta", date(2024, 12, 30), date(2025, 3, 14), date(2025, 3, 14)),
+        ("mensal", None, date(2025, 1, 31), date(2025, 1, 31), date(2026, 12, 31)),
+        ("mensal", None, date(2024, 1, 30), date(2024, 6, 1), date(2025, 6, 1)),
+        ("mensal", None, date(2024, 2, 29), date(2024, 2, 29), date(2025, 3, 31)),
+        ("anual", None, date(2024, 2, 29), date(2024, 2, 29), date(2033, 1, 1)),
+        ("anual", None, date(2024, 2, 29), date(2026, 1, 1), date(2028, 12, 31)),
+        ("anual", None, date(2023, 12, 31), date(2023, 12, 31), date(2030, 12, 31)),
+        ("pontual", None, date(2025, 5, 5), date(2025, 1, 1), date(2025, 12, 31)),
+        ("pontual", None, date(2025, 5, 5), date(2025, 6, 1), date(2025, 12, 31)),
+        ("diaria", None, date(2025, 1, 1), date(2025, 2, 1), date(2025, 1, 1)),  # intervalo vazio
+    ]
+
+    def _esperado(self, per, dia, ancora, inicio, fim):
+        ri = RotinaItem(periodicidade=per, dias_semana=dia)
+        return _datas_do_item(ri, inicio, fim, ancora=ancora)
+
+    def test_regra_a_regra(self):
+        for per, dia, ancora, inicio, fim in self.CASOS:
+            with self.subTest(per=per, dia=dia, ancora=ancora, inicio=inicio, fim=fim):
+                obtido = datas_da_regra(per, dia, inicio, fim, ancora=ancora).tolist()
+                self.assertEqual(obtido, self._esperado(per, dia, ancora, inicio, fim))
+
+    def test_lote_com_intervalos_por_regra(self):
+        regras = [(per, dia, ancora) for per, dia, ancora, _, _ in self.CASOS]
+        inicios = numpy.array([c[3] for c in self.CASOS], dtype="M8[D]")
+        fins = numpy.array([c[4] for c in self.CASOS], dtype="M8[D]")
+        idx, datas = datas_em_lote(regras, inicios, fins)
+        for i, caso in enumerate(self.CASOS):
+            with self.subTest(caso=caso):
+                self.assertEqual(datas[idx == i].tolist(), self._esperado(*caso))
+
+    def test_lote_vazio(self):
+        idx, datas = datas_em_lote([], date(2025, 1, 1), date(2025, 12, 31))
+        self.assertEqual(len(idx), 0)
+        self.assertEqual(len(datas), 0)
+
+    def test_lote_aleatorio_de_um_ano(self):
+        import random
+        rng = random.Random(42)
+        periodicidades = ["diaria", "semanal", "quinzenal", "mensal", "anual", "pontual"]
+        dias = [None, "segunda", "terca", "quarta", "quinta", "sexta", "sabado", "domingo"]
+        inicio, fim = date(2025, 1, 1), date(2025, 12, 31)
+        regras = [
+            (rng.choice(periodicidades), rng.choice(dias), date(2023, 1, 1) + timedelta(days=rng.randrange(900)))
+            for _ in range(500)
+        ]
+        idx, datas = datas_em_lote(regras, inicio, fim)
+        for i, (per, dia, ancora) in enumerate(regras):
+            self.assertEqual(datas[idx == i].tolist(), self._esperado(per, dia, ancora, inicio, fim))
+
+
+class VersaoAgendaTests(TestCase):
+    """Toda escrita que muda a agenda deve invalidar os fragmentos em cache."""
+
+    def setUp(self):
+        cache.clear()  # o locmem sobrevive entre testes, e os pks/versões se repetem
+        self.user = User.objects.create(username="resp")
+        self.crianca = Crianca.objects.create(nome="A", condicao="-", data_nascimento=date(2020, 1, 1),
+                                              responsavel=self.user)
+
+    def _grade(self):
+        v = versao_agenda(self.crianca.pk)
+        nomes = Evento.objects.filter(crianca=self.crianca).values_list("nome", flat=True)
+        return fragmento("grade", self.crianca.pk, v, ("teste",), lambda: ",".join(sorted(nomes)))
+
+    def test_escritas_unitarias_e_em_massa_trocam_a_versao(self):
+        self.assertEqual(self._grade(), "")
+
+        ev = Evento.objects.create(nome="avulso", tipo="consulta", data_evento=date.today(),
+                                   crianca=self.crianca, criado_por=self.user)
+        self.assertEqual(self._grade(), "avulso")
+
+        rotina = Rotina.objects.create(crianca=self.crianca, criado_por=self.user)
+        item = RotinaItem(rotina=rotina, nome_evento="rotina", periodicidade="pontual",
+                          hora_inicio=time(9), criado_por=self.user)
+        expandir_rotina(rotina, [item])
+        self.assertEqual(self._grade(), "avulso,rotina")
+
+        remover_eventos_do_item(item)
+        ev.delete()
+        self.assertEqual(self._grade(), "")
+
+
+class ExpansaoRotinaTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="resp")
+        self.crianca = Crianca.objects.create(nome="A", condicao="-", data_nascimento=date(2020, 1, 1),
+                                              responsavel=self.user)
+        self.hoje = date.today()
+        self.rotina = Rotina.objects.create(crianca=self.crianca, data_inicio=self.hoje,
+                                            data_termino=self.hoje + timedelta(days=27), criado_por=self.user)
+
+    def _item(self, rotina=None, **kw):
+        campos = {"nome_evento": "Fono", "periodicidade": "semanal", "dias_semana": "segunda",
+                  "hora_inicio": time(9), "hora_fim": time(10), "criado_por": self.user, **kw}
+        return RotinaItem.objects.create(rotina=rotina or self.rotina, **campos)
+
+    def _rotina_aberta(self):
+        return Rotina.objects.create(crianca=self.crianca, data_inicio=self.hoje, criado_por=self.user)
+
+    def test_eventos_saem_em_inserts_de_batch_size_linhas(self):
+        item = self._item(periodicidade="diaria")
+        with CaptureQueriesContext(connection) as ctx:
+            res = expandir_rotina_item(item, batch_size=10)
+        inserts = [q for q in ctx.captured_queries
+                   if q["sql"].startswith("INSERT") and 'INTO "terapias_evento"' in q["sql"]]
+        self.assertEqual(res["criadas"], 28)
+        self.assertEqual(len(inserts), 3)  # 10 + 10 + 8
+        self.assertEqual(Evento.objects.filter(origem_rotina_item=item).count(), 28)
+        self.assertEqual(verificar_resumo(), [])
+
+    def test_itens_novos_e_eventos_numa_transacao_so(self):
+        def novos(n):
+            rotina = Rotina.objects.create(crianca=self.crianca, data_inicio=self.hoje,
+                                           data_termino=self.hoje + timedelta(days=6), criado_por=self.user)
+            return rotina, [RotinaItem(rotina=rotina, nome_evento="Fono", periodicidade="diaria", dias_semana=d,
+                                       hora_inicio=time(9), criado_por=self.user)
+                            for d in ("segunda", "quarta", "sexta")[:n]]
+
+        with mock.patch("terapias.services._gravar_eventos", side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            expandir_rotina(*novos(2))
+        self.assertFalse(RotinaItem.objects.exists())  # os itens voltaram junto
+
+        expandir_rotina(*novos(3))  # cria as linhas do ResumoMensal dos meses envolvidos
+        with CaptureQueriesContext(connection) as um:
+            expandir_rotina(*novos(1))
+        with CaptureQueriesContext(connection) as tres:
+            res = expandir_rotina(*novos(3))
+        self.assertEqual(len(tres), len(um))  # não depende de quantos dias vieram no formulário
+        self.assertEqual((res["itens"], res["criadas"]), (3, 21))
+        self.assertEqual(verificar_resumo(), [])
+
+    def test_save_many_gravando_sobe_a_versao_da_agenda(self):
+        form = RotinaItemBulkForm({"nome_evento": "Fono", "periodicidade": "semanal",
+                                   "dias_semana_multi": ["segunda", "terca"], "hora_inicio": "09:00",
+                                   "hora_fim": "10:00"})
+        self.assertTrue(form.is_valid(), form.errors)
+        versao = versao_agenda(self.crianca.pk)
+        criados, pulados = form.save_many(self.rotina, self.user)
+        self.assertEqual((len(criados), pulados), (2, []))
+        self.assertTrue(all(it.pk for it in criados))
+        self.assertGreater(versao_agenda(self.crianca.pk), versao)
+
+    def test_ressincronizar_mantem_presenca_e_notas_e_so_apaga_as_datas_que_sairam(self):
+        item = self._item(periodicidade="diaria")
+        expandir_rotina_item(item)
+        amanha = self.hoje + timedelta(days=1)
+        marcado = Evento.objects.get(origem_rotina_item=item, data_evento=amanha)
+        marcado.presenca_confirmada, marcado.notas = True, "levar exames"
+        marcado.save()
+        antes = dict(Evento.objects.filter(origem_rotina_item=item).values_list("data_evento", "pk"))
+
+        dia = next(k for k, v in WEEKDAY_MAP.items() if v == amanha.weekday())
+        item.periodicidade, item.dias_semana, item.hora_inicio = "semanal", dia, time(14)
+        item.save()
+        res = sincronizar_eventos_do_item(item)
+
+        depois = dict(Evento.objects.filter(origem_rotina_item=item).values_list("data_evento", "pk"))
+        self.assertEqual(sorted(depois), [amanha + timedelta(weeks=i) for i in range(4)])
+        self.assertEqual((res["deletados"], res["atualizadas"], res["criadas"]), (24, 4, 0))
+        self.assertTrue(all(depois[d] == antes[d] for d in depois))  # os mesmos registros, sem recriar
+        marcado.refresh_from_db()
+        self.assertEqual((marcado.presenca_confirmada, marcado.notas, marcado.hora_inicio),
+                         (True, "levar exames", time(14)))
+        self.assertEqual(verificar_resumo(), [])
+
+    def test_ressincronizar_nao_apaga_nem_recua_o_que_o_horizonte_rolante_gerou(self):
+        aberta = self._rotina_aberta()
+        item = self._item(rotina=aberta)
+        expandir_rotina_item(item)
+        noventa = self.hoje + timedelta(days=90)
+        res = estender_horizonte(RotinaItem.objects.select_related("rotina").filter(pk=item.pk), noventa)
+        self.assertGreater(res["criadas"], 0)
+        longe = Evento.objects.filter(origem_rotina_item=item).latest("data_evento")
+        self.assertGreater(longe.data_evento, self.hoje + timedelta(days=30))
+        longe.notas = "trazer laudo"
+        longe.save()
+        total = Evento.objects.filter(origem_rotina_item=item).count()
+
+        item.refresh_from_db()  # como a view de edição, que lê o item do banco
+        item.hora_inicio = time(15)
+        item.save()
+        res = sincronizar_eventos_do_item(item)
+        self.assertEqual((res["deletados"], res["atualizadas"], res["criadas"]), (0, total, 0))
+        longe.refresh_from_db()
+        self.assertEqual((longe.notas, longe.hora_inicio), ("trazer laudo", time(15)))
+
+        expandir_rotina_item(item)
+        expandir_rotina(aberta)
+        item.refresh_from_db()
+        self.assertEqual(item.materializado_ate, noventa)
+        self.assertEqual(Evento.objects.filter(origem_rotina_item=item).count(), total)
+        self.assertEqual(verificar_resumo(), [])
+
+    def test_materializar_rotinas_avanca_o_watermark_e_nao_refaz(self):
+        item = self._item(rotina=self._rotina_aberta(), periodicidade="diaria")
+        saida = StringIO()
+        call_command("materializar_rotinas", dias=60, processos=1, stdout=saida)
+        item.refresh_from_db()
+        self.assertEqual(item.materializado_ate, self.hoje + timedelta(days=60))
+        self.assertEqual(Evento.objects.filter(origem_rotina_item=item).count(), 61)
+        self.assertIn("1 item(ns) estendido(s), 61 evento(s)", saida.getvalue())
+
+        saida = StringIO()
+        call_command("materializar_rotinas", dias=60, processos=1, stdout=saida)
+        self.assertIn("Nenhum item precisa ser estendido.", saida.getvalue())
+        self.assertEqual(verificar_resumo(), [])
+
+    def test_expandir_de_novo_nao_duplica_e_conta_as_puladas(self):
+        item = self._item()
+        primeira = expandir_rotina_item(item)
+        segunda = expandir_rotina_item(item)
+        self.assertEqual((primeira["criadas"], primeira["puladas"]), (4, 0))
+        self.assertEqual((segunda["criadas"], segunda["puladas"]), (0, 4))
+        res = expandir_rotina(self.rotina)
+        self.assertEqual((res["criadas"], res["puladas"]), (0, 4))
+        self.assertEqual(Evento.objects.filter(origem_rotina_item=item).count(), 4)
+        self.assertEqual(verificar_resumo(), [])
+
+    def test_constraint_barra_a_mesma_ocorrencia_duas_vezes(self):
+        item = self._item()
+        expandir_rotina_item(item)
+        ev = Evento.objects.filter(origem_rotina_item=item).first()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Evento.objects.create(nome="Fono", tipo="consulta", data_evento=ev.data_evento, crianca=self.crianca,
+                                  criado_por=self.user, origem_rotina_item=item)
+        # avulsos (sem origem) na mesma data continuam valendo
+        Evento.objects.create(nome="Fono", tipo="consulta", data_evento=ev.data_evento, crianca=self.crianca,
+                              criado_por=self.user)
+        Evento.objects.create(nome="Fono", tipo="consulta", data_evento=ev.data_evento, crianca=self.crianca,
+                              criado_por=self.user)
+        self.assertEqual(Evento.objects.filter(data_evento=ev.data_evento).count(), 3)
+
+
+class GradeRotinaTests(TestCase):
+    """_grade_ctx distribui os itens da rotina pelas células [hora][dia] numa passada só."""
+
+    def setUp(self):
+        self.user = User.objects.create(username="resp")
+        crianca = Crianca.objects.create(nome="A", condicao="-", data_nascimento=date(2020, 1, 1),
+                                         responsavel=self.user)
+        self.rotina = Rotina.objects.create(crianca=crianca, data_inicio=date(2025, 3, 3), criado_por=self.user)
+
+    def _item(self, nome, dia, hora, **kw):
+        return RotinaItem.objects.create(rotina=self.rotina, nome_evento=nome, periodicidade="semanal",
+                                         dias_semana=dia, hora_inicio=hora, criado_por=self.user, **kw)
+
+    def _celulas(self, ctx):
+        return {(ln["hora"].hour, col): [it.nome_evento for it in itens]
+                for ln in ctx["linhas"] for col, itens in enumerate(ln["celulas"]) if itens}
+
+    def test_itens_fora_do_horario_vao_para_a_linha_mais_proxima(self):
+        self._item("cedo", "segunda", time(6))
+        self._item("meia", "terca", time(9, 30))
+        self._item("tarde", "sexta", time(22))
+        self._item("sem hora", "domingo", None)
+        RotinaItem.objects.create(rotina=self.rotina, nome_evento="diaria", periodicidade="diaria",
+                                  hora_inicio=time(10), criado_por=self.user)  # sem dia: fora da grade
+
+        ctx = _grade_ctx(self.rotina)
+        self.assertEqual([h.hour for h in ctx["horas"]], list(range(8, 20)))
+        self.assertEqual(self._celulas(ctx), {
+            (8, 0): ["cedo"], (9, 1): ["meia"], (19, 4): ["tarde"], (8, 6): ["sem hora"],
+        })
+
+    def test_profissional_e_clinica_vem_no_mesmo_select(self):
+        for i in range(5):
+            prof = Profissional.objects.create(nome=f"P{i}", tipo="medico", criado_por=self.user)
+            clinica = Clinica.objects.create(nome=f"C{i}", criado_por=self.user)
+            self._item(f"item {i}", "quarta", time(8 + i), profissional=prof, clinica=clinica)
+        with self.assertNumQueries(1):
+            ctx = _grade_ctx(self.rotina)
+            nomes = [(it.profissional.nome, it.clinica.nome) for ln in ctx["linhas"] for itens in ln["celulas"]
+                     for it in itens]
+        self.assertEqual(nomes, [(f"P{i}", f"C{i}") for i in range(5)])
+
+
+class MigracaoDeduplicacaoTests(TransactionTestCase):
+    """0009 apaga os eventos repetidos por (item, data) antes de criar a constraint."""
+
+    usuario = ("usuario", "0005_alter_crianca_responsavel")
+    antes = [("terapias", "0008_rotinaitem_materializado_ate"), usuario]
+    depois = [("terapias", "0009_evento_unico_por_item_data"), usuario]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_fica_um_evento_por_item_e_data_de_preferencia_o_confirmado(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.antes)
+        apps = executor.loader.project_state(self.antes).apps
+        User_ = apps.get_model("auth", "User")
+        Crianca_ = apps.get_model("usuario", "Crianca")
+        Rotina_ = apps.get_model("terapias", "Rotina")
+        RotinaItem_ = apps.get_model("terapias", "RotinaItem")
+        Evento_ = apps.get_model("terapias", "Evento")
+
+        user = User_.objects.create(username="resp")
+        crianca = Crianca_.objects.create(nome="A", condicao="-", data_nascimento=date(2020, 1, 1), responsavel=user)
+        rotina = Rotina_.objects.create(crianca=crianca, criado_por=user)
+        item = RotinaItem_.objects.create(rotina=rotina, nome_evento="Fono", periodicidade="semanal",
+                                          criado_por=user)
+        d1, d2 = date(2025, 3, 3), date(2025, 3, 10)
+
+        def evento(d, origem=item, presenca=False):
+            return Evento_.objects.create(nome="Fono", tipo="consulta", data_evento=d, crianca=crianca,
+                                          criado_por=user, origem_rotina_item=origem, presenca_confirmada=presenca)
+
+        evento(d1)
+        confirmado = evento(d1, presenca=True)
+        evento(d1)
+        unico = evento(d2)
+        avulsos = [evento(d1, origem=None), evento(d1, origem=None)]
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.depois)
+        Evento_ = executor.loader.project_state(self.depois).apps.get_model("terapias", "Evento")
+        self.assertEqual(sorted(Evento_.objects.values_list("pk", flat=True)),
+                         sorted([confirmado.pk, unico.pk, *(a.pk for a in avulsos)]))
+
+
+class LinhasNoIntervaloTests(TestCase):
+    def test_projecao_igual_as_ocorrencias_completas(self):
+        user = User.objects.create(username="resp")
+        crianca = Crianca.objects.create(nome="A", condicao="-", data_nascimento=date(2020, 1, 1), responsavel=user)
+        clinica = Clinica.objects.create(nome="Clínica", criado_por=user)
+        prof = Profissional.objects.create(nome="Dra. B", tipo="medico", criado_por=user)
+        ini = date(2025, 3, 3)
+        rotina = Rotina.objects.create(crianca=crianca, data_inicio=ini - timedelta(days=10), criado_por=user)
+        item = RotinaItem.objects.create(rotina=rotina, nome_evento="Fono", periodicidade="diaria",
+                                         hora_inicio=time(9), hora_fim=time(10), profissional=prof,
+                                         clinica=clinica, criado_por=user)
+        RotinaItem.objects.filter(pk=item.pk).update(data_criacao=timezone.make_aware(datetime(2025, 1, 1)))
+        # exceção gravada de uma ocorrência + um evento avulso
+        Evento.objects.create(nome="Fono", tipo="consulta", data_evento=ini + timedelta(days=2), hora_inicio=time(11),
+                              crianca=crianca, criado_por=user, origem_rotina_item=item, presenca_confirmada=True)
+        Evento.objects.create(nome="Avulso", tipo="exame", data_evento=ini, crianca=crianca, criado_por=user)
+
+        def campos(ev, prof_nome, clin_nome):
+            return (ev.nome, ev.tipo, ev.data_evento, ev.hora_inicio, ev.hora_fim,
+                    prof_nome, clin_nome, ev.presenca_confirmada)
+
+        fim = ini + timedelta(days=6)
+        esperado = [campos(ev, ev.profissional and ev.profissional.nome, ev.clinica and ev.clinica.nome)
+                    for ev in ocorrencias_no_intervalo(crianca, ini, fim)]
+        obtido = [campos(ln, ln.profissional_nome, ln.clinica_nome) for ln in linhas_no_intervalo(crianca, ini, fim)]
+        self.assertEqual(len(obtido), 8)
+        self.assertEqual(obtido, esperado)
+
+
+class OcorrenciasCalculadasTests(TestCase):
+    """A grade calcula as ocorrências só depois do watermark (ou da criação) de cada item."""
+
+    def setUp(self):
+        self.user = User.objects.create(username="resp")
+        self.crianca = Crianca.objects.create(nome="A", condicao="-", data_nascimento=date(2020, 1, 1),
+                                              responsavel=self.user)
+        self.rotina = Rotina.objects.create(crianca=self.crianca, data_inicio=date(2025, 3, 3), criado_por=self.user)
+
+    def _item(self, dia, criado_em, **kw):
+        item = RotinaItem.objects.create(rotina=self.rotina, nome_evento=dia, periodicidade="semanal",
+                                         dias_semana=dia, hora_inicio=time(9), criado_por=self.user, **kw)
+        RotinaItem.objects.filter(pk=item.pk).update(data_criacao=timezone.make_aware(datetime.combine(criado_em, time(12))))
+        item.refresh_from_db()
+        return item
+
+    def _semana(self, segunda):
+        return [(ln.data_evento, ln.nome) for ln in linhas_no_intervalo(self.crianca, segunda, segunda + timedelta(days=6))]
+
+    def test_edicao_e_exclusao_nao_reaparecem_antes_do_watermark(self):
+        item = self._item("segunda", date(2025, 3, 1), materializado_ate=date(2025, 3, 20))
+        for d in (date(2025, 3, 3), date(2025, 3, 10), date(2025, 3, 17)):
+            Evento.objects.create(nome="segunda", tipo="consulta", data_evento=d, hora_inicio=time(9),
+                                  crianca=self.crianca, criado_por=self.user, origem_rotina_item=item)
+        item.dias_semana = "terca"
+        item.save()
+        Evento.objects.filter(data_evento=date(2025, 3, 10)).delete()
+
+        self.assertEqual(self._semana(date(2025, 3, 3)), [(date(2025, 3, 3), "segunda")])
+        self.assertEqual(self._semana(date(2025, 3, 10)), [])  # nem a apagada nem uma terça fantasma
+        self.assertEqual(self._semana(date(2025, 3, 17)), [(date(2025, 3, 17), "segunda")])
+        self.assertEqual(self._semana(date(2025, 3, 24)), [(date(2025, 3, 25), "segunda")])  # a regra nova
+        self.assertEqual([(ev.data_evento, ev.pk) for ev in ocorrencias_no_intervalo(
+            self.crianca, date(2025, 3, 10), date(2025, 3, 30))],
+            [(date(2025, 3, 17), Evento.objects.get(data_evento=date(2025, 3, 17)).pk), (date(2025, 3, 25), None)])
+
+    def test_item_sem_eventos_gerados_comeca_na_criacao(self):
+        self._item("quarta", date(2025, 3, 12))
+        self.assertEqual(self._semana(date(2025, 3, 3)), [])
+        self.assertEqual(self._semana(date(2025, 3, 10)), [(date(2025, 3, 12), "quarta")])
+
+    def test_cards_do_mes_contam_so_o_gravado(self):
+        item = self._item("segunda", date(2025, 3, 1), materializado_ate=date(2025, 3, 16))
+        for d in (date(2025, 3, 3), date(2025, 3, 10)):
+            Evento.objects.create(nome="segunda", tipo="consulta", data_evento=d, hora_inicio=time(9),
+                                  crianca=self.crianca, criado_por=self.user, origem_rotina_item=item)
+        grade = linhas_no_intervalo(self.crianca, date(2025, 3, 1), date(2025, 3, 31))
+        cards = indicadores_do_mes(self.crianca, date(2025, 3, 1), date(2025, 3, 31), date(2025, 3, 1))
+        self.assertEqual(len(grade), 5)  # 03, 10 gravadas + 17, 24, 31 calculadas
+        self.assertEqual(cards["total_agendados"], 2)
+        # até o watermark, grade e cards batem
+        self.assertEqual(len([ln for ln in grade if ln.data_evento <= item.materializado_ate]),
+                         cards["total_agendados"])
+
+
+class ResumoMensalTests(TestCase):
+    """O ResumoMensal acompanha cada escrita de Evento (e do tipo do profissional) sem recálculo."""
+
+    def setUp(self):
+        self.user = User.objects.create(username="resp")
+        self.crianca = Crianca.objects.create(nome="A", condicao="-", data_nascimento=date(2020, 1, 1),
+                                              responsavel=self.user)
+        self.clinica = Clinica.objects.create(nome="Clínica", criado_por=self.user)
+        self.prof = Profissional.objects.create(nome="Dra. B", tipo="medico", criado_por=self.user)
+        self.hoje = date.today()
+        self.rotina = Rotina.objects.create(crianca=self.crianca, data_inicio=self.hoje, criado_por=self.user)
+        self.item = RotinaItem.objects.create(rotina=self.rotina, nome_evento="Fono", periodicidade="diaria",
+                                              hora_inicio=time(9), hora_fim=time(10), criado_por=self.user)
+
+    def _evento(self, d, **kw):
+        return Evento.objects.create(nome="Consulta", tipo="consulta", data_evento=d, hora_inicio=time(9),
+                                     hora_fim=time(10), crianca=self.crianca, criado_por=self.user, **kw)
+
+    def _agendados(self, **filtros):
+        return sum(ResumoMensal.objects.filter(crianca=self.crianca, **filtros).values_list("agendados", flat=True))
+
+    def test_mudar_o_tipo_do_profissional_move_o_resumo(self):
+        self._evento(date(2025, 3, 10), profissional=self.prof, presenca_confirmada=True)
+        self._evento(date(2025, 4, 7), profissional=self.prof)
+        self.prof.tipo = "psicologo"
+        self.prof.save()
+        self.assertEqual(verificar_resumo(), [])
+        self.assertEqual(self._agendados(profissional_tipo="medico"), 0)
+        self.assertEqual(self._agendados(profissional_tipo="psicologo"), 2)
+
+        self.prof.nome = "Dra. C"  # sem mudar o tipo, nada se move
+        with CaptureQueriesContext(connection) as ctx:
+            self.prof.save()
+        self.assertFalse([q for q in ctx.captured_queries if "terapias_resumomensal" in q["sql"]])
+
+    def test_editar_e_apagar_evento_acertam_o_resumo(self):
+        ev = self._evento(date(2025, 3, 31), profissional=self.prof)
+        ev.data_evento = date(2025, 4, 1)  # troca de mês
+        ev.presenca_confirmada = True
+        ev.clinica = self.clinica
+        ev.hora_fim = time(11)
+        ev.save()
+        self.assertEqual(verificar_resumo(), [])
+        self.assertEqual(self._agendados(mes=date(2025, 3, 1)), 0)
+        self.assertEqual(self._agendados(mes=date(2025, 4, 1), clinica=self.clinica), 1)
+
+        ev.delete()
+        self.assertEqual(verificar_resumo(), [])
+        self.assertEqual(self._agendados(), 0)
+
+    def test_materializar_alem_do_watermark_e_estender_nao_contam_duas_vezes(self):
+        alvo = self.hoje + timedelta(days=50)
+        ev = materializar_ocorrencia(self.item, alvo, presenca_confirmada=True)
+        self.assertEqual(self.item.materializado_ate, alvo)  # o horizonte foi até a data
+        self.assertEqual(Evento.objects.filter(origem_rotina_item=self.item).count(), 51)
+
+        res = estender_horizonte([self.item], self.hoje + timedelta(days=90))
+        self.assertEqual(res["criadas"], 40)
+        self.assertEqual(Evento.objects.filter(origem_rotina_item=self.item).count(), 91)
+        self.assertTrue(Evento.objects.get(pk=ev.pk).presenca_confirmada)
+        self.assertEqual(self._agendados(), 91)
+        self.assertEqual(verificar_resumo(), [])
+
+    def test_estender_nao_conta_o_que_ja_esta_gravado_alem_do_watermark(self):
+        RotinaItem.objects.filter(pk=self.item.pk).update(materializado_ate=self.hoje + timedelta(days=6))
+        self.item.refresh_from_db()
+        self._evento(self.hoje + timedelta(days=10), origem_rotina_item=self.item)
+
+        ate = self.hoje + timedelta(days=13)
+        self.assertEqual(estender_horizonte([self.item], ate, dry_run=True)["criadas"], 6)
+        self.assertEqual(estender_horizonte([self.item], ate)["criadas"], 6)
+        self.assertEqual(self._agendados(), 7)
+        self.assertEqual(verificar_resumo(), [])
+
+
+class IndicesAgendaTests(TestCase):
+    """As consultas quentes da agenda usam os índices de Evento (ver bench_indices)."""
+
+    def setUp(self):
+        user = User.objects.create(username="resp")
+        self.crianca = Crianca.objects.create(nome="A", condicao="-", data_nascimento=date(2020, 1, 1),
+                                              responsavel=user)
+        outra = Crianca.objects.create(nome="B", condicao="-", data_nascimento=date(2020, 1, 1), responsavel=user)
+        rotina = Rotina.objects.create(crianca=self.crianca, data_inicio=date(2025, 1, 1), criado_por=user)
+        self.item = RotinaItem.objects.create(rotina=rotina, nome_evento="Fono", periodicidade="diaria",
+                                              criado_por=user)
+        Evento.objects.bulk_create([
+            Evento(nome="Fono", tipo="consulta", data_evento=date(2025, 1, 1) + timedelta(days=i % 365),
+                   hora_inicio=time(8 + i % 10), crianca=self.crianca if i % 2 else outra, criado_por=user,
+                   presenca_confirmada=i % 3 > 0, origem_rotina_item=self.item if i % 2 and i < 365 else None)
+            for i in range(2000)
+        ])
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute("SET LOCAL enable_seqscan = off")  # tabela pequena: força o planner a escolher índice
+            cursor.execute(f"ANALYZE {Evento._meta.db_table}")
+
+    def test_grade_e_proximos_usam_o_indice_por_crianca_e_data(self):
+        base = Evento.objects.filter(crianca=self.crianca)
+        grade = base.filter(data_evento__range=(date(2025, 3, 3), date(2025, 3, 9))).order_by("data_evento", "hora_inicio")
+        proximos = base.filter(data_evento__gte=date(2025, 6, 1)).order_by("data_evento", "hora_inicio")[:10]
+        self.assertIn("evento_crianca_data_idx", grade.explain())
+        self.assertIn("evento_crianca_data_idx", proximos.explain())
+
+    def test_pendentes_usam_o_indice_parcial(self):
+        pendentes = Evento.objects.filter(crianca=self.crianca, data_evento__range=(date(2025, 3, 1), date(2025, 3, 31)),
+                                          presenca_confirmada=False)
+        self.assertIn("evento_nao_confirmado_idx", pendentes.explain())
+
+    def test_sincronia_busca_por_item_num_indice(self):
+        # a constraint (origem_rotina_item, data_evento) ou o índice da FK; o planner escolhe pelo custo
+        plano = Evento.objects.filter(origem_rotina_item=self.item, data_evento__gte=date(2025, 6, 1)).explain()
+        self.assertRegex(plano, r"(USING INDEX \S+|Index Cond:) \(origem_rotina_item_id")
+        self.assertNotIn("Seq Scan", plano)
+
+
+class AgendaSemanaTests(TestCase):
+    """A navegação semanal só manda cards e lateral quando o mês da página muda."""
+
+    def setUp(self):
+        self.user = User.objects.create(username="resp")
+        self.crianca = Crianca.objects.create(nome="A", condicao="-", data_nascimento=date(2020, 1, 1),
+                                              responsavel=self.user)
+        Evento.objects.create(nome="Fono", tipo="consulta", data_evento=date(2025, 3, 12), hora_inicio=time(9),
+                              crianca=self.crianca, criado_por=self.user)
+        self.client.force_login(self.user)
+        cache.clear()  # os fragmentos do mês ficam em cache entre as requisições
+
+    def _semana(self, m):
+        with CaptureQueriesContext(connection) as ctx:
+            r = self.client.get(f"/agenda/semana/?crianca={self.crianca.pk}&d=2025-03-10&m={m}")
+        self.assertEqual(r.status_code, 200)
+        return r.content.decode(), len(ctx)
+
+    def test_mesmo_mes_devolve_so_a_grade_e_a_navegacao(self):
+        corpo, consultas = self._semana("2025-03")
+        self.assertIn('<div id="agenda-grade">', corpo)
+        self.assertIn("Fono", corpo)
+        self.assertIn('id="agenda-nav" hx-swap-oob="true"', corpo)
+        self.assertNotIn('id="agenda-indicadores"', corpo)
+        self.assertNotIn('id="agenda-lateral"', corpo)
+
+        cache.clear()
+        _, consultas_com_mes = self._semana("2025-02")
+        self.assertLess(consultas, consultas_com_mes)
+
+    def test_mes_diferente_inclui_cards_e_lateral(self):
+        corpo, _ = self._semana("2025-02")
+        self.assertIn('<div id="agenda-grade">', corpo)
+        self.assertIn('<div id="agenda-indicadores" hx-swap-oob="true">', corpo)
+        self.assertIn('<div id="agenda-lateral" hx-swap-oob="true">', corpo)
+        self.assertIn("Agendados (03/2025)", corpo)
+
+
+class AgendaFeedTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="resp")
+        self.crianca = Crianca.objects.create(nome="A", condicao="-", data_nascimento=date(2020, 1, 1),
+                                              responsavel=self.user)
+        Evento.objects.create(nome="Fono", tipo="consulta", data_evento=date(2025, 3, 3), hora_inicio=time(9),
+                              crianca=self.crianca, criado_por=self.user)
+        self.client.force_login(self.user)
+        self.url = f"/agenda/{self.crianca.pk}/eventos.json?de=2025-03-01&ate=2025-03-31"
+
+    def test_etag_devolve_304_sem_ler_eventos_ate_a_proxima_escrita(self):
+        r = self.client.get(self.url)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()["eventos"],
+                         [[Evento.objects.get().pk, None, "Fono", "consulta", "2025-03-03", "09:00", None, None, None, False]])
+
+        with self.assertNumQueries(4):  # sessão, usuário, criança, versão
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=r["ETag"]).status_code, 304)
+
+        Evento.objects.create(nome="Psico", tipo="consulta", data_evento=date(2025, 3, 4),
+                              crianca=self.crianca, criado_por=self.user)
+        r2 = self.client.get(self.url, HTTP_IF_NONE_MATCH=r["ETag"])
+        self.assertEqual(r2.status_code, 200)
+        self.assertEqual(len(r2.json()["eventos"]), 2)
+
+
+class AgendaIcsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="resp")
+        self.crianca = Crianca.objects.create(nome="A", condicao="-", data_nascimento=date(2020, 1, 1),
+                                              responsavel=self.user)
+        rotina = Rotina.objects.create(crianca=self.crianca, data_inicio=date(2025, 3, 1),
+                                       data_termino=date(2025, 3, 31), criado_por=self.user)
+        # gerado até 16/03: 03 e 10 gravadas (10 alterada); 24 alterada depois, além do watermark
+        self.item = RotinaItem.objects.create(rotina=rotina, nome_evento="Fono", periodicidade="semanal",
+                                              dias_semana="segunda", hora_inicio=time(9), criado_por=self.user,
+                                              materializado_ate=date(2025, 3, 16))
+        for d in (date(2025, 3, 3), date(2025, 3, 10), date(2025, 3, 24)):
+            Evento.objects.create(nome="Fono", tipo="consulta", data_evento=d, hora_inicio=time(9),
+                                  crianca=self.crianca, criado_por=self.user, origem_rotina_item=self.item)
+        Evento.objects.exclude(data_evento=date(2025, 3, 3)).update(hora_inicio=time(10))
+        self.url = f"/agenda/ics/{ical.token_assinatura(self.user.pk, crianca_id=self.crianca.pk)}.ics"
+
+    def _corpo(self):
+        return b"".join(self.client.get(self.url).streaming_content).decode()
+
+    def test_serie_comeca_depois_do_watermark_e_o_passado_sai_avulso(self):
+        r = self.client.get(self.url)  # sem login: vale o token
+        corpo = b"".join(r.streaming_content).decode()
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(corpo.count("BEGIN:VEVENT"), 4)
+        pk = self.item.pk
+        self.assertIn(f"UID:rotinaitem-{pk}@therapytrack\r\nDTSTAMP:", corpo)
+        self.assertIn("DTSTART;TZID=America/Sao_Paulo:20250317T090000\r\n", corpo)
+        self.assertIn("RRULE:FREQ=WEEKLY;BYDAY=MO;UNTIL=20250401T025959Z", corpo)
+        # gravadas antes da série: VEVENTs próprios, alterada ou não
+        self.assertIn(f"UID:rotinaitem-{pk}-20250303@therapytrack", corpo)
+        self.assertIn(f"UID:rotinaitem-{pk}-20250310@therapytrack", corpo)
+        self.assertIn("DTSTART;TZID=America/Sao_Paulo:20250310T100000", corpo)
+        # na série, só a exceção
+        self.assertEqual(corpo.count("RECURRENCE-ID"), 1)
+        self.assertIn("RECURRENCE-ID;TZID=America/Sao_Paulo:20250324T090000", corpo)
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=r["ETag"]).status_code, 304)
+        self.assertEqual(self.client.get(self.url.replace(".ics", "x.ics")).status_code, 404)
+
+    def test_editar_o_dia_nao_reescreve_o_que_ja_foi_gerado(self):
+        self.item.dias_semana = "terca"
+        self.item.save()
+        corpo = self._corpo()
+        self.assertIn("DTSTART;TZID=America/Sao_Paulo:20250318T090000\r\n", corpo)
+        self.assertIn("RRULE:FREQ=WEEKLY;BYDAY=TU;", corpo)
+        self.assertNotIn("RECURRENCE-ID", corpo)  # a segunda 24/03 não é uma terça da série
+        for d in ("20250303", "20250310", "20250324"):
+            self.assertIn(f"UID:rotinaitem-{self.item.pk}-{d}@therapytrack", corpo)
+        self.assertEqual(corpo.count("BEGIN:VEVENT"), 4)
+
+    def test_itens_sem_rrule_leem_as_datas_gravadas_numa_consulta_so(self):
+        # mensal ancorada no dia 31 não tem RRULE equivalente: sai uma ocorrência por VEVENT
+        rotina = Rotina.objects.create(crianca=self.crianca, data_inicio=date(2025, 1, 31),
+                                       data_termino=date(2025, 6, 30), criado_por=self.user)
+
+        def novo_item():
+            item = RotinaItem.objects.create(rotina=rotina, nome_evento="Psico", periodicidade="mensal",
+                                             hora_inicio=time(14), criado_por=self.user,
+                                             materializado_ate=date(2025, 2, 28))
+            Evento.objects.create(nome="Psico", tipo="consulta", data_evento=date(2025, 1, 31), hora_inicio=time(14),
+                                  crianca=self.crianca, criado_por=self.user, origem_rotina_item=item)
+
+        novo_item()
+        with CaptureQueriesContext(connection) as um:
+            corpo = self._corpo()
+        self.assertIn("DTSTART;TZID=America/Sao_Paulo:20250131T140000", corpo)  # a gravada
+        self.assertIn("DTSTART;TZID=America/Sao_Paulo:20250328T140000", corpo)  # calculada (o dia 31 "encolhe" em fevereiro)
+        novo_item()
+        novo_item()
+        with CaptureQueriesContext(connection) as tres:
+            self._corpo()
+        self.assertEqual(len(tres), len(um))
+
+    def test_item_sem_eventos_gerados_comeca_na_criacao(self):
+        Evento.objects.all().delete()
+        RotinaItem.objects.filter(pk=self.item.pk).update(
+            materializado_ate=None, data_criacao=timezone.make_aware(datetime(2025, 3, 12, 12)))
+        corpo = self._corpo()
+        self.assertEqual(corpo.count("BEGIN:VEVENT"), 1)
+        self.assertIn("DTSTART;TZID=America/Sao_Paulo:20250317T090000\r\n", corpo)
+
+
+class ImportacaoTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="resp")
+        self.crianca = Crianca.objects.create(nome="A", condicao="-", data_nascimento=date(2020, 1, 1),
+                                              responsavel=self.user)
+        self.prof = Profissional.objects.create(nome="Ana Lúcia", especialidade="Fono", criado_por=self.user)
+        Evento.objects.create(nome="Fono", tipo="consulta", data_evento=date(2025, 3, 3), hora_inicio=time(9),
+                              crianca=self.crianca, criado_por=self.user)
+
+    def test_csv_resolve_nomes_pula_duplicados_e_rejeita_linhas_invalidas(self):
+        linhas = [
+            "nome;data;hora_inicio;hora_fim;profissional\n",
+            "Fono;03/03/2025;09:00;09:50;ana lucia\n",  # já existe
+            "Fono;10/03/2025;09:00;09:50;ANA LÚCIA\n",
+            "Fono;10/03/2025;09:00;09:50;Ana Lúcia\n",  # repetida no arquivo
+            "Psico;2025-03-11;14h;;Fulano\n",
+            "Sem data;;10:00;;\n",
+        ]
+        res = importacao.importar(importacao.ler_csv(linhas), self.crianca, self.user, batch_size=2)
+        self.assertEqual((res["criados"], res["duplicados"], res["rejeitados"]), (2, 2, 1))
+        self.assertEqual(res["erros"], [(6, "sem data")])
+        self.assertEqual(res["nao_encontrados"], {"profissional: Fulano": 1})
+        ev = Evento.objects.get(data_evento=date(2025, 3, 10))
+        self.assertEqual((ev.profissional_id, ev.duracao), (self.prof.pk, timedelta(minutes=50)))
+
+    def test_ics_expande_rrule_respeitando_exdate_e_ocorrencias_alteradas(self):
+        ics = (
+            "BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\nUID:x\r\nSUMMARY:TO\r\n"
+            "DTSTART;TZID=America/Sao_Paulo:20250303T100000\r\nDTEND;TZID=America/Sao_Paulo:20250303T110000\r\n"
+            "RRULE:FREQ=WEEKLY;BYDAY=MO;COUNT=4\r\nEXDATE;TZID=America/Sao_Paulo:20250310T100000\r\n"
+            "END:VEVENT\r\nBEGIN:VEVENT\r\nUID:x\r\nSUMMARY:TO\r\nRECURRENCE-ID;TZID=America/Sao_Paulo:20250317T100000\r\n"
+            "DTSTART:20250318T130000Z\r\nEND:VEVENT\r\nEND:VCALENDAR\r\n"
+        )
+        res = importacao.importar(importacao.ler_ics(ics.splitlines(True)), self.crianca, self.user, dry_run=True)
+        self.assertEqual(res["criados"], 3)  # 03 e 24/03 da série + 18/03 alterada
+        self.assertEqual(Evento.objects.count(), 1)  # dry_run não grava
+
+    def _ics(self, *regras):
+        eventos = "".join(f"BEGIN:VEVENT\r\nUID:{i}\r\nSUMMARY:TO\r\nDTSTART;VALUE=DATE:20250303\r\n"
+                          f"RRULE:{regra}\r\nEND:VEVENT\r\n" for i, regra in enumerate(regras))
+        ics = f"BEGIN:VCALENDAR\r\n{eventos}END:VCALENDAR\r\n"
+        return importacao.importar(importacao.ler_ics(ics.splitlines(True)), self.crianca, self.user, dry_run=True)
+
+    def test_ics_rrule_invalida_rejeita_so_o_vevent(self):
+        res = self._ics("FREQ=DAILY;INTERVAL=0", "FREQ=WEEKLY;BYDAY=XX", "FREQ=DAILY;UNTIL=2025XX01",
+                        "FREQ=DAILY;COUNT=abc", "FREQ=DAILY;COUNT=0", "FREQ=MONTHLY;BYMONTHDAY=40",
+                        "FREQ=WEEKLY;BYDAY=MO;COUNT=2")
+        self.assertEqual((res["criados"], res["rejeitados"]), (2, 6))
+        self.assertEqual([motivo for _, motivo in res["erros"]], [
+            "RRULE não suportada: FREQ=DAILY;INTERVAL=0",
+            "RRULE inválida (BYDAY=XX): FREQ=WEEKLY;BYDAY=XX",
+            "RRULE inválida (UNTIL=2025XX01): FREQ=DAILY;UNTIL=2025XX01",
+            "RRULE inválida (COUNT=ABC): FREQ=DAILY;COUNT=abc",
+            "RRULE inválida (COUNT=0): FREQ=DAILY;COUNT=0",
+            "RRULE inválida (BYMONTHDAY=40): FREQ=MONTHLY;BYMONTHDAY=40",
+        ])
+
+    def test_ics_count_tem_teto(self):
+        res = self._ics("FREQ=DAILY;COUNT=10000000")
+        self.assertEqual((res["criados"], res["rejeitados"]), (importacao.MAX_COUNT_RRULE, 0))
+
+
+class CargaTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="resp")
+
+    def _carregar_familia(self, n_eventos: int):
+        carga.carregar("criancas", [{"usuario": "resp", "nome": "Bia", "condicao": "-", "data_nascimento": "2020-01-01"},
+                                    {"usuario": "ninguem", "nome": "X", "condicao": "-", "data_nascimento": "2020-01-01"}])
+        carga.carregar("profissionais", [{"usuario": "resp", "nome": "Ana", "tipo": "fonoaudiologo"}])
+        linhas = ({"usuario": "resp", "crianca": "Bia", "profissional": "Ana", "nome": "Fono", "tipo": "consulta",
+                   "data_evento": date(2025, 1, 1) + timedelta(days=i // 4), "hora_inicio": time(8 + i % 4),
+                   "hora_fim": time(8 + i % 4, 45), "presenca_confirmada": i % 3 == 0}
+                  for i in range(n_eventos))
+        return carga.carregar("eventos", linhas)
+
+    def test_resolve_referencias_rejeita_orfaos_e_mantem_resumo_e_versao(self):
+        res = self._carregar_familia(10)
+        res_orfaos = carga.carregar("eventos", [
+            {"usuario": "resp", "crianca": "Outra", "nome": "Fono", "tipo": "consulta", "data_evento": "2025-02-01"},
+            {"usuario": "resp", "crianca": "Bia", "tipo": "consulta", "data_evento": "2025-02-01"},  # sem nome
+        ])
+        self.assertEqual((res["carregados"], res["rejeitados"]), (10, 0))
+        self.assertEqual((res_orfaos["carregados"], res_orfaos["rejeitados"]), (0, 2))
+
+        bia = Crianca.objects.get()  # a da linha com usuário inexistente foi rejeitada
+        self.assertEqual(Evento.objects.filter(crianca=bia, profissional__nome="Ana").count(), 10)
+        self.assertEqual(verificar_resumo(), [])
+        self.assertGreater(versao_agenda(bia.pk), 0)
+
+    def test_valores_que_o_campo_nao_aceita_rejeitam_so_a_linha(self):
+        self._carregar_familia(0)
+        base = {"usuario": "resp", "crianca": "Bia", "nome": "Fono", "tipo": "consulta", "data_evento": "2025-02-01"}
+        res = carga.carregar("eventos", [
+            {**base, "data_evento": "2024-13-45"},
+            {**base, "hora_inicio": "25:00"},
+            {**base, "presenca_confirmada": "talvez"},
+            {**base, "nome": "F" * 101},  # max_length=100
+            {**base, "hora_inicio": "09:00", "presenca_confirmada": "True"},
+        ])
+        self.assertEqual((res["lidos"], res["carregados"], res["rejeitados"]), (5, 1, 4))
+        self.assertEqual(Evento.objects.get().hora_inicio, time(9))
+        self.assertEqual(verificar_resumo(), [])
+
+    def _csv(self, linhas):
+        fd, caminho = tempfile.mkstemp(suffix=".csv")
+        self.addCleanup(os.remove, caminho)
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            campos = list(linhas[0])
+            f.write(",".join(campos) + "\n")
+            f.writelines(",".join(str(l.get(c, "")) for c in campos) + "\n" for l in linhas)
+        return caminho
+
+    def test_comando_conta_as_linhas_ruins_sem_traceback(self):
+        self._carregar_familia(0)
+        caminho = self._csv([
+            {"usuario": "resp", "crianca": "Bia", "nome": "Fono", "tipo": "consulta", "data_evento": "2025-02-01"},
+            {"usuario": "resp", "crianca": "Bia", "nome": "Fono", "tipo": "consulta", "data_evento": "2024-13-45"},
+        ])
+        saida = StringIO()
+        call_command("carregar_dados", "eventos", caminho, stdout=saida)
+        self.assertIn("1 carregado(s), 1 rejeitado(s) de 2 linha(s)", saida.getvalue())
+
+    @skipUnless(connection.vendor == "postgresql", "COPY só existe no Postgres")
+    def test_vazao_do_copy(self):
+        self._carregar_familia(0)
+        caminho = self._csv([
+            {"usuario": "resp", "crianca": "Bia", "profissional": "Ana", "nome": "Fono", "tipo": "consulta",
+             "data_evento": date(2025, 1, 1) + timedelta(days=i // 4), "hora_inicio": time(8 + i % 4),
+             "hora_fim": time(8 + i % 4, 45), "presenca_confirmada": i % 3 == 0}
+            for i in range(50_000)
+        ])
+        saida = StringIO()
+        call_command("carregar_dados", "eventos", caminho, stdout=saida)
+        # a vazão sai na linha de resumo do comando ("... (N linhas/s).")
+        self.assertRegex(saida.getvalue(), r"^50000 carregado\(s\), 0 rejeitado\(s\) de 50000 linha\(s\) .*linhas/s")
+        self.assertEqual(Evento.objects.count(), 50_000)
+
+
+class SinteticoTests(TestCase):
+    def _resumo(self, plano):
+        return [(ev.nome, ev.data_evento, ev.hora_inicio, ev.presenca_confirmada, ev.profissional.nome)
+                for ev in plano["eventos"]]
+
+    def test_semente_determina_os_dados_e_retomar_pula_quem_ja_existe(self):
+        params = {"criancas": 2, "anos": 1, "hoje": date(2026, 1, 1)}
+        self.assertEqual(self._resumo(sintetico.planejar_usuario(7, 3, **params)),
+                         self._resumo(sintetico.planejar_usuario(7, 3, **params)))
+        self.assertNotEqual(self._resumo(sintetico.planejar_usuario(7, 3, **params)),
+                            self._resumo(sintetico.planejar_usuario(8, 3, **params)))
+
+        primeira = sintetico.gerar_faixa(0, 3, 7, lote=2, **params)
+        segunda = sintetico.gerar_faixa(0, 4, 7, lote=2, **params)
+        self.assertEqual((primeira["usuarios"], segunda["usuarios"], segunda["pulados"]), (3, 1, 3))
+        self.assertEqual(Evento.objects.count(), primeira["eventos"] + segunda["eventos"])
+        self.assertEqual(Crianca.objects.filter(versao_agenda__isnull=False).count(), 8)
+        self.assertEqual(verificar_resumo(), [])
+
+
+class BenchmarksTests(TestCase):
+    def test_suite_mede_tudo_sem_gravar_e_aponta_regressoes(self):
+        sintetico.gerar_faixa(0, 1, 1, criancas=1, anos=1, hoje=date.today())
+        eventos_antes = Evento.objects.count()
+
+        res = benchmarks.rodar(benchmarks.escolher_alvo(0), repeticoes=1)
+        self.assertEqual(Evento.objects.count(), eventos_antes)
+        self.assertIn("expandir_rotina_item[anual]", res["resultados"])
+        self.assertIn("busca[criancas]", res["resultados"])
+        self.assertTrue(all(r["consultas"] > 0 for r in res["resultados"].values()))
+
+        base = {"resultados": {"busca[criancas]": {**res["resultados"]["busca[criancas]"], "consultas": 1}}}
+        self.assertEqual(list(benchmarks.comparar(res, base)), ["busca[criancas]"])
+        self.assertEqual(benchmarks.comparar(res, res), {})
+
+
+class InstrumentacaoTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="resp")
+        self.client.force_login(self.user)
+
+    def test_server_timing_e_linha_de_log_com_as_queries_mais_lentas(self):
+        with override_settings(INSTRUMENTACAO_AMOSTRAGEM=1, INSTRUMENTACAO_CONSULTAS_LENTAS=2), \
+                self.assertLogs("therapytrack.desempenho", "INFO") as logs:
+            r = self.client.get("/clinicas/")
+        self.assertEqual(r.status_code, 200)
+        metricas = dict(m.split(";", 1)[0:2] for m in r["Server-Timing"].split(", "))
+        self.assertEqual(set(metricas), {"sql", "tpl", "view", "app", "total"})
+
+        linha = json.loads(logs.records[0].getMessage())
+        self.assertEqual((linha["rota"], linha["status"]), ("terapias:lista-clinicas", 200))
+        self.assertGreater(linha["consultas"], 0)
+        self.assertIn(f'desc="{linha["consultas"]} queries"', r["Server-Timing"])
+        self.assertEqual(len(linha["lentas"]), 2)
+        self.assertTrue(all(".py:" in q["origem"] for q in linha["lentas"]))
+
+    def test_fora_da_amostra_nao_mede(self):
+        with override_settings(INSTRUMENTACAO_AMOSTRAGEM=0):
+            self.assertNotIn("Server-Timing", self.client.get("/clinicas/"))
+
+
+class TelemetriaTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="resp")
+        crianca = Crianca.objects.create(nome="A", condicao="-", data_nascimento=date(2020, 1, 1),
+                                         responsavel=self.user)
+        self.rotina = Rotina.objects.create(crianca=crianca, data_inicio=date.today(),
+                                            data_termino=date.today() + timedelta(days=27), criado_por=self.user)
+        self.client.force_login(self.user)
+
+    def test_latencia_e_queries_por_nome_de_url_e_eventos_dos_servicos(self):
+        rota = {"view": "terapias:novo-item-rotina", "method": "GET"}
+        antes = registro.valor("therapytrack_http_request_duration_seconds", **rota)
+        consultas = registro.valor("therapytrack_db_queries_total", view=rota["view"])
+        self.assertEqual(self.client.get(f"/rotinas/{self.rotina.pk}/novo-item/").status_code, 200)
+        self.assertEqual(registro.valor("therapytrack_http_request_duration_seconds", **rota), antes + 1)
+        self.assertGreater(registro.valor("therapytrack_db_queries_total", view=rota["view"]), consultas)
+
+        criados = {"service": "expandir_rotina_item", "operation": "created"}
+        apagados = {"service": "sincronizar_eventos_do_item", "operation": "deleted"}
+        n_criados = registro.valor("therapytrack_service_events_total", **criados)
+        n_apagados = registro.valor("therapytrack_service_events_total", **apagados)
+        item = RotinaItem.objects.create(rotina=self.rotina, nome_evento="Fono", periodicidade="semanal",
+                                         dias_semana="segunda", hora_inicio=time(9), criado_por=self.user)
+        expandir_rotina_item(item)
+        item.periodicidade = "quinzenal"
+        item.save()
+        sincronizar_eventos_do_item(item)
+        self.assertEqual(registro.valor("therapytrack_service_events_total", **criados), n_criados + 4)
+        self.assertEqual(registro.valor("therapytrack_service_events_total", **apagados), n_apagados + 2)
+
+    def test_endpoint_soma_os_arquivos_dos_outros_processos(self):
+        outro = telemetria.Registro()
+        outro.observar("therapytrack_service_duration_seconds", 0.02, service="x")
+        outro.observar("therapytrack_service_duration_seconds", 3, service="x")
+        with tempfile.TemporaryDirectory() as d, override_settings(METRICAS_DIR=d, METRICAS_TOKEN="s3"):
+            outro.gravar(os.path.join(d, "1.json"))
+            self.assertEqual(self.client.get("/metrics").status_code, 401)
+            r = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3")
+        corpo = r.content.decode()
+        self.assertTrue(r["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn("# TYPE therapytrack_service_duration_seconds histogram", corpo)
+        self.assertIn('therapytrack_service_duration_seconds_bucket{service="x",le="0.025"} 1\n', corpo)
+        self.assertIn('therapytrack_service_duration_seconds_bucket{service="x",le="+Inf"} 2\n', corpo)
+        self.assertIn('therapytrack_service_duration_seconds_count{service="x"} 2\n', corpo)
+        self.assertIn('therapytrack_http_request_duration_seconds_count{method="GET",view="metricas"}', corpo)
+
+
+class OrcamentoConsultasMixin:
+    """
+    Orçamento de queries: cada endpoint é medido com os dados crescendo
+    (`tamanhos`) e o número de queries tem que ser o mesmo em todos. Quem
+    usa define `semear(n)`, que leva os dados ao tamanho n, e `endpoints()`,
+    {nome: função que faz a request}. Na falha, as queries do maior tamanho
+    são impressas.
+
+    A primeira rodada (no menor tamanho) só aquece e não é medida: a primeira
+    escrita do mês cria as linhas de ResumoMensal, o que custa queries a mais
+    uma vez só, independente do volume.
+    """
+    tamanhos = (1, 4, 12)
+
+    def assertConsultasConstantes(self):
+        medidas = {}
+        for rodada, n in enumerate((self.tamanhos[0], *self.tamanhos)):
+            self.semear(n)
+            for nome, requisicao in self.endpoints().items():
+                cache.clear()  # fragmentos da agenda: sempre o caminho sem cache
+                with CaptureQueriesContext(connection) as ctx:
+                    r = requisicao()
+                self.assertLess(r.status_code, 400, f"{nome}: HTTP {r.status_code}")
+                if rodada:
+                    medidas.setdefault(nome, []).append((n, ctx.captured_queries))
+
+        for nome, por_tamanho in medidas.items():
+            with self.subTest(endpoint=nome):
+                contagens = [len(q) for _, q in por_tamanho]
+                if len(set(contagens)) > 1:
+                    n, consultas = por_tamanho[-1]
+                    listagem = "\n".join(f"  {i}. {q['sql']}" for i, q in enumerate(consultas, 1))
+                    self.fail(f"{nome}: queries variam com os dados "
+                              f"{dict(zip(self.tamanhos, contagens))}; com {n}:\n{listagem}")
+
+
+@override_settings(AGENDA_CONSULTAS_PARALELAS=False)  # conexões paralelas não veem a transação do teste
+class OrcamentoConsultasTests(OrcamentoConsultasMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="resp", is_staff=True)
+        self.crianca = Crianca.objects.create(nome="A", condicao="-", data_nascimento=date(2020, 1, 1),
+                                              responsavel=self.user)
+        self.clinica = Clinica.objects.create(nome="Clínica 0", criado_por=self.user)
+        self.profissional = Profissional.objects.create(nome="Prof 0", clinica=self.clinica, criado_por=self.user)
+        self.rotina = Rotina.objects.create(crianca=self.crianca, data_inicio=date.today(),
+                                            data_termino=date.today() + timedelta(days=60), criado_por=self.user)
+        self.n = self.rodada = 0
+        self.client.force_login(self.user)
+
+    def semear(self, n):
+        hoje = date.today()
+        segunda = hoje - timedelta(days=hoje.weekday())
+        dias = [d for d, _ in TIPOS_DIA_SEMANA]
+        for i in range(self.n, n):
+            clinica = Clinica.objects.create(nome=f"Clínica {i + 1}", criado_por=self.user)
+            prof = Profissional.objects.create(nome=f"Prof {i + 1}", clinica=clinica, criado_por=self.user)
+            Profissional.objects.create(nome=f"Prof {i + 1}b", clinica=self.clinica, criado_por=self.user)
+            Crianca.objects.create(nome=f"C{i}", condicao="-", data_nascimento=date(2020, 1, 1),
+                                   responsavel=self.user)
+            RotinaItem.objects.create(rotina=self.rotina, nome_evento=f"Item {i}", periodicidade="semanal",
+                                      dias_semana=dias[i % 7], hora_inicio=time(8 + i % 10), hora_fim=time(9 + i % 10),
+                                      profissional=prof, clinica=clinica, criado_por=self.user)
+            for d in (segunda + timedelta(days=i % 7), hoje + timedelta(days=i)):
+                Evento.objects.create(nome=f"Ev {i}", tipo="consulta", data_evento=d, hora_inicio=time(9),
+                                      hora_fim=time(10), crianca=self.crianca, profissional=prof, clinica=clinica,
+                                      criado_por=self.user)
+        self.n = n
+        self.rodada += 1
+        # um item novo a cada rodada para o POST de exclusão
+        self.descartavel = RotinaItem.objects.create(
+            rotina=self.rotina, nome_evento="Descartável", periodicidade="semanal", dias_semana="domingo",
+            hora_inicio=time(7, self.rodada), criado_por=self.user)
+
+    def endpoints(self):
+        get = self.client.get
+        c, clin, prof, rot = self.crianca.pk, self.clinica.pk, self.profissional.pk, self.rotina.pk
+        item = RotinaItem.objects.filter(rotina=self.rotina).exclude(pk=self.descartavel.pk).order_by("pk").first()
+        hoje = date.today()
+        token = ical.token_assinatura(self.user.pk, crianca_id=c)
+        novo_item = {"nome_evento": f"Novo {self.n}", "periodicidade": "semanal", "dias_semana_multi": ["terca"],
+                     "hora_inicio": f"20:{self.rodada:02d}", "hora_fim": "21:00"}
+        return {
+            "agenda": lambda: get(f"/?crianca={c}&d={hoje}"),
+            "agenda-async": lambda: get(f"/agenda/async/?crianca={c}&d={hoje}"),
+            "agenda-semana": lambda: get(f"/agenda/semana/?crianca={c}&d={hoje}&m=2000-01"),
+            "agenda-feed": lambda: get(f"/agenda/{c}/eventos.json"),
+            "agenda-ics": lambda: get(f"/agenda/ics/{token}.ics"),
+            "agenda-cache": lambda: get("/agenda/cache/"),
+            "lista-clinicas": lambda: get("/clinicas/"),
+            "criar-clinica": lambda: get("/clinicas/nova/"),
+            "detalhes-clinica": lambda: get(f"/clinicas/{clin}/"),
+            "editar-clinica": lambda: get(f"/clinicas/{clin}/editar/"),
+            "deletar-clinica": lambda: get(f"/clinicas/{clin}/deletar/"),
+            "lista-profissionais": lambda: get("/profissionais/"),
+            "criar-profissional": lambda: get("/profissionais/novo/"),
+            "detalhes-profissional": lambda: get(f"/profissionais/{prof}/"),
+            "editar-profissional": lambda: get(f"/profissionais/{prof}/editar/"),
+            "deletar-profissional": lambda: get(f"/profissionais/{prof}/deletar/"),
+            "criar-evento": lambda: get("/eventos/novo/"),
+            "importar-agenda": lambda: get("/eventos/importar/"),
+            "criar-rotina": lambda: get("/rotinas/nova/"),
+            "planejar-rotina": lambda: get(f"/rotinas/{rot}/planejar/"),
+            "novo-item-rotina": lambda: get(f"/rotinas/{rot}/novo-item/?d=segunda&t=14:00"),
+            "novo-item-rotina[POST]": lambda: self.client.post(f"/rotinas/{rot}/novo-item/", novo_item),
+            "editar-item-rotina": lambda: get(f"/rotinas/itens/{item.pk}/editar/"),
+            "editar-item-rotina[POST]": lambda: self.client.post(f"/rotinas/itens/{item.pk}/editar/", {
+                "nome_evento": f"Editado {self.rodada}", "periodicidade": "semanal", "dias_semana": item.dias_semana,
+                "hora_inicio": f"08:{self.rodada:02d}", "hora_fim": "09:00"}),
+            "excluir-item-rotina[POST]": lambda: self.client.post(f"/rotinas/itens/{self.descartavel.pk}/excluir/"),
+            "status-tarefas": lambda: get("/rotinas/tarefas/status/?ids="
+                                          + ",".join(str(pk) for pk in TarefaRotina.objects.values_list("pk", flat=True))),
+        }
+
+    def test_queries_nao_crescem_com_os_dados(self):
+        self.assertConsultasConstantes()
+
+
+class AgendaAsyncTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="resp")
+        self.crianca = Crianca.objects.create(nome="A", condicao="-", data_nascimento=date(2020, 1, 1),
+                                              responsavel=self.user)
+        Crianca.objects.create(nome="B", condicao="-", data_nascimento=date(2021, 1, 1), responsavel=self.user)
+        hoje = date.today()
+        for i in range(6):
+            Evento.objects.create(nome=f"Ev {i}", tipo="consulta", data_evento=hoje + timedelta(days=i),
+                                  hora_inicio=time(9 + i), hora_fim=time(10 + i), crianca=self.crianca,
+                                  criado_por=self.user)
+        self.client.force_login(self.user)
+
+    def test_mesma_pagina_da_view_sincrona_em_paralelo_ou_nao(self):
+        sincrona = self.client.get(f"/?crianca={self.crianca.pk}").context
+        fragmentos = ("grade_html", "indicadores_html", "lateral_html")
+        for paralelas in (True, False):
+            with self.subTest(paralelas=paralelas), override_settings(AGENDA_CONSULTAS_PARALELAS=paralelas):
+                cache.clear()
+                r = self.client.get(f"/agenda/async/?crianca={self.crianca.pk}")
+                self.assertEqual(r.status_code, 200)
+                self.assertEqual([r.context[f] for f in fragmentos], [sincrona[f] for f in fragmentos])
+                self.assertEqual([c.nome for c in r.context["criancas"]], ["A", "B"])
+
+        self.assertEqual(self.client.get("/agenda/async/?crianca=999").status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get("/agenda/async/").status_code, 302)
+
+
+class TarefasTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="resp")
+        crianca = Crianca.objects.create(nome="A", condicao="-", data_nascimento=date(2020, 1, 1),
+                                         responsavel=self.user)
+        self.rotina = Rotina.objects.create(crianca=crianca, data_inicio=date.today(),
+                                            data_termino=date.today() + timedelta(days=27), criado_por=self.user)
+        self.client.force_login(self.user)
+
+    def _item(self, **kw):
+        return RotinaItem.objects.create(rotina=self.rotina, nome_evento="Fono", periodicidade="semanal",
+                                         dias_semana=kw.pop("dias_semana", "segunda"), hora_inicio=time(9),
+                                         criado_por=self.user, **kw)
+
+    def test_modal_so_enfileira_e_o_worker_gera_os_eventos(self):
+        r = self.client.post(f"/rotinas/{self.rotina.pk}/novo-item/", {
+            "nome_evento": "Fono", "periodicidade": "semanal", "dias_semana_multi": ["segunda", "quarta"],
+            "hora_inicio": "09:00", "hora_fim": "10:00"})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(RotinaItem.objects.filter(rotina=self.rotina).count(), 2)
+        self.assertFalse(Evento.objects.exists())
+        ids = list(TarefaRotina.objects.filter(estado="pendente", tipo="expandir").values_list("pk", flat=True))
+        self.assertEqual(len(ids), 2)
+        self.assertContains(r, 'hx-trigger="every 1s"')
+
+        status = f"/rotinas/tarefas/status/?ids={','.join(map(str, ids))}"
+        self.assertEqual(self.client.get(status).status_code, 200)
+
+        self.assertEqual(tarefas.processar_pendentes(), {"concluidas": 2, "falhas": 0})
+        self.assertEqual(Evento.objects.count(), 8)
+        r = self.client.get(status)
+        self.assertEqual(r.status_code, 286)  # o HTMX para de consultar
+        self.assertContains(r, "8 evento(s) criado(s)", status_code=286)
+        self.assertNotContains(r, "hx-get", status_code=286)
+
+        self.client.force_login(User.objects.create(username="outro"))
+        self.assertNotContains(self.client.get(status), "evento", status_code=286)
+
+    def test_uma_pendente_por_item_e_sincronizar_cobre_expandir(self):
+        item = self._item()
+        ids = tarefas.enfileirar([item], "expandir")
+        self.assertEqual(tarefas.enfileirar([item], "expandir"), ids)
+        self.assertEqual(tarefas.enfileirar([item], "sincronizar"), ids)
+        self.assertEqual(TarefaRotina.objects.get().tipo, "sincronizar")
+
+        tarefas.processar_pendentes()
+        self.assertNotEqual(tarefas.enfileirar([item], "expandir"), ids)  # a concluída não bloqueia
+        self.assertEqual(TarefaRotina.objects.count(), 2)
+
+    def test_edicao_ressincroniza_pela_fila(self):
+        item = self._item()
+        expandir_rotina_item(item)
+        r = self.client.post(f"/rotinas/itens/{item.pk}/editar/", {
+            "nome_evento": "Fono", "periodicidade": "semanal", "dias_semana": "terca",
+            "hora_inicio": "09:00", "hora_fim": "10:00"})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(TarefaRotina.objects.get().tipo, "sincronizar")
+        self.assertTrue(all(e.data_evento.weekday() == 0 for e in Evento.objects.all()))
+
+        tarefas.processar_pendentes()
+        self.assertTrue(Evento.objects.exists())
+        self.assertTrue(all(e.data_evento.weekday() == 1 for e in Evento.objects.filter(data_evento__gte=date.today())))
+
+    def test_erro_volta_para_a_fila_com_espera_e_desiste_depois_do_limite(self):
+        [pk] = tarefas.enfileirar([self._item()], "expandir")
+
+        def quebrar(item):
+            raise RuntimeError("banco fora")
+
+        with mock.patch.dict(tarefas.SERVICOS, expandir=quebrar), self.assertLogs("terapias.tarefas", "ERROR"):
+            self.assertEqual(tarefas.processar_pendentes(), {"concluidas": 0, "falhas": 1})
+            tarefa = TarefaRotina.objects.get(pk=pk)
+            self.assertEqual((tarefa.estado, tarefa.tentativas), ("pendente", 1))
+            self.assertIn("RuntimeError: banco fora", tarefa.erro)
+            self.assertGreater(tarefa.executar_apos, timezone.now())
+            self.assertIsNone(tarefas.reservar())  # ainda esperando
+
+            for _ in range(tarefas.MAX_TENTATIVAS - 1):
+                TarefaRotina.objects.filter(pk=pk).update(executar_apos=timezone.now())
+                tarefas.processar_pendentes()
+        tarefa = TarefaRotina.objects.get(pk=pk)
+        self.assertEqual((tarefa.estado, tarefa.tentativas), ("falhou", tarefas.MAX_TENTATIVAS))
+        self.assertFalse(Evento.objects.exists())
+
+    def test_travada_volta_para_a_fila(self):
+        [pk] = tarefas.enfileirar([self._item()], "expandir")
+        self.assertEqual(tarefas.reservar().pk, pk)
+        self.assertEqual(tarefas.recuperar_travadas(timedelta(minutes=10)), 0)
+        TarefaRotina.objects.filter(pk=pk).update(iniciada_em=timezone.now() - timedelta(hours=1))
+        self.assertEqual(tarefas.recuperar_travadas(timedelta(minutes=10)), 1)
+        self.assertEqual(TarefaRotina.objects.get(pk=pk).estado, "pendente")
+
+    @override_settings(TAREFAS_SINCRONAS=True)
+    def test_modo_sincrono_executa_na_hora(self):
+        tarefas.enfileirar([self._item()], "expandir")
+        self.assertEqual(TarefaRotina.objects.get().estado, "concluida")
+        self.assertEqual(Evento.objects.count(), 4)
@@ -6,6 +6,11 @@ app_name = "terapias"
 
 urlpatterns = [
     path('', views.AgendaIndexView.as_view(), name='index'),
+    path('agenda/async/', views.AgendaIndexAsyncView.as_view(), name='index-async'),
+    path('agenda/semana/', views.AgendaSemanaView.as_view(), name='agenda-semana'),
+    path('agenda/<int:crianca_id>/eventos.json', views.AgendaFeedView.as_view(), name='agenda-feed'),
+    path('agenda/ics/<str:token>.ics', views.AgendaIcsView.as_view(), name='agenda-ics'),
+    path('agenda/cache/', views.AgendaCacheView.as_view(), name='agenda-cache'),
 
     # CLINICAS
     path("clinicas/", views.ClinicaListView.as_view(), name="lista-clinicas"),
@@ -23,6 +28,7 @@ urlpatterns = [
 
     # EVENTOS
     path("eventos/novo/", views.EventoCriarView.as_view(), name="criar-evento"),
+    path("eventos/importar/", views.ImportarAgendaView.as_view(), name="importar-agenda"),
 
     # ROTINAS
     path("rotinas/nova/", views.RotinaCriarView.as_view(), name="criar-rotina"),
@@ -30,4 +36,5 @@ urlpatterns = [
     path("rotinas/<int:pk>/novo-item/", views.RotinaItemModalView.as_view(), name="novo-item-rotina"),
     path("rotinas/itens/<int:item_id>/editar/", views.RotinaItemEditarModalView.as_view(), name="editar-item-rotina"),
     path("rotinas/itens/<int:item_id>/excluir/", views.RotinaItemExcluirView.as_view(), name="excluir-item-rotina"),
+    path("rotinas/tarefas/status/", views.TarefasStatusView.as_view(), name="status-tarefas"),
 ]
\ No newline at end of file
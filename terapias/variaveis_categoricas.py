@@ -33,4 +33,16 @@ TIPOS_EVENTO = (
     ('avaliacao', 'Avaliação'),
     ('seguimento', 'Seguimento'),
     ('outro', 'Outro')
-)
\ No newline at end of file
+)
+
+TIPOS_TAREFA = (
+    ('expandir', 'Gerar eventos'),
+    ('sincronizar', 'Ressincronizar eventos'),
+)
+
+ESTADOS_TAREFA = (
+    ('pendente', 'Na fila'),
+    ('executando', 'Em execução'),
+    ('concluida', 'Concluída'),
+    ('falhou', 'Falhou'),
+)
@@ -1,25 +1,39 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render
-from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.core import signing
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django.contrib import messages
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse, reverse_lazy
-from django.views.generic import CreateView, DetailView, ListView, DeleteView, UpdateView, View, TemplateView
-from django.contrib.auth.mixins import LoginRequiredMixin
+from django.views.generic import CreateView, DetailView, FormView, ListView, DeleteView, UpdateView, View, TemplateView
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.messages.views import SuccessMessageMixin
+from django.db import close_old_connections, transaction
 from django.db.models import Q, Count
 from django.shortcuts import get_object_or_404
 from django.template.loader import render_to_string
 
+import asyncio
+import io
 from datetime import date, datetime, timedelta, time
 from calendar import monthrange
 from collections import defaultdict
 
 from usuario.models import Crianca
-from .models import Clinica, Profissional, Evento, Rotina, RotinaItem
-from .forms import ClinicaForm, ProfissionalForm, EventoForm, RotinaForm, RotinaItemBulkForm, RotinaItemForm
+from .models import Clinica, Profissional, Evento, Rotina, RotinaItem, TarefaRotina
+from .forms import ClinicaForm, ProfissionalForm, EventoForm, ImportacaoAgendaForm, RotinaForm, RotinaItemBulkForm, RotinaItemForm
 from .variaveis_categoricas import TIPOS_DIA_SEMANA
-from .services import expandir_rotina_item, sincronizar_eventos_do_item
+from .cache_agenda import estatisticas, fragmento, marcador_agenda, versao_agenda, zerar_estatisticas
+from .feed import DIAS_STREAMING, MAX_DIAS, feed_json
+from . import ical, importacao
+from .metricas import carga_do_mes, indicadores_do_mes
+from .services import linhas_no_intervalo, remover_eventos_do_item, salvar_itens
+from .tarefas import enfileirar
 
 from .variaveis_categoricas import TIPOS_DIA_SEMANA, TIPOS_PROFISSIONAL
 
@@ -30,17 +44,6 @@ def _monday_of(d: date) -> date:
 def _last_day_of_month(y: int, m: int) -> date:
     return date(y, m, monthrange(y, m)[1])
 
-def _duration(ev: Evento) -> timedelta:
-    """Retorna a duração do evento (usa campo ou calcula por hora_inicio/fim)."""
-    if ev.duracao:
-        return ev.duracao
-    if ev.hora_inicio and ev.hora_fim:
-        base = date.today()
-        dt_i = datetime.combine(base, ev.hora_inicio)
-        dt_f = datetime.combine(base, ev.hora_fim)
-        return dt_f - dt_i
-    return timedelta()
-
 def _fmt_td(td: timedelta) -> str:
     """Formata timedelta como 2h30, 45min, etc."""
     total_min = int(td.total_seconds() // 60)
@@ -153,7 +156,8 @@ class ProfissionalListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         qs = super().get_queryset()
-        qs = qs.filter(criado_por=self.request.user)
+        # a lista mostra a clínica de cada profissional: junta no mesmo SELECT
+        qs = qs.filter(criado_por=self.request.user).select_related("clinica")
 
         q = self.request.GET.get("q", "").strip()
         if q:
@@ -166,10 +170,16 @@ class ProfissionalListView(LoginRequiredMixin, ListView):
         return qs
 
 class ProfissionalDetailView(LoginRequiredMixin, DetailView):
-    model = Profissional
+    queryset = Profissional.objects.select_related("clinica")
     template_name = "terapias/telas_detalhes/detalhes_profissionais.html"
     context_object_name = "profissional"
 
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        token = ical.token_assinatura(self.request.user.pk, profissional_id=self.object.pk)
+        ctx["ics_url"] = self.request.build_absolute_uri(reverse("terapias:agenda-ics", args=[token]))
+        return ctx
+
 class ProfissionalDeleteView(LoginRequiredMixin, DeleteView):
     model = Profissional
     template_name = "terapias/telas_deletar/profissional_deletar.html"
@@ -221,6 +231,36 @@ class EventoCriarView(LoginRequiredMixin, SuccessMessageMixin, CreateView):
         # fecha o modal e volta para a página de origem quando possível
         return self.request.GET.get("next") or self.request.META.get("HTTP_REFERER") or reverse_lazy("admin:index")
 
+class ImportarAgendaView(LoginRequiredMixin, FormView):
+    """Importa uma agenda existente (.ics ou .csv) como Eventos de uma criança (ver terapias.importacao)."""
+    form_class = ImportacaoAgendaForm
+    template_name = "terapias/telas_criacao/importar_agenda.html"
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["request"] = self.request
+        return kwargs
+
+    def form_valid(self, form):
+        arquivo = form.cleaned_data["arquivo"]
+        crianca = form.cleaned_data["crianca"]
+        # lido em streaming: uploads grandes já ficam num arquivo temporário
+        linhas = io.TextIOWrapper(arquivo.file, encoding="utf-8-sig", newline="")
+        try:
+            registros = importacao.ler_arquivo(linhas, importacao.formato_pelo_nome(arquivo.name))
+            resultado = importacao.importar(registros, crianca, self.request.user,
+                                            dry_run=form.cleaned_data["dry_run"])
+        except ValueError as e:  # cabeçalho inválido, arquivo que não é UTF-8...
+            form.add_error("arquivo", f"Não foi possível ler o arquivo: {e}")
+            return self.form_invalid(form)
+
+        if not form.cleaned_data["dry_run"] and resultado["criados"]:
+            messages.success(self.request, f"{resultado['criados']} evento(s) importado(s) para {crianca.nome}.")
+        return self.render_to_response(self.get_context_data(
+            form=form, resultado=resultado, crianca=crianca, dry_run=form.cleaned_data["dry_run"],
+        ))
+
+
 # ----------------------- CRUD ROTINAS ---------------------------
 class RotinaCriarView(LoginRequiredMixin, SuccessMessageMixin, CreateView):
     model = Rotina
@@ -241,14 +281,34 @@ class RotinaCriarView(LoginRequiredMixin, SuccessMessageMixin, CreateView):
         return reverse("terapias:planejar-rotina", args=[self.object.pk])
 
 def _grade_ctx(rotina):
-    """Contexto padrão da grade semanal."""
+    """
+    Contexto padrão da grade semanal da rotina: `linhas` já traz, para cada
+    hora, os itens de cada dia, montados numa passada só sobre os itens.
+
+    O item cai na linha da hora cheia do seu início (09:30 -> 09:00); fora de
+    08..19 vai para a linha mais próxima, sem horário vai para a primeira.
+    """
     horas = [time(h, 0) for h in range(8, 20)]  # 08:00..19:00
     dias = list(TIPOS_DIA_SEMANA)               # [('segunda','Segunda-feira'), ...]
-    itens = RotinaItem.objects.filter(rotina=rotina).order_by("hora_inicio")
-    return {"horas": horas, "dias": dias, "itens": itens}
+    coluna = {key: i for i, (key, _) in enumerate(dias)}
+    linhas = [{"hora": h, "celulas": [[] for _ in dias]} for h in horas]
+
+    itens = (RotinaItem.objects
+             .filter(rotina=rotina)
+             .select_related("profissional", "clinica")
+             .order_by("hora_inicio", "pk"))
+    primeira, ultima = horas[0].hour, len(horas) - 1
+    for it in itens:
+        col = coluna.get(it.dias_semana)
+        if col is None:  # sem dia da semana não tem coluna na grade
+            continue
+        i = min(max(it.hora_inicio.hour - primeira, 0), ultima) if it.hora_inicio else 0
+        linhas[i]["celulas"][col].append(it)
+
+    return {"horas": horas, "dias": dias, "linhas": linhas}
 
 class RotinaPlanejarView(LoginRequiredMixin, DetailView):
-    model = Rotina
+    queryset = Rotina.objects.select_related("crianca")
     template_name = "terapias/telas_criacao/rotina_planejar.html"
     context_object_name = "rotina"
 
@@ -257,12 +317,6 @@ class RotinaPlanejarView(LoginRequiredMixin, DetailView):
         ctx.update(_grade_ctx(self.object))
         return ctx
 
-def _grade_ctx(rotina):
-    horas = [time(h, 0) for h in range(8, 20)]
-    dias = list(TIPOS_DIA_SEMANA)
-    itens = RotinaItem.objects.filter(rotina=rotina).order_by("hora_inicio")
-    return {"horas": horas, "dias": dias, "itens": itens}
-
 class RotinaItemModalView(LoginRequiredMixin, View):
     dialog_tpl = "terapias/partials/rotina_item_dialog.html"
     grade_tpl = "terapias/partials/rotina_grade.html"
@@ -279,28 +333,32 @@ class RotinaItemModalView(LoginRequiredMixin, View):
         return HttpResponse(html)
 
     def post(self, request, pk):
-        rotina = get_object_or_404(Rotina, pk=pk)
         form = RotinaItemBulkForm(request.POST)
         if form.is_valid():
-            criados, pulados = form.save_many(rotina, request.user)
+            with transaction.atomic():
+                # trava a rotina: um duplo clique no "Salvar" espera o primeiro submit
+                # terminar e aí encontra os dias já ocupados (viram "pulados")
+                rotina = get_object_or_404(Rotina.objects.select_for_update(), pk=pk)
+                criados, pulados = form.save_many(rotina, request.user, commit=False)
 
-            # 👇 GERA OS EVENTOS para cada RotinaItem criado
-            total_eventos = 0
-            for it in criados:
-                res = expandir_rotina_item(it)
-                total_eventos += res["criadas"]
+                # 👇 grava os itens e só ENFILEIRA a geração dos eventos: o worker
+                # (manage.py processar_tarefas) gera depois do commit e o modal responde já
+                salvar_itens(rotina, criados)
+                tarefas = enfileirar(criados, "expandir", request.user)
 
             grade_html = render_to_string(
                 self.grade_tpl, {"rotina": rotina, **_grade_ctx(rotina), "oob": True}, request=request
             )
 
-            msg = f"Criados {len(criados)} item(ns), {total_eventos} evento(s)."
+            msg = f"Criados {len(criados)} item(ns)."
             if pulados:
                 msg += f" Itens pulados: {len(pulados)} (conflito dia/horário)."
+            msg += " " + _status_tarefas_html(request, tarefas)
             toast = f'<div id="toast" hx-swap-oob="true" style="position:fixed;bottom:16px;right:16px;background:#111;color:#fff;padding:8px 12px;border-radius:6px;">{msg}</div>'
 
             return HttpResponse(grade_html + '<div id="modal"></div>' + toast)
 
+        rotina = get_object_or_404(Rotina, pk=pk)
         html = render_to_string(self.dialog_tpl, {"form": form, "rotina": rotina}, request=request)
         return HttpResponseBadRequest(html)
     
@@ -333,18 +391,50 @@ class RotinaItemEditarModalView(LoginRequiredMixin, View):
             return HttpResponseForbidden("Permissão negada")
         form = RotinaItemForm(request.POST, instance=item, request=request)
         if form.is_valid():
-            item = form.save()
-            # ressincroniza eventos futuros deste item
-            sincronizar_eventos_do_item(item, apagar_passado=False)
+            with transaction.atomic():
+                item = form.save()
+                # ressincroniza eventos futuros deste item (na fila, pelo worker)
+                tarefas = enfileirar([item], "sincronizar", request.user)
 
             grade_html = render_to_string(self.grade_tpl, {"rotina": item.rotina, **_grade_ctx(item.rotina), "oob": True}, request=request)
-            toast = '<div id="toast" hx-swap-oob="true" style="position:fixed;bottom:16px;right:16px;background:#111;color:#fff;padding:8px 12px;border-radius:6px;">Item atualizado.</div>'
+            toast = f'<div id="toast" hx-swap-oob="true" style="position:fixed;bottom:16px;right:16px;background:#111;color:#fff;padding:8px 12px;border-radius:6px;">Item atualizado. {_status_tarefas_html(request, tarefas)}</div>'
             return HttpResponse(grade_html + '<div id="modal"></div>' + toast)
 
         html = render_to_string(self.dialog_tpl, {"form": form, "item": item, "rotina": item.rotina}, request=request)
         return HttpResponseBadRequest(html)
 
 
+def _status_tarefas(request, ids) -> dict:
+    """Contagens das tarefas de geração de eventos (só as das crianças do usuário)."""
+    linhas = (TarefaRotina.objects
+              .filter(pk__in=ids, item__rotina__crianca__responsavel=request.user)
+              .values_list("estado", "resultado"))
+    ctx = {"ids": ",".join(map(str, ids)), "total": 0, "ativas": 0, "falhas": 0, "criadas": 0, "apagadas": 0}
+    for estado, resultado in linhas:
+        ctx["total"] += 1
+        ctx["ativas"] += estado in ("pendente", "executando")
+        ctx["falhas"] += estado == "falhou"
+        ctx["criadas"] += (resultado or {}).get("criadas", 0)
+        ctx["apagadas"] += (resultado or {}).get("deletados", 0)
+    ctx["prontas"] = ctx["total"] - ctx["ativas"]
+    return ctx
+
+
+def _status_tarefas_html(request, ids) -> str:
+    # enquanto houver tarefa na fila, o fragmento se reconsulta via HTMX (TarefasStatusView)
+    return render_to_string("terapias/partials/tarefas_status.html", _status_tarefas(request, ids), request=request)
+
+
+class TarefasStatusView(LoginRequiredMixin, View):
+    """GET ?ids=1,2,3 -> fragmento de status das tarefas; 286 (o HTMX para de consultar) quando todas terminaram."""
+
+    def get(self, request):
+        ids = [int(i) for i in request.GET.get("ids", "").split(",") if i.isdigit()]
+        ctx = _status_tarefas(request, ids)
+        html = render_to_string("terapias/partials/tarefas_status.html", ctx, request=request)
+        return HttpResponse(html, status=200 if ctx["ativas"] else 286)
+
+
 class RotinaItemExcluirView(LoginRequiredMixin, View):
     """
     POST -> exclui item, apaga eventos futuros gerados por ele e atualiza grade.
@@ -358,10 +448,7 @@ class RotinaItemExcluirView(LoginRequiredMixin, View):
 
         rotina = item.rotina
         # apaga eventos futuros do item (antes de excluir o item)
-        try:
-            sincronizar_eventos_do_item(item, apagar_passado=False)  # isso já apaga futuros e reexpande
-        except Exception:
-            pass  # se quiser apenas apagar, troque por: Evento.objects.filter(origem_rotina_item=item, data_evento__gte=date.today()).delete()
+        remover_eventos_do_item(item, apagar_passado=False)
 
         item.delete()
 
@@ -371,7 +458,133 @@ class RotinaItemExcluirView(LoginRequiredMixin, View):
     
 # ---------------------- AGENDA ------------------------
 # Create your views here.
-class AgendaIndexView(LoginRequiredMixin, TemplateView):
+class AgendaMixin:
+    """Partes da agenda compartilhadas pela página inteira e pela navegação semanal."""
+
+    def _ref_date(self) -> date:
+        # Data de referência (para navegar nas semanas) — querystring ?d=YYYY-MM-DD
+        try:
+            ref_str = self.request.GET.get("d")
+            return datetime.strptime(ref_str, "%Y-%m-%d").date() if ref_str else date.today()
+        except ValueError:
+            return date.today()
+
+    def _datas_semana(self, ref_date: date) -> dict:
+        semana_ini = _monday_of(ref_date)
+        return {
+            "ref_date": ref_date,
+            "semana_ini": semana_ini,
+            "semana_fim": semana_ini + timedelta(days=6),
+            "semana_anterior": ref_date - timedelta(days=7),
+            "proxima_semana": ref_date + timedelta(days=7),
+            "m_ini": date(ref_date.year, ref_date.month, 1),
+        }
+
+    def _datas_mes(self, ref_date: date) -> dict:
+        return {
+            "m_ini": date(ref_date.year, ref_date.month, 1),
+            "m_fim": _last_day_of_month(ref_date.year, ref_date.month),
+        }
+
+    # Fragmentos renderizados em cache, na versão atual da agenda da criança
+    # (qualquer escrita incrementa a versão; ver terapias.cache_agenda).
+    # Cards e lateral dependem de "hoje" (pendentes, próximos), então ele entra na chave.
+
+    def _grade_html(self, crianca, semana_ini: date, versao: int) -> str:
+        semana_fim = semana_ini + timedelta(days=6)
+        return fragmento(
+            "grade", crianca.pk, versao, (semana_ini,),
+            lambda: render_to_string("terapias/partials/agenda_grade.html",
+                                     self._contexto_grade(crianca, semana_ini, semana_fim)),
+        )
+
+    def _indicadores_html(self, crianca, ref_date: date, hoje: date, versao: int) -> str:
+        m = self._datas_mes(ref_date)
+        return fragmento(
+            "indicadores", crianca.pk, versao, (m["m_ini"], hoje),
+            lambda: render_to_string("terapias/partials/agenda_indicadores.html",
+                                     {"m_ini": m["m_ini"], **indicadores_do_mes(crianca, m["m_ini"], m["m_fim"], hoje)}),
+        )
+
+    def _lateral_html(self, crianca, ref_date: date, hoje: date, versao: int) -> str:
+        m = self._datas_mes(ref_date)
+        return fragmento(
+            "lateral", crianca.pk, versao, (m["m_ini"], hoje),
+            lambda: render_to_string("terapias/partials/agenda_lateral.html",
+                                     self._contexto_lateral(crianca, m["m_ini"], m["m_fim"], hoje)),
+        )
+
+    def _contexto_semana(self, crianca, ref_date: date, versao: int) -> dict:
+        datas = self._datas_semana(ref_date)
+        return {**datas, "grade_html": self._grade_html(crianca, datas["semana_ini"], versao)}
+
+    def _contexto_mes(self, crianca, ref_date: date, versao: int) -> dict:
+        # Métricas do mês corrente (com base no ref_date)
+        hoje = date.today()
+        return {
+            **self._datas_mes(ref_date),
+            "indicadores_html": self._indicadores_html(crianca, ref_date, hoje, versao),
+            "lateral_html": self._lateral_html(crianca, ref_date, hoje, versao),
+        }
+
+    def _contexto_grade(self, crianca, semana_ini, semana_fim):
+        # Ocorrências da semana (gravadas + calculadas das rotinas), só as colunas da grade
+        linhas = linhas_no_intervalo(crianca, semana_ini, semana_fim)
+
+        # Grade [hora][dia] montada numa passada só; fora de 08..20 vai para a linha mais próxima
+        horas = [time(h, 0) for h in range(8, 21)]  # 08:00..20:00
+        grid_rows = [
+            {"hora": h, "cells": [{"dia_key": key, "events": []} for key, _ in TIPOS_DIA_SEMANA]}
+            for h in horas
+        ]
+        primeira, ultima = horas[0].hour, len(horas) - 1
+        for ln in linhas:
+            i = min(max(ln.hora_inicio.hour - primeira, 0), ultima) if ln.hora_inicio else 0
+            grid_rows[i]["cells"][ln.data_evento.weekday()]["events"].append(ln)
+
+        return {
+            "horas": horas,
+            "dias": list(TIPOS_DIA_SEMANA),  # [('segunda','Segunda-feira'), ...]
+            "dias_header": [{"label": label, "date": semana_ini + timedelta(days=i)}
+                            for i, (_, label) in enumerate(TIPOS_DIA_SEMANA)],
+            "grid_rows": grid_rows,
+        }
+
+    def _contexto_lateral(self, crianca, m_ini, m_fim, hoje):
+        # Carga horária por clínica e por especialidade (somada no banco)
+        carga_clinica, carga_tipo = carga_do_mes(crianca, m_ini, m_fim)
+        por_clinica = defaultdict(timedelta)
+        por_especialidade = defaultdict(timedelta)
+        for nome, dur in carga_clinica.items():
+            por_clinica[nome or "—"] += dur
+        for tipo_code, dur in carga_tipo.items():
+            por_especialidade[PROF_TIPO_LABEL.get(tipo_code, "—")] += dur
+
+        # Ordena por maior carga
+        por_clinica_list = sorted(
+            [{"clinica": k, "duracao": _fmt_td(v), "seconds": int(v.total_seconds())} for k, v in por_clinica.items()],
+            key=lambda x: -x["seconds"]
+        )
+        por_especialidade_list = sorted(
+            [{"especialidade": k, "duracao": _fmt_td(v), "seconds": int(v.total_seconds())} for k, v in por_especialidade.items()],
+            key=lambda x: -x["seconds"]
+        )
+
+        # Próximas consultas (próximos 7 a 10 itens); só as gravadas, como os cards
+        # (ver metricas.indicadores_do_mes)
+        proximos = (Evento.objects
+                    .select_related("profissional", "clinica")
+                    .filter(crianca=crianca, data_evento__gte=hoje)
+                    .order_by("data_evento", "hora_inicio")[:10])
+
+        return {
+            "por_clinica": por_clinica_list,
+            "por_especialidade": por_especialidade_list,
+            "proximos": proximos,
+        }
+
+
+class AgendaIndexView(LoginRequiredMixin, AgendaMixin, TemplateView):
     template_name = "index.html"
 
     def get_context_data(self, **kwargs):
@@ -396,101 +609,190 @@ class AgendaIndexView(LoginRequiredMixin, TemplateView):
             })
             return ctx
 
-        # Data de referência (para navegar nas semanas) — querystring ?d=YYYY-MM-DD
-        try:
-            ref_str = self.request.GET.get("d")
-            ref_date = datetime.strptime(ref_str, "%Y-%m-%d").date() if ref_str else date.today()
-        except ValueError:
-            ref_date = date.today()
+        ref_date = self._ref_date()
+        versao = versao_agenda(crianca.pk)
+        ctx["ics_url"] = self.request.build_absolute_uri(reverse(
+            "terapias:agenda-ics", args=[ical.token_assinatura(user.pk, crianca_id=crianca.pk)]))
+        ctx.update(self._contexto_semana(crianca, ref_date, versao))
+        ctx.update(self._contexto_mes(crianca, ref_date, versao))
+        return ctx
 
-        semana_ini = _monday_of(ref_date)
-        semana_fim = semana_ini + timedelta(days=6)
 
-        # Eventos da semana
-        semana_qs = (Evento.objects
-                     .select_related("profissional", "clinica")
-                     .filter(crianca=crianca, data_evento__range=(semana_ini, semana_fim))
-                     .order_by("data_evento", "hora_inicio", "hora_fim", "nome"))
+async def _em_paralelo(*funcoes):
+    """
+    Roda funções síncronas (ORM + render) ao mesmo tempo, cada uma numa thread
+    com a sua conexão, e devolve os resultados na ordem. Os métodos async do
+    ORM (aget, async for...) não servem para isso: todos rodam na mesma thread,
+    um depois do outro.
+
+    Cada thread usa a própria conexão; close_old_connections a fecha no fim,
+    a não ser que CONN_MAX_AGE (DB_CONN_MAX_AGE) a mantenha aberta para a
+    próxima request: sem isso, abrir três conexões por página custa mais do
+    que o paralelismo economiza. Conexões separadas só enxergam o
+    que já foi commitado: com AGENDA_CONSULTAS_PARALELAS = False tudo roda em
+    sequência na conexão da request (ex.: nos testes, dentro de uma transação).
+    """
+    if not getattr(settings, "AGENDA_CONSULTAS_PARALELAS", True):
+        return [await sync_to_async(f)() for f in funcoes]
 
-        # Monta grade [dia][hora_int] -> lista de eventos
-        horas = [time(h, 0) for h in range(8, 21)]  # 08:00..20:00
-        grade = {key: {h: [] for h in horas} for key, _ in TIPOS_DIA_SEMANA}
-        for ev in semana_qs:
-            dia_key = WEEKDAY_TO_KEY[ev.data_evento.weekday()]
-            hcell = time(ev.hora_inicio.hour, 0) if ev.hora_inicio else horas[0]
-            grade[dia_key][hcell].append(ev)
+    def com_conexao_propria(f):
+        def rodar():
+            try:
+                return f()
+            finally:
+                close_old_connections()
+        return rodar
 
-        # Métricas do mês corrente (com base no ref_date)
-        m_ini = date(ref_date.year, ref_date.month, 1)
-        m_fim = _last_day_of_month(ref_date.year, ref_date.month)
-        mes_qs = (Evento.objects
-                  .select_related("profissional", "clinica")
-                  .filter(crianca=crianca, data_evento__range=(m_ini, m_fim)))
+    return await asyncio.gather(*(sync_to_async(com_conexao_propria(f), thread_sensitive=False)()
+                                  for f in funcoes))
 
-        # Indicadores
-        hoje = date.today()
-        total_agendados = mes_qs.count()
-        total_comparecimentos = mes_qs.filter(presenca_confirmada=True).count()
-        total_faltas = mes_qs.filter(presenca_confirmada=False, data_evento__lt=hoje).count()
-        total_pendentes = mes_qs.filter(presenca_confirmada=False, data_evento__gte=hoje).count()
 
-        # Carga horária por clínica e por especialidade (somando durações)
-        por_clinica = defaultdict(timedelta)
-        por_especialidade = defaultdict(timedelta)
+class AgendaIndexAsyncView(AgendaMixin, View):
+    """
+    A mesma página de AgendaIndexView como view assíncrona, para servir por
+    ASGI (ex.: uvicorn therapytrack.asgi:application). As leituras pequenas
+    (crianças, versão da agenda) usam o ORM assíncrono; os três fragmentos
+    (semana, indicadores do mês, lateral com carga e próximos) são montados
+    ao mesmo tempo, e o tempo da página fica perto do mais lento deles em vez
+    da soma. Ver manage.py bench_agenda_async.
+    """
+    template_name = "index.html"
 
-        for ev in mes_qs:
-            dur = _duration(ev)
-            clin_key = ev.clinica.nome if ev.clinica else "—"
-            por_clinica[clin_key] += dur
-
-            tipo_code = getattr(ev.profissional, "tipo", None) if ev.profissional else None
-            tipo_label = PROF_TIPO_LABEL.get(tipo_code, "—")
-            por_especialidade[tipo_label] += dur
-
-        grid_rows = []
-        for h in horas:
-            row = {"hora": h, "cells": []}
-            for key, label in TIPOS_DIA_SEMANA:
-                row["cells"].append({
-                    "dia_key": key,
-                    "events": grade[key][h],  # já é uma lista
-                })
-            grid_rows.append(row)
+    async def get(self, request):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
 
-        # Ordena por maior carga
-        por_clinica_list = sorted(
-            [{"clinica": k, "duracao": _fmt_td(v), "seconds": int(v.total_seconds())} for k, v in por_clinica.items()],
-            key=lambda x: -x["seconds"]
-        )
-        por_especialidade_list = sorted(
-            [{"especialidade": k, "duracao": _fmt_td(v), "seconds": int(v.total_seconds())} for k, v in por_especialidade.items()],
-            key=lambda x: -x["seconds"]
+        # Crianças do responsável (default = primeira)
+        criancas = [c async for c in Crianca.objects.filter(responsavel=user).order_by("nome")]
+        crianca_id = request.GET.get("crianca")
+        if crianca_id:
+            crianca = next((c for c in criancas if str(c.pk) == crianca_id), None)
+            if crianca is None:
+                raise Http404
+        else:
+            crianca = criancas[0] if criancas else None
+
+        ctx = {"view": self, "criancas": criancas, "crianca": crianca}
+        if not crianca:
+            ctx["sem_crianca"] = True
+            return await sync_to_async(render)(request, self.template_name, ctx)
+
+        ref_date = self._ref_date()
+        hoje = date.today()
+        versao = await sync_to_async(versao_agenda)(crianca.pk)
+        ctx["ics_url"] = request.build_absolute_uri(reverse(
+            "terapias:agenda-ics", args=[ical.token_assinatura(user.pk, crianca_id=crianca.pk)]))
+        ctx.update(self._datas_semana(ref_date))
+        ctx.update(self._datas_mes(ref_date))
+        ctx["grade_html"], ctx["indicadores_html"], ctx["lateral_html"] = await _em_paralelo(
+            lambda: self._grade_html(crianca, ctx["semana_ini"], versao),
+            lambda: self._indicadores_html(crianca, ref_date, hoje, versao),
+            lambda: self._lateral_html(crianca, ref_date, hoje, versao),
         )
+        # o template lê request.user (context processor): renderiza fora do event loop
+        return await sync_to_async(render)(request, self.template_name, ctx)
 
-        # Próximas consultas (próximos 7 a 10 itens)
-        proximos = (Evento.objects
-                    .select_related("profissional", "clinica")
-                    .filter(crianca=crianca, data_evento__gte=hoje)
-                    .order_by("data_evento", "hora_inicio")[:10])
 
-        ctx.update({
-            "ref_date": ref_date,
-            "semana_ini": semana_ini,
-            "semana_fim": semana_fim,
-            "horas": horas,
-            "dias": list(TIPOS_DIA_SEMANA),  # [('segunda','Segunda-feira'), ...]
-            "grade": grade,
-            "grid_rows": grid_rows,
+class AgendaSemanaView(LoginRequiredMixin, AgendaMixin, View):
+    """
+    Navegação semanal via HTMX: devolve só a grade da semana (e a navegação,
+    out-of-band). Cards e lateral só vão junto quando o mês mudou (?m=YYYY-MM
+    é o mês que a página está mostrando).
+    """
 
-            "m_ini": m_ini,
-            "m_fim": m_fim,
-            "total_agendados": total_agendados,
-            "total_comparecimentos": total_comparecimentos,
-            "total_faltas": total_faltas,
-            "total_pendentes": total_pendentes,
+    def get(self, request):
+        crianca_id = request.GET.get("crianca", "")
+        if not crianca_id.isdigit():
+            return HttpResponseBadRequest("crianca inválida")
+        crianca = get_object_or_404(Crianca, pk=crianca_id, responsavel=request.user)
+        ref_date = self._ref_date()
+        versao = versao_agenda(crianca.pk)
 
-            "por_clinica": por_clinica_list,
-            "por_especialidade": por_especialidade_list,
-            "proximos": proximos,
-        })
-        return ctx
+        ctx = {"crianca": crianca, **self._contexto_semana(crianca, ref_date, versao)}
+        ctx["mes_mudou"] = request.GET.get("m") != f"{ref_date:%Y-%m}"
+        if ctx["mes_mudou"]:
+            ctx.update(self._contexto_mes(crianca, ref_date, versao))
+        return render(request, "terapias/partials/agenda_semana.html", ctx)
+
+
+class AgendaFeedView(LoginRequiredMixin, View):
+    """
+    Agenda da criança em JSON (?de=YYYY-MM-DD&ate=YYYY-MM-DD; padrão: hoje + 30 dias).
+
+    ETag/Last-Modified vêm da VersaoAgenda: quem faz polling com
+    If-None-Match / If-Modified-Since recebe 304 sem nenhuma linha lida.
+    """
+
+    def get(self, request, crianca_id):
+        crianca = get_object_or_404(Crianca, pk=crianca_id, responsavel=request.user)
+        try:
+            de = date.fromisoformat(request.GET["de"]) if request.GET.get("de") else date.today()
+            ate = date.fromisoformat(request.GET["ate"]) if request.GET.get("ate") else de + timedelta(days=30)
+        except ValueError:
+            return HttpResponseBadRequest("datas inválidas (use YYYY-MM-DD)")
+        if ate < de or (ate - de).days > MAX_DIAS:
+            return HttpResponseBadRequest(f"intervalo inválido (de <= ate, até {MAX_DIAS} dias)")
+
+        versao, atualizado_em = marcador_agenda(crianca.pk)
+        etag = f'"{crianca.pk}-{versao}-{de:%Y%m%d}-{ate:%Y%m%d}"'
+        last_modified = int(atualizado_em.timestamp()) if atualizado_em else None
+        nao_mudou = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if nao_mudou is not None:
+            return nao_mudou
+
+        partes = feed_json(crianca, de, ate, versao)
+        if (ate - de).days > DIAS_STREAMING:
+            response = StreamingHttpResponse(partes, content_type="application/json")
+        else:
+            response = HttpResponse("".join(partes), content_type="application/json")
+        response["ETag"] = etag
+        if last_modified:
+            response["Last-Modified"] = http_date(last_modified)
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+
+class AgendaIcsView(View):
+    """
+    Assinatura .ics (por criança ou por profissional). Sem login: o escopo
+    vem de um token assinado na URL (ver terapias.ical.token_assinatura).
+    """
+
+    def get(self, request, token):
+        try:
+            escopo = ical.ler_token(token)
+        except signing.BadSignature:
+            raise Http404
+        if "c" in escopo:
+            crianca = get_object_or_404(Crianca, pk=escopo["c"], responsavel_id=escopo["u"])
+            nome = f"Agenda de {crianca.nome}"
+        else:
+            nome = f"Agenda — {get_object_or_404(Profissional, pk=escopo['p']).nome}"
+
+        etag, last_modified = ical.marcador(ical.versoes_do_escopo(escopo))
+        nao_mudou = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if nao_mudou is not None:
+            return nao_mudou
+
+        response = StreamingHttpResponse(ical.calendario(escopo, nome), content_type="text/calendar; charset=utf-8")
+        response["Content-Disposition"] = 'inline; filename="agenda.ics"'
+        response["ETag"] = etag
+        if last_modified:
+            response["Last-Modified"] = http_date(last_modified)
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+
+class AgendaCacheView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """Acertos/faltas do cache de fragmentos da agenda (só staff). POST zera os contadores."""
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request):
+        return JsonResponse(estatisticas())
+
+    def post(self, request):
+        zerar_estatisticas()
+        return JsonResponse(estatisticas())
@@ -0,0 +1,179 @@
+# therapytrack/instrumentacao.py
+"""
+Instrumentação por request: quanto do tempo foi SQL, template e Python.
+
+InstrumentacaoMiddleware mede, numa fração das requests
+(INSTRUMENTACAO_AMOSTRAGEM, de 0 a 1):
+
+- sql: número de queries e tempo nelas (execute_wrapper em cada conexão);
+- tpl: tempo renderizando templates, sem o SQL disparado durante a
+  renderização (querysets preguiçosos) e contando só o template externo
+  quando há includes;
+- view: da chamada da view até ela devolver a resposta (inclui o SQL e os
+  templates renderizados lá dentro, ex.: fragmentos com render_to_string);
+- app: o resto, Python puro = total - sql - tpl;
+- total: a request inteira, do ponto do middleware para dentro.
+
+Sai no header Server-Timing (aparece na aba de rede do navegador) e numa
+linha JSON no logger "therapytrack.desempenho". Com
+INSTRUMENTACAO_CONSULTAS_LENTAS = N > 0, a linha traz também as N queries
+mais lentas com a linha do código do projeto que as disparou (capturar a
+pilha custa, então o padrão é 0).
+
+Deve ser o primeiro de MIDDLEWARE, para que "total" cubra os demais.
+"""
+import heapq
+import json
+import logging
+import random
+import time as _time
+import traceback
+from contextlib import ExitStack
+from contextvars import ContextVar
+from typing import Optional
+
+from django.conf import settings
+from django.db import connections
+from django.template import base as template_base
+
+logger = logging.getLogger("therapytrack.desempenho")
+
+_medicao: ContextVar[Optional["Medicao"]] = ContextVar("medicao", default=None)
+_render_original = template_base.Template.render
+
+
+class Medicao:
+    """Acumuladores de uma request."""
+
+    def __init__(self, n_lentas: int):
+        self.consultas = 0
+        self.sql = 0.0
+        self.sql_em_template = 0.0
+        self.template = 0.0
+        self.profundidade_template = 0
+        self.n_lentas = n_lentas
+        self.lentas = []  # heap de (segundos, ordem, sql, origem)
+        self.inicio_view = None
+        self.fim_view = None
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = _time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            dt = _time.perf_counter() - t0
+            self.consultas += 1
+            self.sql += dt
+            if self.profundidade_template:
+                self.sql_em_template += dt
+            if self.n_lentas:
+                item = (dt, self.consultas, sql, _origem())
+                if len(self.lentas) < self.n_lentas:
+                    heapq.heappush(self.lentas, item)
+                elif dt > self.lentas[0][0]:
+                    heapq.heapreplace(self.lentas, item)
+
+
+def _origem() -> str:
+    """Primeiro quadro da pilha que é código do projeto (fora deste módulo e das dependências)."""
+    base = str(settings.BASE_DIR)
+    for quadro in reversed(traceback.extract_stack()[:-2]):
+        arquivo = quadro.filename
+        if arquivo.startswith(base) and "site-packages" not in arquivo and arquivo != __file__:
+            return f"{arquivo[len(base) + 1:]}:{quadro.lineno} em {quadro.name}"
+    return "?"
+
+
+def _render_medido(self, context):
+    m = _medicao.get()
+    if m is None:
+        return _render_original(self, context)
+    m.profundidade_template += 1
+    t0 = _time.perf_counter()
+    try:
+        return _render_original(self, context)
+    finally:
+        m.profundidade_template -= 1
+        if not m.profundidade_template:  # só o template de fora: os includes já estão dentro dele
+            m.template += _time.perf_counter() - t0
+
+
+class InstrumentacaoMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        template_base.Template.render = _render_medido
+
+    def __call__(self, request):
+        taxa = getattr(settings, "INSTRUMENTACAO_AMOSTRAGEM", 0)
+        if not taxa or random.random() >= taxa:
+            return self.get_response(request)
+
+        m = Medicao(getattr(settings, "INSTRUMENTACAO_CONSULTAS_LENTAS", 0))
+        token = _medicao.set(m)
+        t0 = _time.perf_counter()
+        try:
+            with ExitStack() as pilha:
+                for conexao in connections.all():
+                    pilha.enter_context(conexao.execute_wrapper(m))
+                response = self.get_response(request)
+        finally:
+            _medicao.reset(token)
+        total = _time.perf_counter() - t0
+
+        tempos = self._tempos(m, total)
+        response["Server-Timing"] = ", ".join([
+            f'sql;dur={tempos["sql_ms"]};desc="{m.consultas} queries"',
+            f'tpl;dur={tempos["tpl_ms"]}',
+            f'view;dur={tempos["view_ms"]}',
+            f'app;dur={tempos["app_ms"]}',
+            f'total;dur={tempos["total_ms"]}',
+        ])
+        self._registrar(request, response, m, tempos)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        m = _medicao.get()
+        if m is not None:
+            m.inicio_view = _time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # TemplateResponse: a view já terminou, mas o template só renderiza depois daqui
+        m = _medicao.get()
+        if m is not None:
+            m.fim_view = _time.perf_counter()
+        return response
+
+    @staticmethod
+    def _tempos(m: Medicao, total: float) -> dict:
+        fim_view = m.fim_view or _time.perf_counter()
+        view = fim_view - m.inicio_view if m.inicio_view else 0.0
+        template = max(m.template - m.sql_em_template, 0.0)
+
+        def ms(segundos):
+            return round(segundos * 1000, 2)
+
+        return {
+            "total_ms": ms(total),
+            "view_ms": ms(view),
+            "sql_ms": ms(m.sql),
+            "tpl_ms": ms(template),
+            "app_ms": ms(max(total - m.sql - template, 0.0)),
+        }
+
+    @staticmethod
+    def _registrar(request, response, m: Medicao, tempos: dict):
+        rota = getattr(request.resolver_match, "view_name", None)
+        linha = {
+            "metodo": request.method,
+            "caminho": request.path,
+            "rota": rota,
+            "status": response.status_code,
+            "consultas": m.consultas,
+            **tempos,
+        }
+        if m.lentas:
+            linha["lentas"] = [
+                {"ms": round(dt * 1000, 2), "sql": sql[:500], "origem": origem}
+                for dt, _, sql, origem in sorted(m.lentas, reverse=True)
+            ]
+        logger.info(json.dumps(linha, ensure_ascii=False, default=str))
@@ -47,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'therapytrack.instrumentacao.InstrumentacaoMiddleware',
+    'therapytrack.telemetria.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -90,10 +92,67 @@ DATABASES = {
         'HOST': tmpPostgres.hostname,
         'PORT': 5432,
         'OPTIONS': dict(parse_qsl(tmpPostgres.query)),
+        # > 0 mantém as conexões abertas entre requests (uma por thread); a
+        # agenda assíncrona usa várias threads por request, então vale ligar
+        'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", 0)),
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Padrão em memória do processo; com CACHE_DIR definido, usa arquivos
+# (compartilhado entre os workers da mesma máquina).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv("CACHE_DIR"),
+    } if os.getenv("CACHE_DIR") else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Fragmentos da agenda (terapias.cache_agenda)
+AGENDA_CACHE = 'default'
+AGENDA_CACHE_TIMEOUT = int(os.getenv("AGENDA_CACHE_TIMEOUT", 60 * 60))
+# Agenda assíncrona (terapias.views.AgendaIndexAsyncView): fragmentos montados
+# em paralelo, cada um com a sua conexão
+AGENDA_CONSULTAS_PARALELAS = os.getenv("AGENDA_CONSULTAS_PARALELAS", "1") == "1"
+
+# Fila de geração de eventos (terapias.tarefas), processada por
+# "manage.py processar_tarefas". Com TAREFAS_SINCRONAS=1 a tarefa roda já na
+# request que a enfileirou (desenvolvimento sem worker).
+TAREFAS_SINCRONAS = os.getenv("TAREFAS_SINCRONAS", "0") == "1"
+
+# Instrumentação por request (therapytrack.instrumentacao): fração das
+# requests medidas (0 desliga) e quantas queries mais lentas logar com a
+# origem no código (0 não captura pilha).
+INSTRUMENTACAO_AMOSTRAGEM = float(os.getenv("INSTRUMENTACAO_AMOSTRAGEM", 0))
+INSTRUMENTACAO_CONSULTAS_LENTAS = int(os.getenv("INSTRUMENTACAO_CONSULTAS_LENTAS", 0))
+
+# Métricas em /metrics (therapytrack.telemetria). Com vários workers, aponte
+# METRICAS_DIR para um diretório compartilhado por eles, limpo a cada deploy.
+METRICAS_DIR = os.getenv("METRICAS_DIR")
+METRICAS_INTERVALO = float(os.getenv("METRICAS_INTERVALO", 5))
+METRICAS_TOKEN = os.getenv("METRICAS_TOKEN")
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'therapytrack.desempenho': {
+            'handlers': ['console'],
+            'level': os.getenv("INSTRUMENTACAO_LOG_LEVEL", "INFO"),
+            'propagate': False,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,255 @@
+# therapytrack/telemetria.py
+"""
+Métricas do processo no formato texto do Prometheus, em /metrics.
+
+- MetricasMiddleware: latência (histograma), respostas por status e
+  número de queries, tudo por nome de URL ("terapias:index",
+  "terapias:novo-item-rotina", ...). Requests que não resolvem viram
+  view="desconhecida", para não abrir uma série por caminho.
+- medir_servico: decorador dos serviços de rotina (terapias.services):
+  duração, erros e eventos criados/apagados.
+- metricas: a view de /metrics. Com METRICAS_TOKEN definido, exige
+  "Authorization: Bearer <token>".
+
+Vários processos (workers do gunicorn): com METRICAS_DIR definido, cada
+processo grava o seu estado em METRICAS_DIR/<pid>.json no máximo a cada
+METRICAS_INTERVALO segundos (e na saída), e /metrics soma os arquivos de
+todos. Os arquivos de processos que já morreram continuam contando, então
+os contadores são o total desde que o diretório foi criado: limpe-o a cada
+deploy, antes de subir os workers.
+"""
+import atexit
+import functools
+import json
+import os
+import threading
+import time as _time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Callable, Dict, Tuple
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# nome -> (tipo, ajuda)
+METRICAS = {
+    "therapytrack_http_request_duration_seconds": ("histogram", "Latência das requests por nome de URL."),
+    "therapytrack_http_responses_total": ("counter", "Respostas por nome de URL e status."),
+    "therapytrack_db_queries_total": ("counter", "Queries ao banco por nome de URL."),
+    "therapytrack_service_duration_seconds": ("histogram", "Duração dos serviços de rotina."),
+    "therapytrack_service_errors_total": ("counter", "Serviços de rotina que terminaram com exceção."),
+    "therapytrack_service_events_total": ("counter", "Eventos criados/apagados pelos serviços de rotina."),
+}
+
+Chave = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _chave(nome: str, labels: dict) -> Chave:
+    return nome, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Registro:
+    """Contadores e histogramas de um processo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.contadores: Dict[Chave, float] = defaultdict(float)
+        self.histogramas: Dict[Chave, list] = {}  # [n por bucket (o último é +Inf)..., soma]
+        self._gravado_em = 0.0
+
+    def incrementar(self, nome: str, valor: float = 1, **labels):
+        with self._lock:
+            self.contadores[_chave(nome, labels)] += valor
+        self._talvez_gravar()
+
+    def observar(self, nome: str, valor: float, **labels):
+        chave = _chave(nome, labels)
+        with self._lock:
+            h = self.histogramas.get(chave)
+            if h is None:
+                h = self.histogramas[chave] = [0] * (len(BUCKETS_SEGUNDOS) + 1) + [0.0]
+            h[bisect_left(BUCKETS_SEGUNDOS, valor)] += 1
+            h[-1] += valor
+        self._talvez_gravar()
+
+    def valor(self, nome: str, **labels) -> float:
+        """Valor de um contador, ou número de observações de um histograma."""
+        chave = _chave(nome, labels)
+        if chave in self.histogramas:
+            return sum(self.histogramas[chave][:-1])
+        return self.contadores.get(chave, 0)
+
+    # ---- estado serializável / vários processos ----
+
+    def estado(self) -> dict:
+        with self._lock:
+            return {
+                "contadores": [[n, list(map(list, l)), v] for (n, l), v in self.contadores.items()],
+                "histogramas": [[n, list(map(list, l)), list(h)] for (n, l), h in self.histogramas.items()],
+            }
+
+    def somar(self, estado: dict):
+        with self._lock:
+            for nome, labels, v in estado["contadores"]:
+                self.contadores[nome, tuple(map(tuple, labels))] += v
+            for nome, labels, h in estado["histogramas"]:
+                atual = self.histogramas.setdefault((nome, tuple(map(tuple, labels))), [0] * len(h))
+                for i, x in enumerate(h):
+                    atual[i] += x
+
+    def gravar(self, caminho: str):
+        tmp = f"{caminho}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.estado(), f)
+        os.replace(tmp, caminho)  # quem lê nunca vê o arquivo pela metade
+        self._gravado_em = _time.monotonic()
+
+    def _talvez_gravar(self):
+        diretorio = getattr(settings, "METRICAS_DIR", None)
+        if diretorio and _time.monotonic() - self._gravado_em >= getattr(settings, "METRICAS_INTERVALO", 5):
+            self.gravar(_arquivo_do_processo(diretorio))
+
+
+registro = Registro()
+
+
+def _arquivo_do_processo(diretorio: str) -> str:
+    return os.path.join(diretorio, f"{os.getpid()}.json")
+
+
+@atexit.register
+def _gravar_na_saida():
+    diretorio = getattr(settings, "METRICAS_DIR", None) if settings.configured else None
+    if diretorio and (registro.contadores or registro.histogramas):
+        registro.gravar(_arquivo_do_processo(diretorio))
+
+
+def agregado() -> Registro:
+    """Este processo somado aos demais que gravam em METRICAS_DIR."""
+    diretorio = getattr(settings, "METRICAS_DIR", None)
+    if not diretorio:
+        return registro
+    registro.gravar(_arquivo_do_processo(diretorio))
+    total = Registro()
+    for nome in os.listdir(diretorio):
+        if not nome.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(diretorio, nome)) as f:
+                total.somar(json.load(f))
+        except (OSError, ValueError):
+            continue  # sumiu ou foi truncado entre o listdir e o open
+    return total
+
+
+# ---- formato texto ----
+
+def _escapar(v: str) -> str:
+    return v.replace("\\", r"\\").replace('"', r'\"').replace("\n", r"\n")
+
+
+def _labels(labels, extra=()) -> str:
+    pares = [*labels, *extra]
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in pares) + "}"
+
+
+def _numero(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def texto(r: Registro) -> str:
+    series = defaultdict(list)
+    for (nome, labels), v in sorted(r.contadores.items()):
+        series[nome].append(f"{nome}{_labels(labels)} {_numero(v)}")
+    for (nome, labels), h in sorted(r.histogramas.items()):
+        acumulado = 0
+        for limite, n in zip([*BUCKETS_SEGUNDOS, "+Inf"], h[:-1]):
+            acumulado += n
+            le = limite if isinstance(limite, str) else _numero(limite)
+            series[nome].append(f"{nome}_bucket{_labels(labels, [('le', le)])} {acumulado}")
+        series[nome].append(f"{nome}_sum{_labels(labels)} {_numero(h[-1])}")
+        series[nome].append(f"{nome}_count{_labels(labels)} {acumulado}")
+
+    linhas = []
+    for nome, amostras in series.items():
+        tipo, ajuda = METRICAS.get(nome, ("untyped", ""))
+        linhas += [f"# HELP {nome} {ajuda}", f"# TYPE {nome} {tipo}", *amostras]
+    return "\n".join(linhas) + "\n"
+
+
+def metricas(request):
+    token = getattr(settings, "METRICAS_TOKEN", None)
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponse(status=401)
+    return HttpResponse(texto(agregado()), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# ---- coleta ----
+
+class _Contador:
+    def __init__(self):
+        self.consultas = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.consultas += 1
+        return execute(sql, params, many, context)
+
+
+class MetricasMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        contador = _Contador()
+        t0 = _time.perf_counter()
+        status = 500
+        try:
+            with connections["default"].execute_wrapper(contador):
+                response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            view = getattr(request.resolver_match, "view_name", None) or "desconhecida"
+            registro.observar("therapytrack_http_request_duration_seconds", _time.perf_counter() - t0,
+                              view=view, method=request.method)
+            registro.incrementar("therapytrack_http_responses_total", view=view, status=status)
+            registro.incrementar("therapytrack_db_queries_total", contador.consultas, view=view)
+
+
+def _criados_e_apagados(res) -> Tuple[int, int]:
+    return res.get("criadas", 0), res.get("deletados", 0)
+
+
+def medir_servico(nome: str, contar: Callable[[object], Tuple[int, int]] = _criados_e_apagados):
+    """
+    Mede duração e erros do serviço; `contar(resultado)` devolve
+    (eventos criados, eventos apagados). Por padrão lê as chaves "criadas"
+    e "deletados" do dict que os serviços de rotina devolvem.
+    """
+    def decorador(func):
+        @functools.wraps(func)
+        def medido(*args, **kwargs):
+            t0 = _time.perf_counter()
+            try:
+                res = func(*args, **kwargs)
+            except Exception:
+                registro.incrementar("therapytrack_service_errors_total", service=nome)
+                raise
+            finally:
+                registro.observar("therapytrack_service_duration_seconds", _time.perf_counter() - t0,
+                                  service=nome)
+            criados, apagados = contar(res)
+            if criados:
+                registro.incrementar("therapytrack_service_events_total", criados, service=nome,
+                                     operation="created")
+            if apagados:
+                registro.incrementar("therapytrack_service_events_total", apagados, service=nome,
+                                     operation="deleted")
+            return res
+        return medido
+    return decorador
@@ -17,8 +17,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from therapytrack.telemetria import metricas
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metricas, name='metricas'),
     path('', include('terapias.urls')),
     path('usuarios/', include('usuario.urls')),
 ]
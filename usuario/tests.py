@@ -1,3 +1,37 @@
+from datetime import date
+
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from terapias.tests import OrcamentoConsultasMixin
+
+from .models import Crianca
+
+
+class OrcamentoConsultasCriancasTests(OrcamentoConsultasMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="resp")
+        self.crianca = Crianca.objects.create(nome="A", condicao="-", data_nascimento=date(2020, 1, 1),
+                                              responsavel=self.user)
+        self.client.force_login(self.user)
+
+    def semear(self, n):
+        existentes = Crianca.objects.filter(responsavel=self.user).count()
+        Crianca.objects.bulk_create([
+            Crianca(nome=f"C{i}", condicao="-", data_nascimento=date(2020, 1, 1), responsavel=self.user)
+            for i in range(existentes, n + 1)
+        ])
+
+    def endpoints(self):
+        get, pk = self.client.get, self.crianca.pk
+        return {
+            "lista-criancas": lambda: get("/usuarios/criancas/"),
+            "lista-criancas[busca]": lambda: get("/usuarios/criancas/?q=C"),
+            "crianca-criar": lambda: get("/usuarios/criancas/nova/"),
+            "detalhes-crianca": lambda: get(f"/usuarios/criancas/{pk}/"),
+            "editar-crianca": lambda: get(f"/usuarios/criancas/{pk}/editar/"),
+            "deletar-crianca": lambda: get(f"/usuarios/criancas/{pk}/deletar/"),
+        }
+
+    def test_queries_nao_crescem_com_os_dados(self):
+        self.assertConsultasConstantes()